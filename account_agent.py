@@ -5,6 +5,8 @@ sys.path.insert(0, os.path.dirname(__file__))
 from core.continuation_agent import ContinuationAgent
 from core.agent import Agent
 from core.tool import tool
+from core.approval_policy import ApprovalPolicy, Rule
+import threading
 import json
 
 ACCOUNT_AGENT_SYSTEM_PROMPT = """
@@ -41,7 +43,40 @@ def authorize_account(username: str, security_level: int):
     """Authorize a user account by taking a username and a security level."""
     return f"Account {username} authorized with security level {security_level}."
 
-account_agent = ContinuationAgent(instruction=ACCOUNT_AGENT_SYSTEM_PROMPT, tools=[create_account, authorize_account])
+# Routine authorizations that do not need a human, the default `approval_policies` of the account agent
+ACCOUNT_APPROVAL_POLICIES = [
+    ApprovalPolicy("authorize_account", rules=[
+        Rule("approve", when={"security_level": 0}, reason="default security level"),
+    ], deny={"username": ["root", "admin"]}),
+]
+
+def create_account_agent(**options) -> ContinuationAgent:
+    """
+    Build an account agent. The model client is only created by its first request.
+
+    Authorizations at the default security level are approved by `ACCOUNT_APPROVAL_POLICIES`, pass
+    `approval_policies=[]` to ask for every one of them.
+
+    Args:
+        **options: Keyword arguments of `ContinuationAgent`, such as `backend`
+    """
+    options.setdefault("approval_policies", ACCOUNT_APPROVAL_POLICIES)
+    return ContinuationAgent(instruction=ACCOUNT_AGENT_SYSTEM_PROMPT, tools=[create_account, authorize_account], **options)
+
+_account_agent = None
+_account_agent_lock = threading.Lock()
+
+def get_account_agent() -> ContinuationAgent:
+    """
+    The account agent shared by the callers of this module, built on first use.
+    """
+    global _account_agent
+    if _account_agent is None:
+        # Concurrent first calls, such as parallel HR requests, must share one agent
+        with _account_agent_lock:
+            if _account_agent is None:
+                _account_agent = create_account_agent()
+    return _account_agent
 
 def regular_agent():
     account_agent = Agent(instruction=ACCOUNT_AGENT_SYSTEM_PROMPT, tools=[create_account, authorize_account])
@@ -51,7 +86,7 @@ def regular_agent():
 
 
 def continuation_agent():
-    account_agent = ContinuationAgent(instruction=ACCOUNT_AGENT_SYSTEM_PROMPT, tools=[create_account, authorize_account])
+    account_agent = create_account_agent()
 
     response1 = account_agent.request({"prompt": "Help me open an account for our new colleague with username: tfan."})
     print(f"Response:{json.dumps(response1, indent=4)}")
@@ -0,0 +1,129 @@
+"""
+Benchmark suite of the framework's own overhead, on top of the local `FakeBackend`.
+
+Uses the topologies of the sample agents:
+* account: a plain `Agent` with the tools of `account_agent.py`, three model turns to completion.
+* hr: a `ContinuationAgent` with the tools of `hr_agent_cli.py`, calling the `account_agent` sub-agent,
+  which suspends on `authorize_account` approval and is then resumed to completion.
+
+Reports turns/sec, per-turn framework overhead (wall time minus the simulated model latency),
+continuation suspend/resume cost and size, and memory. With `--concurrency` above 1 the overhead
+also includes the time conversations spend waiting for each other.
+
+Usage:
+    python benchmarks/bench_agents.py [--iterations 500] [--latency 0] [--concurrency 1]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from typing import List, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+from core.agent import Agent
+from core.continuation_agent import ContinuationAgent
+from core.model_backend import FakeBackend, set_default_backend
+from account_agent import ACCOUNT_AGENT_SYSTEM_PROMPT, create_account, authorize_account
+from hr_agent_cli import HR_AGENT_SYSTEM_PROMPT, send_email_tool, account_agent_tool
+import argparse
+import json
+import time
+import tracemalloc
+
+def topology_script(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]):
+    """Replies of the model for both sample agents, following their system prompts."""
+    tool_names = {tool["function"]["name"] for tool in tools}
+    tool_results = sum(1 for message in messages if message["role"] == "tool")
+    if "account_agent_tool" in tool_names:
+        if tool_results == 0:
+            return [
+                FakeBackend.tool_call("send_email_tool", recipient="tfan@example.com", subject="Welcome!", message="Welcome to the team, tfan!"),
+                FakeBackend.tool_call("account_agent_tool", prompt="Help me open an account for our new colleague with username: tfan."),
+            ]
+        return "tfan has been welcomed and their account is ready."
+    if tool_results == 0:
+        return [FakeBackend.tool_call("create_account", username="tfan")]
+    if tool_results == 1:
+        return [FakeBackend.tool_call("authorize_account", username="tfan", security_level=2)]
+    return "Account tfan created and authorized with security level 2."
+
+def approve_all(response: Dict[str, Any]) -> Dict[str, Any]:
+    for item in response["approval_info"]:
+        item["approved"] = True
+    return response
+
+def run_account(agent: Agent) -> None:
+    response = agent.request({"prompt": "Help me open an account for our new colleague with username: tfan."})
+    assert "result" in response
+
+def run_hr(agent: ContinuationAgent) -> None:
+    response = agent.request({"prompt": "Onboard our new colleague tfan, their email is tfan@example.com."})
+    assert response["end_reason"] == "approval_required", response["end_reason"]
+    response = agent.request(approve_all(response))
+    assert response["end_reason"] == "completed", response["end_reason"]
+
+def measure_throughput(name: str, run: Callable[[], None], backend: FakeBackend, iterations: int, concurrency: int):
+    calls_before = backend.calls
+    start = time.perf_counter()
+    if concurrency == 1:
+        for _ in range(iterations):
+            run()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: run(), range(iterations)))
+    elapsed = time.perf_counter() - start
+    turns = backend.calls - calls_before
+    overhead = (elapsed * concurrency - turns * backend.latency) / turns
+    print(f"{name:<10} {iterations / elapsed:>12.1f} {turns / elapsed:>12.1f} {overhead * 1e6:>16.1f}")
+
+def measure_continuations(agent: ContinuationAgent, iterations: int):
+    prompt = {"prompt": "Onboard our new colleague tfan, their email is tfan@example.com."}
+    suspend, resume, sizes = [], [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = agent.request(prompt)
+        suspend.append(time.perf_counter() - start)
+        sizes.append(len(json.dumps(response)))
+        response = approve_all(json.loads(json.dumps(response)))
+        start = time.perf_counter()
+        agent.request(response)
+        resume.append(time.perf_counter() - start)
+    print(f"suspend (to approval_required)  {sorted(suspend)[len(suspend) // 2] * 1e6:>10.1f} us median")
+    print(f"resume (to completed)           {sorted(resume)[len(resume) // 2] * 1e6:>10.1f} us median")
+    print(f"approval response size          {sum(sizes) // len(sizes):>10d} bytes")
+
+def measure_memory(agent: ContinuationAgent, parked: int):
+    prompt = {"prompt": "Onboard our new colleague tfan, their email is tfan@example.com."}
+    tracemalloc.start()
+    agent.request(approve_all(agent.request(prompt)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    responses = [agent.request(prompt) for _ in range(parked)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"peak memory of a suspend/resume {peak / 1024:>10.1f} KiB")
+    print(f"memory per parked continuation  {(current - baseline) / len(responses) / 1024:>10.1f} KiB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent framework overhead benchmark suite.")
+    parser.add_argument("--iterations", type=int, default=500, help="Conversations per measurement.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated model latency in seconds.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Conversations run at the same time for the throughput measurement.")
+    args = parser.parse_args()
+
+    backend = FakeBackend(topology_script, latency=args.latency)
+    # The account_agent sub-agent of hr_agent_cli.py uses the default backend
+    set_default_backend(backend)
+    account = Agent(instruction=ACCOUNT_AGENT_SYSTEM_PROMPT, tools=[create_account, authorize_account])
+    hr = ContinuationAgent(instruction=HR_AGENT_SYSTEM_PROMPT, tools=[send_email_tool, account_agent_tool])
+
+    print(f"latency {args.latency * 1e3:.1f} ms, concurrency {args.concurrency}, {args.iterations} conversations")
+    print(f"{'topology':<10} {'convs/sec':>12} {'turns/sec':>12} {'overhead us/turn':>16}")
+    measure_throughput("account", lambda: run_account(account), backend, args.iterations, args.concurrency)
+    measure_throughput("hr", lambda: run_hr(hr), backend, args.iterations, args.concurrency)
+    print()
+    measure_continuations(hr, args.iterations)
+    measure_memory(hr, args.iterations)
+
+if __name__ == "__main__":
+    main()
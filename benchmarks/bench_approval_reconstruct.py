@@ -0,0 +1,124 @@
+"""
+Benchmark of resuming a ContinuationAgent with many pending approvals across nesting levels.
+
+Times how long `_form_input` takes to apply every `approval_info` decision to the continuation
+tree and categorize the resumed tool calls. The linear-scan reconstruction that preceded the
+indexed one is kept below unchanged as the baseline.
+
+The decisions intentionally differ from the baseline in two ways, and the check below allows exactly these:
+the baseline always approved the tool call named by the last path id, ignoring its decision, and gave the
+sub-agent calls leading to it the decision of the entry applied last. The agent applies the decision to the
+tool call it names, and resumes the sub-agent calls leading to it (approved=True).
+
+Usage:
+    python benchmarks/bench_approval_reconstruct.py [--repeat 3]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_continuation_size import build_response, authorize_account
+from core.continuation_agent import ContinuationAgent
+import argparse
+import copy
+import gc
+import time
+
+# (depth, fanout) pairs, from flat to deeply nested, all with 1k+ approvals
+SHAPES = [(1, 1500), (2, 40), (3, 12), (4, 6), (5, 5)]
+
+def _legacy_nested_helper(index, approval_obj, path_ids, continuation):
+    processed_list = continuation.get("processed", [])
+    if not processed_list:
+        processed_list.append({"id": path_ids[index], "approved": True if index == len(path_ids) - 1 else approval_obj["approved"]})
+    else:
+        for item in processed_list:
+            if item["id"] == path_ids[index]:
+                item["approved"] = True if index == len(path_ids) - 1 else approval_obj["approved"]
+                break
+    continuation["processed"] = processed_list
+    if index == len(path_ids) - 1:
+        return
+    if not continuation.get("resume_request"):
+        raise ValueError("Number of path IDs is greater than nested levels")
+    for req in continuation["resume_request"]:
+        if req["id"] == path_ids[index]:
+            _legacy_nested_helper(index + 1, approval_obj, path_ids, req["continuation"])
+
+def legacy_form_input(input):
+    continuation = input["continuation"]
+    for item in input["approval_info"]:
+        _legacy_nested_helper(0, item, item["path_ids"], continuation)
+    processed_list = continuation["processed"]
+    approved_list = set(item['id'] for item in processed_list if item.get("approved"))
+    approved = [req for req in continuation["resume_request"] if req['id'] in approved_list]
+    rejected_list = set(item['id'] for item in processed_list if not item.get("approved"))
+    rejected = [req for req in continuation["resume_request"] if req['id'] in rejected_list]
+    return approved, rejected
+
+def indexed_form_input(agent, input):
+    tool_statuses = {"_approved_tool_calls": [], "_uncategorized_tool_calls": [], "_unapproved_tool_calls": [], "_rejected_tool_calls": [], "_pending_tool_calls": []}
+    agent._form_input(input, tool_statuses)
+    return tool_statuses["_approved_tool_calls"], tool_statuses["_rejected_tool_calls"]
+
+def _processed_tree(continuation):
+    return [(item["id"], item["approved"]) for item in continuation.get("processed", [])] + [
+        _processed_tree(req["continuation"]) for req in continuation.get("resume_request", []) if req.get("continuation")
+    ]
+
+def _with_intended_differences(tree, decisions):
+    # The baseline tree with the decisions applied to the tool calls they name, and their sub-agent calls resumed
+    return [_with_intended_differences(node, decisions) if isinstance(node, list) else (node[0], decisions.get(node[0], True)) for node in tree]
+
+def check_against_baseline(response, legacy_input, indexed_input):
+    """Check that the agent only differs from the baseline by the intended decision rule."""
+    decisions = {item["path_ids"][-1]: item["approved"] for item in response["approval_info"]}
+    legacy_tree = _processed_tree(legacy_input["continuation"])
+    # The baseline ignored the decisions of the named tool calls
+    assert all(approved for approved in _leaf_values(legacy_tree, decisions))
+    assert _with_intended_differences(legacy_tree, decisions) == _processed_tree(indexed_input["continuation"])
+
+def _leaf_values(tree, decisions):
+    for node in tree:
+        if isinstance(node, list):
+            yield from _leaf_values(node, decisions)
+        elif node[0] in decisions:
+            yield node[1]
+
+def _best_of(repeat, make_input, run):
+    best = float("inf")
+    for _ in range(repeat):
+        input = make_input()
+        # Like timeit, keep the collector of the copied trees out of the measurement
+        gc.disable()
+        start = time.perf_counter()
+        run(input)
+        best = min(best, time.perf_counter() - start)
+        gc.enable()
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Approval reconstruction benchmark.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the best one is reported.")
+    args = parser.parse_args()
+
+    agent = ContinuationAgent(instruction="You are an agent.", tools=[authorize_account])
+
+    print(f"{'depth':>5} {'fanout':>6} {'approvals':>9} {'linear (ms)':>12} {'indexed (ms)':>13} {'speedup':>8}")
+    for depth, fanout in SHAPES:
+        response = build_response(agent, depth, fanout)
+        for i, item in enumerate(response["approval_info"]):
+            item["approved"] = i % 3 != 0
+        make_input = lambda: copy.deepcopy(response)
+
+        legacy_input, indexed_input = make_input(), make_input()
+        legacy_form_input(legacy_input)
+        indexed_form_input(agent, indexed_input)
+        check_against_baseline(response, legacy_input, indexed_input)
+
+        linear = _best_of(args.repeat, make_input, legacy_form_input)
+        indexed = _best_of(args.repeat, make_input, lambda input: indexed_form_input(agent, input))
+        print(f"{depth:>5} {fanout:>6} {len(response['approval_info']):>9} {linear * 1e3:>12.2f} {indexed * 1e3:>13.2f} {linear / indexed:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
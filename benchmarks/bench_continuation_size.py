@@ -0,0 +1,82 @@
+"""
+Size benchmark of the approval response of a ContinuationAgent across nesting depth and fan-out.
+
+A continuation tree is built bottom-up: every level is an agent whose model requested `fanout`
+parallel tool calls, which are sub-agent calls suspended on their own approvals, down to `depth`
+levels where the tool calls need approval. The serialized size of the response is reported for the
+full and the compact continuation formats, next to the size of the conversations alone.
+
+Usage:
+    python benchmarks/bench_continuation_size.py [--max-depth 4] [--max-fanout 4]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core.continuation_agent import ContinuationAgent
+from core.tool import tool
+from core.messages import compact_message
+import argparse
+import itertools
+import json
+
+_ids = itertools.count()
+
+@tool(need_approval=True)
+def authorize_account(username: str, security_level: int):
+    """Authorize a user account by taking a username and a security level."""
+    return f"Account {username} authorized with security level {security_level}."
+
+def _tool_call(name: str, arguments: dict) -> dict:
+    # Same shape as ChatCompletionMessageToolCall.model_dump()
+    return {"id": f"call_{next(_ids):024d}", "function": {"arguments": json.dumps(arguments), "name": name}, "type": "function"}
+
+def _assistant_message(tool_calls: list) -> dict:
+    # ChatCompletionMessage.model_dump() as kept by the agents, without its null fields
+    return compact_message({"content": None, "refusal": None, "role": "assistant", "annotations": None, "audio": None, "function_call": None, "tool_calls": tool_calls})
+
+def build_response(agent: ContinuationAgent, depth: int, fanout: int) -> dict:
+    """Build the approval response of an agent whose sub-agents are nested `depth` levels deep."""
+    if depth == 1:
+        tool_calls = [_tool_call("authorize_account", {"username": f"user{i}", "security_level": i}) for i in range(fanout)]
+    else:
+        tool_calls = [_tool_call("account_agent_tool", {"prompt": f"Help me open an account for user{i}."}) for i in range(fanout)]
+    messages = [
+        {"role": "developer", "content": agent.instruction},
+        {"role": "user", "content": "Onboard our new colleagues."},
+        _assistant_message([dict(tc, function=dict(tc["function"])) for tc in tool_calls]),
+    ]
+    if depth > 1:
+        for tool_call in tool_calls:
+            tool_call["continuation"] = build_response(agent, depth - 1, fanout)["continuation"]
+    tool_statuses = {"_approved_tool_calls": [], "_uncategorized_tool_calls": [], "_unapproved_tool_calls": tool_calls, "_rejected_tool_calls": [], "_pending_tool_calls": []}
+    return agent._create_response(messages, tool_statuses, [])
+
+def _conversation_size(continuation: dict) -> int:
+    size = len(json.dumps(continuation["messages"]))
+    for req in continuation.get("resume_request", []):
+        if req.get("continuation"):
+            size += _conversation_size(req["continuation"])
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuation size benchmark.")
+    parser.add_argument("--max-depth", type=int, default=4, help="Deepest sub-agent nesting level.")
+    parser.add_argument("--max-fanout", type=int, default=4, help="Largest number of parallel tool calls per level.")
+    args = parser.parse_args()
+
+    full_agent = ContinuationAgent(instruction="You are an agent.", tools=[authorize_account])
+    compact_agent = ContinuationAgent(instruction="You are an agent.", tools=[authorize_account], compact_continuations=True)
+
+    print(f"{'depth':>5} {'fanout':>6} {'approvals':>9} {'conversation':>12} {'full':>10} {'compact':>10} {'ratio':>6}")
+    for depth in range(1, args.max_depth + 1):
+        for fanout in range(1, args.max_fanout + 1):
+            full = build_response(full_agent, depth, fanout)
+            compact = build_response(compact_agent, depth, fanout)
+            full_size = len(json.dumps(full))
+            compact_size = len(json.dumps(compact))
+            print(f"{depth:>5} {fanout:>6} {len(full['approval_info']):>9} {_conversation_size(full['continuation']):>12} "
+                  f"{full_size:>10} {compact_size:>10} {compact_size / full_size:>6.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Memory and size benchmark of the conversation messages, as dumped by the SDK and in the minimal wire form kept
+by the agents.
+
+A conversation of `--turns` assistant turns, each with `--tool-calls` tool calls and their tool messages, is
+built `--conversations` times. The resident memory of the conversations is measured with tracemalloc, and the
+serialized size as JSON and as the zlib-compressed envelope of `core.serialization`. The round trip of every
+form back to the SDK dictionaries is checked.
+
+The gain of the wire form is in the serialized size of the continuations and `approval_info`: about 17% of the
+JSON and 10% of the compressed envelope with the defaults. The resident memory barely changes, since the
+null values are shared and most of the memory goes to the ids, arguments and contents. The script exits with
+status 1 when the JSON of the wire form is larger than `--max-json-ratio` times the SDK form, 0.85 by default.
+
+Usage:
+    python benchmarks/bench_messages.py [--conversations 1000] [--turns 5] [--tool-calls 2] [--max-json-ratio 0.85]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core.messages import compact_message, expand_message
+from core import serialization
+import argparse
+import itertools
+import tracemalloc
+import json
+
+_ids = itertools.count()
+
+def _assistant_message(tool_calls: list) -> dict:
+    # Same shape as ChatCompletionMessage.model_dump()
+    return {"content": None, "refusal": None, "role": "assistant", "annotations": None, "audio": None, "function_call": None, "tool_calls": tool_calls}
+
+def build_conversation(turns: int, tool_calls: int) -> list:
+    """Build a conversation in the format dumped by the SDK."""
+    messages = [
+        {"role": "developer", "content": "You are an HR agent."},
+        {"role": "user", "content": "Onboard our new colleagues."},
+    ]
+    for _ in range(turns):
+        calls = [{"id": f"call_{next(_ids):024d}", "function": {"arguments": json.dumps({"username": f"user{i}"}), "name": "create_account"}, "type": "function"} for i in range(tool_calls)]
+        messages.append(_assistant_message(calls))
+        messages.extend({"role": "tool", "tool_call_id": call["id"], "content": "Account created."} for call in calls)
+    messages.append({"content": "Done.", "refusal": None, "role": "assistant", "annotations": None, "audio": None, "function_call": None, "tool_calls": None})
+    return messages
+
+def _measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held, used
+
+def main():
+    parser = argparse.ArgumentParser(description="Message representation benchmark.")
+    parser.add_argument("--conversations", type=int, default=1000, help="Number of conversations held in memory.")
+    parser.add_argument("--turns", type=int, default=5, help="Assistant turns with tool calls per conversation.")
+    parser.add_argument("--tool-calls", type=int, default=2, help="Tool calls per assistant turn.")
+    parser.add_argument("--max-json-ratio", type=float, default=0.85, help="Fail when the JSON of the wire form is larger than this fraction of the SDK form.")
+    args = parser.parse_args()
+
+    conversations = [build_conversation(args.turns, args.tool_calls) for _ in range(args.conversations)]
+    # Copies sharing nothing with the source conversations, so each form is measured on its own
+    source = json.dumps(conversations)
+    forms = {
+        "model_dump": lambda: json.loads(source),
+        "wire": lambda: [[compact_message(message) for message in conversation] for conversation in json.loads(source)],
+    }
+
+    baseline = None
+    print(f"{'form':<12} {'memory (KiB)':>12} {'json (KiB)':>11} {'envelope (KiB)':>15} {'memory ratio':>13} {'json ratio':>11}")
+    for name, build in forms.items():
+        held, used = _measure(build)
+        if [[expand_message(message) for message in conversation] for conversation in held] != conversations:
+            raise AssertionError(f"The {name} form does not convert back to the SDK dictionaries")
+        size = len(json.dumps(held))
+        envelope = sum(len(serialization.encode({"messages": conversation}, codec="json", compression="zlib")) for conversation in held)
+        if baseline is None:
+            baseline = (used, size)
+        json_ratio = size / baseline[1]
+        print(f"{name:<12} {used / 1024:>12.1f} {size / 1024:>11.1f} {envelope / 1024:>15.1f} {used / baseline[0]:>13.2f} {json_ratio:>11.2f}")
+    if json_ratio > args.max_json_ratio:
+        print(f"The wire form is {json_ratio:.2f} of the SDK form, above --max-json-ratio {args.max_json_ratio}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
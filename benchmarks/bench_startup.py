@@ -0,0 +1,80 @@
+"""
+Benchmark of the import time and cold start of the framework and the example CLI.
+
+Each step runs in a fresh interpreter, and the best wall time of `--repeat` runs is reported next to the
+time of an empty interpreter. The script also checks that importing the agents and building them does
+not import the modules that are deferred to the first model call or the first process tool, and exits
+with status 1 when one of them is imported, or when a step is slower than `--max-ms`, so it can guard
+against regressions in CI.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--max-ms 500]
+"""
+import sys
+import os
+import argparse
+import subprocess
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Imported on first use only: the OpenAI SDK and its HTTP client by the first model call,
+# multiprocessing by the first process tool call
+DEFERRED_MODULES = ("openai", "httpx", "multiprocessing")
+
+STEPS = [
+    ("interpreter", "pass"),
+    ("import core", "import core"),
+    ("import agents", "import core.continuation_agent, core.async_continuation_agent"),
+    ("build hr_agent", "import hr_agent_cli; hr_agent_cli.create_hr_agent()"),
+]
+
+CHECK = f"""
+import sys
+import core.continuation_agent, core.async_continuation_agent
+import hr_agent_cli
+hr_agent_cli.create_hr_agent()
+print(",".join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))
+"""
+
+def _run(args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable] + args, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed: {completed.stderr.strip()}")
+    return elapsed, completed.stdout
+
+def _best_of(repeat, args):
+    return min(_run(args)[0] for _ in range(repeat))
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per step, the best one is reported.")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail when a step takes longer than this, interpreter startup excluded.")
+    args = parser.parse_args()
+
+    steps = [(name, ["-c", code]) for name, code in STEPS] + [("hr_agent_cli --help", ["hr_agent_cli.py", "--help"])]
+    baseline = None
+    failed = False
+    print(f"{'step':<22} {'wall (ms)':>10} {'over interpreter (ms)':>22}")
+    for name, step in steps:
+        elapsed = _best_of(args.repeat, step)
+        if baseline is None:
+            baseline = elapsed
+        over = (elapsed - baseline) * 1e3
+        slow = args.max_ms is not None and over > args.max_ms
+        failed = failed or slow
+        print(f"{name:<22} {elapsed * 1e3:>10.1f} {over:>22.1f}{'  SLOW' if slow else ''}")
+
+    imported = [name for name in _run(["-c", CHECK])[1].strip().split(",") if name]
+    if imported:
+        print(f"imported before the first model call: {', '.join(imported)}")
+        failed = True
+    else:
+        print(f"not imported before the first model call: {', '.join(DEFERRED_MODULES)}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of the per-turn cost of building the tool payload sent to the model.
+
+Compares rebuilding `[tool._tool.to_openai_function() for tool in tools]` on every turn with the
+cached `ToolSchemas` payload shared between agents.
+
+Usage:
+    python benchmarks/bench_tool_schema.py [--tools 60] [--turns 20000]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from typing import List, Dict, Optional
+from core.tool import tool, get_tool_schemas
+import argparse
+import json
+import timeit
+
+def make_tools(count: int) -> List:
+    tools = []
+    for i in range(count):
+        def func(username: str, security_level: int, tags: List[str], metadata: Dict[str, int], note: Optional[str]) -> str:
+            return username
+        func.__name__ = f"tool_{i}"
+        func.__doc__ = f"Tool number {i}, used to measure the cost of building tool schemas."
+        tools.append(tool()(func))
+    return tools
+
+def main():
+    parser = argparse.ArgumentParser(description="Tool schema payload micro-benchmark.")
+    parser.add_argument("--tools", type=int, default=60, help="Number of tools in the tool set.")
+    parser.add_argument("--turns", type=int, default=20000, help="Number of simulated model turns.")
+    args = parser.parse_args()
+
+    tools = make_tools(args.tools)
+    schemas = get_tool_schemas(tools)
+
+    cases = {
+        "rebuild payload per turn": lambda: [t._tool.to_openai_function() for t in tools],
+        "cached payload per turn": lambda: schemas.payload if not schemas.stale else None,
+        "rebuild + json.dumps per turn": lambda: json.dumps([t._tool.to_openai_function() for t in tools]),
+        "cached json bytes per turn": lambda: schemas.json_bytes,
+    }
+    print(f"{args.tools} tools, {args.turns} turns")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.turns, repeat=3))
+        print(f"{name:<32} {seconds / args.turns * 1e6:10.2f} us/turn")
+
+if __name__ == "__main__":
+    main()
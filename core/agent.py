@@ -1,8 +1,23 @@
-from typing import List, Dict, Any, Tuple, Callable
-from core.tool import Tool, tool
+from typing import List, Dict, Any, Tuple, Callable, Optional, Union
+from core.tool import Tool, tool, ToolSchemas, get_tool_schemas
+from core.model_backend import ModelBackend, ModelResponse, get_default_backend
+from core.tool_cache import make_cache_key
+from core.tool_arguments import ToolArgumentError
+from core.process_pool import ToolTimeoutError, ToolWorkerError
+from core.deferred import PendingResult
+from core.request_context import RequestContext
+from core.scheduler import get_scheduler
+from core.compaction import CompactionStrategy, compact_messages
+from core.messages import compact_message
+from core.tracing import traced, traced_request, record_usage, current_span
+from core.clients import run_async
 from enum import Enum, auto
-from openai import OpenAI
 from functools import wraps
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+import threading
+import inspect
 import json
 
 class AgentExecutionStatus(Enum):
@@ -14,25 +29,103 @@ class AgentExecutionStatus(Enum):
     
 TERMINAL_STATUSES = [AgentExecutionStatus.COMPLETED, AgentExecutionStatus.SUSPENDED, AgentExecutionStatus.REJECTED, AgentExecutionStatus.ERROR]
 
+_agent_tool_call: ContextVar[bool] = ContextVar("agent_tool_call", default=False)
+
+def is_agent_tool_call() -> bool:
+    """Whether the current request is made by another agent, through `as_tool`."""
+    return _agent_tool_call.get()
+
+def _resolve(result: Any) -> Any:
+    """
+    Run an `async` tool to completion when it is called from a synchronous agent.
+
+    When the calling thread already runs an event loop, such as a synchronous agent used inside an async
+    application, the coroutine runs in its own loop on a worker thread, since a thread runs one loop at a time.
+    """
+    if not inspect.isawaitable(result):
+        return result
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return run_async(result)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-resolve") as executor:
+        return executor.submit(copy_context().run, run_async, result).result()
+
+def _tool_call_attributes(agent: "Agent", tool_call: Dict[str, Any]) -> Dict[str, Any]:
+    return {"tool": tool_call['function']['name'], "tool_call_id": tool_call.get('id')}
+
 class Agent:
-    def __init__(self, instruction: str, tools: List[Callable]):
+    def __init__(self, instruction: str, tools: List[Callable], max_concurrency: int = 1, backend: Optional[ModelBackend] = None, stream: bool = False, trace: bool = False, compaction: Optional[Union[CompactionStrategy, List[CompactionStrategy]]] = None):
         """
         Initialize a new Agent.
         
         Args:
             instruction: The system prompt for the agent
             tools: List of tools the agent can use
+            max_concurrency: Maximum number of tool calls of a single turn executed at the same time.
+                1 (the default) runs the tool calls sequentially.
+            backend: The model backend, the process-wide default backend when omitted
+            stream: Stream the model responses and start every tool call that can run without approval
+                as soon as its arguments are complete, instead of waiting for the whole response
+            trace: Attach a timing and token summary of the request, sub-agents included, to the `trace` field
+                of the top-level responses, see `core.tracing`
+            compaction: Compaction strategies shrinking the conversation in place before each model call,
+                see `core.compaction`
         """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
         self.instruction = instruction
-        self.tools = tools
-        self.tool_map = {}
+        self.max_concurrency = max_concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.set_tools(tools)
+        self._backend = backend
+        self.stream = stream
+        self.trace = trace
+        self.compaction = [compaction] if isinstance(compaction, CompactionStrategy) else list(compaction or [])
+        # Results of the tool calls started while the model response was streaming, keyed by tool call id
+        self._early_results = {}
+        
+    def set_tools(self, tools: List[Callable]):
+        """
+        Replace the tools of the agent and invalidate its cached tool payload.
+        
+        Args:
+            tools: List of tools the agent can use
+        """
+        tool_map = {}
         for tool in tools:
             if hasattr(tool, '_tool'):
-                self.tool_map[tool._tool.name] = tool
+                tool_map[tool._tool.name] = tool
             else:
                 raise ValueError("Did you forget to use the decorator @tool?")
-        self.client = OpenAI()
+        self.tools = tools
+        self.tool_map = tool_map
+        self._tool_schemas = None
+        
+    def _get_tool_schemas(self) -> ToolSchemas:
+        """
+        Get the tool payload sent to the model, built once per tool set instead of once per turn.
+        """
+        schemas = self._tool_schemas
+        if schemas is None or schemas.stale:
+            schemas = self._tool_schemas = get_tool_schemas(self.tools)
+        return schemas
         
+    @property
+    def backend(self) -> ModelBackend:
+        """
+        The model backend of the agent, resolved on every call so that agents created without one
+        follow `set_default_backend`.
+        """
+        return self._backend or get_default_backend()
+    
+    @backend.setter
+    def backend(self, backend: Optional[ModelBackend]):
+        self._backend = backend
+        
+    @traced_request
     def request(self, input: Dict[str, Any]) -> Dict[str, Any]:
         """
         Agents processing lives in this scope only, to maintain statelessness.
@@ -59,7 +152,11 @@ class Agent:
             Returns:
                 Dict: The agent's response
             """
-            return self.request(input)
+            token = _agent_tool_call.set(True)
+            try:
+                return self.request(input)
+            finally:
+                _agent_tool_call.reset(token)
         
         if description is None:
             raise ValueError("description is required for the tool")
@@ -81,7 +178,7 @@ class Agent:
             Dict: The agent's response
         """
         return {
-            "result": messages[-1]['content'],
+            "result": messages[-1].get('content'),
             "messages": messages
         }    
     
@@ -99,9 +196,85 @@ class Agent:
         
         This method can be overridden by subclasses to customize tool execution.
         """
-        for tool_call in approved_tool_calls:
-            messages.append({"role": "tool", "tool_call_id": tool_call['id'], "content": self._call_tool(tool_call)})
+        results = self._run_tool_calls(approved_tool_calls)
+        for tool_call, result in zip(approved_tool_calls, results):
+            messages.append({"role": "tool", "tool_call_id": tool_call['id'], "content": result})
+    
+    def _run_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Run `_call_tool` for every tool call of a turn.
+        
+        The calls run concurrently on the agent's thread pool when `max_concurrency` is greater than 1.
+        
+        Args:
+            tool_calls: The tool calls to execute
+            
+        Returns:
+            List[Any]: The results of `_call_tool`, in the same order as `tool_calls`
+        """
+        early_results = [self._early_results.pop(tool_call['id'], None) for tool_call in tool_calls]
+        remaining = [tool_call for tool_call, early in zip(tool_calls, early_results) if early is None]
+        if self.max_concurrency == 1 or len(remaining) <= 1:
+            results = iter([self._call_tool(tool_call) for tool_call in remaining])
+        else:
+            # Each call runs in a copy of the current context, so its spans are children of the current span
+            executor = self._get_executor()
+            results = iter([future.result() for future in [executor.submit(copy_context().run, self._call_tool, tool_call) for tool_call in remaining]])
+        return [early.result() if early is not None else next(results) for early in early_results]
     
+    def _can_dispatch_early(self, tool_call: Dict[str, Any]) -> bool:
+        """
+        Whether a tool call may start while the model response is still streaming.
+        
+        Tools with `need_approval` are never started early: when the stream fails after a tool call has started,
+        the error is raised without its result, and running the request again runs the call again.
+        
+        This method can be overridden by subclasses that do not execute every tool call right away.
+        """
+        function_name = tool_call['function']['name']
+        return function_name in self.tool_map and not self.tool_map[function_name]._tool.need_approval
+    
+    def _dispatch_early(self, tool_call: Dict[str, Any], dispatched: List[str]):
+        """
+        Start a complete tool call of a streaming model response on the agent's thread pool.
+        """
+        if not tool_call.get('id'):
+            return
+        # Every streamed tool call is listed, started or not, so what was decided for it is forgotten with the response
+        dispatched.append(tool_call['id'])
+        if self._can_dispatch_early(tool_call):
+            self._early_results[tool_call['id']] = self._get_executor().submit(copy_context().run, self._call_tool, tool_call)
+    
+    def _discard_early_results(self, dispatched: List[str]):
+        """
+        Forget the tool calls streamed for a model response that will not be processed.
+        """
+        for tool_call_id in dispatched:
+            early = self._early_results.pop(tool_call_id, None)
+            if early is not None:
+                early.cancel()
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """
+        Lazily create the thread pool used to run tool calls concurrently.
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="agent-tool")
+        return self._executor
+    
+    def shutdown(self, wait: bool = True):
+        """
+        Release the thread pool used to run tool calls concurrently.
+        
+        Args:
+            wait: Whether to wait for the running tool calls to finish
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
         
     def _form_input(self, input: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -119,6 +292,7 @@ class Agent:
         return [{"role": "developer", "content": self.instruction}, 
                 {"role": "user", "content": input['prompt']}]
         
+    @traced("tool.call", _tool_call_attributes)
     def _call_tool(self, tool_call: Dict[str, Any]) -> Any:
         """
         Execute a tool based on a tool call.
@@ -136,36 +310,94 @@ class Agent:
         if self.tool_map.get(function_params['name']):
             func = self.tool_map[function_params['name']]
             if func._tool.is_agent:
-                return func(json.loads(function_params['arguments']))['result']
+                try:
+                    arguments = func._tool.validate_arguments(function_params['arguments'])
+                except ToolArgumentError as e:
+                    return str(e)
+                return _resolve(func(arguments))['result']
             else:
-                return func(**json.loads(function_params['arguments']))
+                return self._invoke_tool(func, function_params['arguments'])
             
         raise ValueError(f"Tool {function_params['name']} not found in the list of tools.")
     
+    def _invoke_tool(self, func: Callable, arguments: Union[str, Dict[str, Any]]) -> Any:
+        """
+        Call a tool function with the arguments chosen by the model, through its result cache if it has one.
+        
+        The arguments are validated and converted to the parameter types first. Invalid arguments are not
+        passed to the tool, the error is returned as the tool result so the model can correct its call,
+        as are the timeouts of process tools.
+        
+        Args:
+            func: The decorated tool function
+            arguments: The arguments of the call, as the JSON string sent by the model or a dictionary
+            
+        Returns:
+            Any: The result of the tool, or the error
+        """
+        try:
+            arguments = func._tool.validate_arguments(arguments)
+            cache = func._tool.cache
+            if cache is None:
+                return _resolve(func(**arguments))
+            key = make_cache_key(func._tool.name, arguments)
+            found, result = cache.get(key)
+            if not found:
+                result = _resolve(func(**arguments))
+                # A deferred result is not the result of the call
+                if not isinstance(result, PendingResult):
+                    cache.set(key, result)
+            return result
+        except (ToolArgumentError, ToolTimeoutError, ToolWorkerError) as e:
+            return str(e)
+    
     # Future Version: self, messages, modelConfig -> result, tool_calls
-    def _call_model_and_check_status(self, messages: List[Dict[str, Any]], model: str = "gpt-4o-mini") -> Tuple[AgentExecutionStatus, List[Dict[str, Any]]]:
+    @traced("model.call", lambda self, messages, model="gpt-4o-mini", context=None: {"model": model, "stream": self.stream})
+    def _call_model_and_check_status(self, messages: List[Dict[str, Any]], model: str = "gpt-4o-mini", context: Optional[RequestContext] = None) -> Tuple[AgentExecutionStatus, List[Dict[str, Any]]]:
         """
         Call the language model and update the agent's status based on the response and a list of uncategorized tool call requests.
         
         This method can be overridden by subclasses to customize model interaction.
         """
-        # Idealy, the model call configurations should be contained its own class
+        if self.compaction:
+            compact_messages(messages, self.compaction)
+        dispatched = []
         try:
-            chat_completion = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                tools=[tool._tool.to_openai_function() for tool in self.tools],
-                parallel_tool_calls=True
-            )
+            if self.stream:
+                # A failed stream is only retried when none of its tool calls has started
+                response = get_scheduler().call(lambda: self.backend.stream(messages, self._get_tool_schemas().payload, model, lambda tool_call: self._dispatch_early(tool_call, dispatched)), messages, can_retry=lambda: not dispatched)
+            else:
+                response = get_scheduler().call(lambda: self.backend.complete(messages, self._get_tool_schemas().payload, model), messages)
         except Exception as e:
+            self._discard_early_results(dispatched)
             raise RuntimeError(f"Messages: {json.dumps(messages, indent=2)}, Error: {str(e)}")
         
-        messages.append(chat_completion.choices[0].message.model_dump())
-        finish_reason = chat_completion.choices[0].finish_reason
-        if finish_reason == "stop":
+        if context is not None:
+            context.record_model_call(response.usage)
+        record_usage(current_span(), response.usage, finish_reason=response.finish_reason)
+        status, tool_calls = self._handle_model_response(response, messages)
+        if status != AgentExecutionStatus.RUNNING:
+            self._discard_early_results(dispatched)
+        return status, tool_calls
+    
+    def _handle_model_response(self, response: ModelResponse, messages: List[Dict[str, Any]]) -> Tuple[AgentExecutionStatus, List[Dict[str, Any]]]:
+        """
+        Append the model's message to the conversation and derive the execution status from the response.
+        
+        Args:
+            response: The model output of the turn
+            messages: The conversation so far
+            
+        Returns:
+            Tuple[AgentExecutionStatus, List[Dict[str, Any]]]: The status and the uncategorized tool calls
+        """
+        # Without its null fields, the message is copied into every continuation and approval_info
+        messages.append(compact_message(response.message))
+        if response.finish_reason == "stop":
             return AgentExecutionStatus.COMPLETED, []
-        elif finish_reason == "tool_calls":
-            return AgentExecutionStatus.RUNNING, [tc.model_dump() for tc in chat_completion.choices[0].message.tool_calls]
+        elif response.finish_reason == "tool_calls":
+            # Copies, the tool calls are annotated while they are processed and the message must stay as sent by the model
+            return AgentExecutionStatus.RUNNING, copy.deepcopy(response.message["tool_calls"])
         else: 
             return AgentExecutionStatus.ERROR, []
         
@@ -0,0 +1,275 @@
+"""
+Declarative approval policies, deciding tool calls that need approval without a human round-trip.
+
+A policy belongs to one tool. It approves or rejects a call from its arguments and from the caller of the
+request, and leaves the other calls to the `need_approval` flag of the tool. The checks are evaluated in order:
+
+    1. `deny`: an argument value in its deny list rejects the call
+    2. `rules`: the first rule whose conditions all hold decides, "approve", "reject" or "ask" for a human
+    3. `allow`: every listed argument with a value in its allow list approves the call
+    4. otherwise the call needs approval when its tool does
+
+Conditions are a value, compared for equality, or a dictionary of operators: `eq`, `ne`, `lt`, `le`, `gt`,
+`ge`, `in`, `not_in` and `matches` (a regular expression). Booleans only match booleans, `false` is not the
+value 0, and values that cannot be compared never match. A policy or a rule limited to `callers` only applies
+to the requests made with one of these callers, `{"prompt": ..., "caller": "hr-portal"}`, which nested sub-agents
+inherit. Policies are compiled once, when the agent is created.
+
+Every call decided by a policy is recorded with the rule that decided it, in the `auto_decisions` field of the
+response of the top-level request.
+
+Example:
+    policy = ApprovalPolicy("authorize_account", rules=[
+        Rule("approve", when={"security_level": 0}, reason="default security level"),
+        Rule("ask", when={"security_level": {"ge": 3}}),
+    ], deny={"username": ["root", "admin"]}, allow={"username": ["tfan"]})
+    agent = ContinuationAgent(instruction, tools, approval_policies=[policy])
+"""
+
+from typing import List, Dict, Any, Optional, Callable, Union
+from contextvars import ContextVar
+import functools
+import operator
+import inspect
+import json
+import re
+
+APPROVE = "approve"
+REJECT = "reject"
+ASK = "ask"
+DECISIONS = (APPROVE, REJECT, ASK)
+
+def _strict(compare: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    # Booleans are integers in Python, but `false` must not pass for the security level 0
+    return lambda value, operand: (type(value) is bool) == (type(operand) is bool) and compare(value, operand)
+
+def _in(value: Any, options: Any) -> bool:
+    others, bools = options
+    return value in bools if type(value) is bool else value in others
+
+def _not_in(value: Any, options: Any) -> bool:
+    others, bools = options
+    return bool(bools) and value not in bools if type(value) is bool else bool(others) and value not in others
+
+OPERATORS = {
+    "eq": _strict(operator.eq),
+    "ne": _strict(operator.ne),
+    "lt": _strict(operator.lt),
+    "le": _strict(operator.le),
+    "gt": _strict(operator.gt),
+    "ge": _strict(operator.ge),
+    "in": _in,
+    "not_in": _not_in,
+    "matches": lambda value, pattern: isinstance(value, str) and pattern.fullmatch(value) is not None,
+}
+
+_current_caller: ContextVar[Optional[str]] = ContextVar("approval_caller", default=None)
+_current_audit: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("approval_audit", default=None)
+
+class Rule:
+    """
+    A decision taken when all of its argument conditions hold.
+    """
+    def __init__(self, decision: str, when: Optional[Dict[str, Any]] = None, callers: Optional[List[str]] = None, reason: Optional[str] = None):
+        """
+        Args:
+            decision: "approve", "reject", or "ask" to leave the call to a human
+            when: The conditions on the arguments, by argument name, always true when omitted
+            callers: The callers the rule applies to, all of them when omitted
+            reason: The explanation recorded in the audit trail, the conditions when omitted
+        """
+        if decision not in DECISIONS:
+            raise ValueError(f"Unknown decision {decision}, expected one of {', '.join(DECISIONS)}")
+        self.decision = decision
+        self.when = when or {}
+        self.callers = callers
+        self.reason = reason
+
+class ApprovalPolicy:
+    """
+    The approval policy of one tool.
+    """
+    def __init__(self, tool: str, rules: Optional[List[Union[Rule, Dict[str, Any]]]] = None, allow: Optional[Dict[str, List[Any]]] = None, deny: Optional[Dict[str, List[Any]]] = None, callers: Optional[List[str]] = None):
+        """
+        Args:
+            tool: The name of the tool
+            rules: The rules, or their keyword arguments as dictionaries, the first matching one decides
+            allow: Allowed values by argument name, a call with all of these arguments allowed is approved
+            deny: Denied values by argument name, a call with one of these arguments denied is rejected
+            callers: The callers the policy applies to, all of them when omitted
+        """
+        self.tool = tool
+        self.rules = [rule if isinstance(rule, Rule) else Rule(**rule) for rule in rules or []]
+        self.allow = allow or {}
+        self.deny = deny or {}
+        self.callers = callers
+
+class CompiledPolicy:
+    """
+    An `ApprovalPolicy` compiled to predicates, evaluated in a single pass over the checks.
+    """
+    def __init__(self, policy: ApprovalPolicy):
+        self.tool = policy.tool
+        self.callers = frozenset(policy.callers) if policy.callers is not None else None
+        self.deny = [(name, _hashable_set(values)) for name, values in policy.deny.items()]
+        self.allow = [(name, _hashable_set(values)) for name, values in policy.allow.items()]
+        self.rules = [
+            (rule.decision, frozenset(rule.callers) if rule.callers is not None else None, [_compile_condition(name, condition) for name, condition in rule.when.items()], rule.reason or _describe(rule.when))
+            for rule in policy.rules
+        ]
+
+    def evaluate(self, arguments: Dict[str, Any], caller: Optional[str]) -> Optional[Dict[str, str]]:
+        """
+        Decide a tool call.
+
+        Args:
+            arguments: The arguments of the call
+            caller: The caller of the request
+
+        Returns:
+            Optional[Dict[str, str]]: The `decision` and its `reason`, None when the policy does not decide
+        """
+        if self.callers is not None and caller not in self.callers:
+            return None
+        for name, values in self.deny:
+            if name in arguments and _contains(values, arguments[name]):
+                return {"decision": REJECT, "reason": f"{name} is in the deny list"}
+        for decision, callers, predicates, reason in self.rules:
+            if (callers is None or caller in callers) and all(predicate(arguments) for predicate in predicates):
+                return {"decision": decision, "reason": reason}
+        if self.allow and all(name in arguments and _contains(values, arguments[name]) for name, values in self.allow):
+            return {"decision": APPROVE, "reason": "in the allow list"}
+        return None
+
+def compile_policies(policies: List[ApprovalPolicy], tool_map: Dict[str, Callable]) -> Dict[str, CompiledPolicy]:
+    """
+    Compile the policies of an agent.
+
+    Args:
+        policies: The policies, at most one per tool
+        tool_map: The tools of the agent by name
+
+    Returns:
+        Dict[str, CompiledPolicy]: The compiled policies by tool name
+
+    Raises:
+        ValueError: If a policy names a tool the agent does not have, or a tool has two policies
+    """
+    compiled = {}
+    for policy in policies:
+        if policy.tool not in tool_map:
+            raise ValueError(f"Approval policy of unknown tool {policy.tool}")
+        if policy.tool in compiled:
+            raise ValueError(f"Tool {policy.tool} has more than one approval policy")
+        compiled[policy.tool] = CompiledPolicy(policy)
+    return compiled
+
+def parse_arguments(tool_call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The arguments of a tool call, None when they are not a JSON object and no policy can decide the call.
+    """
+    try:
+        arguments = json.loads(tool_call['function']['arguments'] or "{}")
+    except (TypeError, ValueError):
+        return None
+    return arguments if isinstance(arguments, dict) else None
+
+def current_caller() -> Optional[str]:
+    """The caller of the current request, inherited by nested sub-agents."""
+    return _current_caller.get()
+
+def record_decision(tool_call: Dict[str, Any], decision: Dict[str, str]):
+    """
+    Add an automatic decision to the audit trail of the current top-level request.
+    """
+    audit = _current_audit.get()
+    if audit is not None:
+        audit.append({"id": tool_call['id'], "tool": tool_call['function']['name'], "caller": _current_caller.get(), **decision})
+
+def audited_request(func: Callable) -> Callable:
+    """
+    Decorator of the `request` methods of the continuation agents.
+
+    The top-level request starts the audit trail shared by the sub-agents it calls, and attaches it to the
+    `auto_decisions` field of its response. The `caller` of the input applies to the request and its sub-agents.
+    """
+    def enter(input: Any) -> List[Any]:
+        tokens = []
+        if _current_audit.get() is None:
+            tokens.append((_current_audit, _current_audit.set([])))
+        if isinstance(input, dict) and input.get("caller") is not None:
+            tokens.append((_current_caller, _current_caller.set(input["caller"])))
+        return tokens
+
+    def finish(response: Any, tokens: List[Any]) -> Any:
+        audit = _current_audit.get()
+        if tokens and tokens[0][0] is _current_audit and audit and isinstance(response, dict):
+            response["auto_decisions"] = audit
+        return response
+
+    def exit(tokens: List[Any]):
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, input, *args, **kwargs):
+            tokens = enter(input)
+            try:
+                return finish(await func(self, input, *args, **kwargs), tokens)
+            finally:
+                exit(tokens)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, input, *args, **kwargs):
+        tokens = enter(input)
+        try:
+            return finish(func(self, input, *args, **kwargs), tokens)
+        finally:
+            exit(tokens)
+    return wrapper
+
+def _compile_condition(name: str, condition: Any) -> Callable[[Dict[str, Any]], bool]:
+    if not isinstance(condition, dict):
+        condition = {"eq": condition}
+    checks = []
+    for op, operand in condition.items():
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op} in the condition of {name}, expected one of {', '.join(OPERATORS)}")
+        if op == "matches":
+            operand = re.compile(operand)
+        elif op in ("in", "not_in"):
+            operand = _hashable_set(operand)
+        checks.append((OPERATORS[op], operand))
+
+    def predicate(arguments: Dict[str, Any]) -> bool:
+        if name not in arguments:
+            return False
+        value = arguments[name]
+        try:
+            return all(check(value, operand) for check, operand in checks)
+        except TypeError:
+            # Values the operator cannot compare, such as a string and a number, do not match
+            return False
+    return predicate
+
+def _hashable_set(values: List[Any]) -> Any:
+    # The booleans are kept apart, so that they only match booleans
+    bools = frozenset(value for value in values if type(value) is bool)
+    others = [value for value in values if type(value) is not bool]
+    try:
+        return frozenset(others), bools
+    except TypeError:
+        return others, bools
+
+def _contains(values: Any, value: Any) -> bool:
+    try:
+        return _in(value, values)
+    except TypeError:
+        return False
+
+def _describe(when: Dict[str, Any]) -> str:
+    if not when:
+        return "always"
+    return ", ".join(f"{name} {condition}" if isinstance(condition, dict) else f"{name} = {condition!r}" for name, condition in when.items())
@@ -0,0 +1,196 @@
+from typing import List, Dict, Any, Tuple, Callable, Optional, Union
+from core.agent import Agent, AgentExecutionStatus, TERMINAL_STATUSES, _tool_call_attributes, _agent_tool_call
+from core.tool import tool
+from core.tool_cache import make_cache_key
+from core.tool_arguments import ToolArgumentError
+from core.process_pool import get_process_pool, ToolTimeoutError, ToolWorkerError
+from core.deferred import PendingResult
+from core.request_context import RequestContext
+from core.scheduler import get_scheduler
+from core.compaction import compact_messages
+from core.tracing import traced, traced_request, record_usage, current_span
+from functools import wraps
+import asyncio
+import json
+
+class AsyncAgent(Agent):
+    """
+    asyncio counterpart of `Agent`.
+
+    `request` is a coroutine and the model is called through `ModelBackend.acomplete`, so many
+    conversations can be in flight on a single event loop. `async` tools are awaited directly, synchronous tools
+    are offloaded to a worker thread.
+    """
+    @traced_request
+    async def request(self, input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Agents processing lives in this scope only, to maintain statelessness.
+        """
+        messages = self._form_input(input)
+        while True:
+            status, raw_tool_calls = await self._call_model_and_check_status(messages)
+            if status in TERMINAL_STATUSES:
+                break
+            approved_tool_calls = self._prepare_tools(raw_tool_calls)
+            await self._call_all_tools(approved_tool_calls, messages)
+
+        return self._create_response(messages)
+
+    def as_tool(self, name: str, description: str, need_approval: bool = False) -> Callable:
+        @wraps(self.request)
+        async def bound_request(input: Dict[str, Any]) -> Dict[str, Any]:
+            """
+            Bind the request coroutine to the agent instance.
+
+            Args:
+                input: The input data
+
+            Returns:
+                Dict: The agent's response
+            """
+            token = _agent_tool_call.set(True)
+            try:
+                return await self.request(input)
+            finally:
+                _agent_tool_call.reset(token)
+
+        if description is None:
+            raise ValueError("description is required for the tool")
+
+        decorated_request = tool(
+            name=name,
+            description=description,
+            need_approval=need_approval,
+            is_agent=True,
+        )(bound_request)
+
+        return decorated_request
+
+    async def _call_all_tools(self, approved_tool_calls: List[Dict[str, Any]], messages: List[Dict[str, Any]]):
+        """
+        Execute all approved tools.
+        """
+        results = await self._run_tool_calls(approved_tool_calls)
+        for tool_call, result in zip(approved_tool_calls, results):
+            messages.append({"role": "tool", "tool_call_id": tool_call['id'], "content": result})
+
+    async def _run_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Await `_call_tool` for every tool call of a turn, at most `max_concurrency` at a time.
+
+        Args:
+            tool_calls: The tool calls to execute
+
+        Returns:
+            List[Any]: The results of `_call_tool`, in the same order as `tool_calls`
+        """
+        early_results = [self._early_results.pop(tool_call['id'], None) for tool_call in tool_calls]
+        remaining = [tool_call for tool_call, early in zip(tool_calls, early_results) if early is None]
+        if self.max_concurrency == 1 or len(remaining) <= 1:
+            results = iter([await self._call_tool(tool_call) for tool_call in remaining])
+        else:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            async def bounded(tool_call):
+                async with semaphore:
+                    return await self._call_tool(tool_call)
+            results = iter(await asyncio.gather(*(bounded(tool_call) for tool_call in remaining)))
+        return [await early if early is not None else next(results) for early in early_results]
+
+    def _dispatch_early(self, tool_call: Dict[str, Any], dispatched: List[str]):
+        """
+        Start a complete tool call of a streaming model response as a task of the running event loop.
+
+        Tool calls started early are not counted against `max_concurrency`.
+        """
+        if not tool_call.get('id'):
+            return
+        dispatched.append(tool_call['id'])
+        if self._can_dispatch_early(tool_call):
+            self._early_results[tool_call['id']] = asyncio.ensure_future(self._call_tool(tool_call))
+
+    @traced("tool.call", _tool_call_attributes)
+    async def _call_tool(self, tool_call: Dict[str, Any]) -> Any:
+        """
+        Execute a tool based on a tool call.
+
+        Args:
+            tool_call: The tool call dictionary
+
+        Returns:
+            Any: The result of the tool execution
+
+        Raises:
+            ValueError: If the tool is not found
+        """
+        function_params = tool_call['function']
+        if self.tool_map.get(function_params['name']):
+            func = self.tool_map[function_params['name']]
+            if func._tool.is_agent:
+                try:
+                    arguments = func._tool.validate_arguments(function_params['arguments'])
+                except ToolArgumentError as e:
+                    return str(e)
+                return (await _invoke(func, arguments))['result']
+            else:
+                return await self._invoke_tool(func, function_params['arguments'])
+
+        raise ValueError(f"Tool {function_params['name']} not found in the list of tools.")
+
+    async def _invoke_tool(self, func: Callable, arguments: Union[str, Dict[str, Any]]) -> Any:
+        """
+        Await a tool function with the arguments chosen by the model, through its result cache if it has one.
+        Invalid arguments and timeouts are returned as the tool result, as in `Agent._invoke_tool`.
+        """
+        try:
+            arguments = func._tool.validate_arguments(arguments)
+            cache = func._tool.cache
+            if cache is None:
+                return await _invoke(func, **arguments)
+            key = make_cache_key(func._tool.name, arguments)
+            found, result = cache.get(key)
+            if not found:
+                result = await _invoke(func, **arguments)
+                # A deferred result is not the result of the call
+                if not isinstance(result, PendingResult):
+                    cache.set(key, result)
+            return result
+        except (ToolArgumentError, ToolTimeoutError, ToolWorkerError) as e:
+            return str(e)
+
+    @traced("model.call", lambda self, messages, model="gpt-4o-mini", context=None: {"model": model, "stream": self.stream})
+    async def _call_model_and_check_status(self, messages: List[Dict[str, Any]], model: str = "gpt-4o-mini", context: Optional[RequestContext] = None) -> Tuple[AgentExecutionStatus, List[Dict[str, Any]]]:
+        """
+        Call the language model and update the agent's status based on the response and a list of uncategorized tool call requests.
+        """
+        if self.compaction:
+            compact_messages(messages, self.compaction)
+        dispatched = []
+        try:
+            if self.stream:
+                # A failed stream is only retried when none of its tool calls has started
+                response = await get_scheduler().acall(lambda: self.backend.astream(messages, self._get_tool_schemas().payload, model, lambda tool_call: self._dispatch_early(tool_call, dispatched)), messages, can_retry=lambda: not dispatched)
+            else:
+                response = await get_scheduler().acall(lambda: self.backend.acomplete(messages, self._get_tool_schemas().payload, model), messages)
+        except Exception as e:
+            self._discard_early_results(dispatched)
+            raise RuntimeError(f"Messages: {json.dumps(messages, indent=2)}, Error: {str(e)}")
+
+        if context is not None:
+            context.record_model_call(response.usage)
+        record_usage(current_span(), response.usage, finish_reason=response.finish_reason)
+        status, tool_calls = self._handle_model_response(response, messages)
+        if status != AgentExecutionStatus.RUNNING:
+            self._discard_early_results(dispatched)
+        return status, tool_calls
+
+async def _invoke(func: Callable, *args, **kwargs) -> Any:
+    """
+    Await an `async` tool, or run a synchronous tool in a worker thread, or in the process pool for process tools,
+    so it does not block the event loop.
+    """
+    tool = func._tool
+    if tool.is_async:
+        return await func(*args, **kwargs)
+    if tool.executor == "process":
+        return await get_process_pool().acall(tool.func.__module__, tool.func.__qualname__, args, kwargs, tool.timeout)
+    return await asyncio.to_thread(func, *args, **kwargs)
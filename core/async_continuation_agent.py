@@ -0,0 +1,91 @@
+from core.agent import Agent, TERMINAL_STATUSES, _tool_call_attributes
+from core.tracing import traced, traced_request
+from core.async_agent import AsyncAgent, _invoke
+from core.continuation_agent import ContinuationAgent
+from core.request_context import RequestContext
+from core.scheduler import prioritized_request
+from core.approval_policy import audited_request
+from core.deferred import PendingResult
+from core.tool_arguments import ToolArgumentError
+from core import deferred
+from typing import List, Dict, Any, Tuple
+import asyncio
+
+class AsyncContinuationAgent(AsyncAgent, ContinuationAgent):
+    """
+    asyncio counterpart of `ContinuationAgent`.
+
+    Input parsing, tool categorization and the continuation format are shared with `ContinuationAgent`,
+    so a continuation produced by one can be resumed by the other.
+    """
+    @traced_request
+    @prioritized_request
+    @audited_request
+    async def request(self, input: Dict[str, Any]) -> Dict[str, Any]:
+        tool_statuses = {
+            "_approved_tool_calls": [],
+            "_uncategorized_tool_calls": [],
+            "_unapproved_tool_calls": [],
+            "_rejected_tool_calls": [],
+            "_pending_tool_calls": []
+        }
+        try:
+            messages = self._form_input(input, tool_statuses)
+            return await self._run_turns(messages, tool_statuses)
+        except BaseException:
+            self._restore_taken(tool_statuses)
+            raise
+
+    async def _run_turns(self, messages: List[Dict[str, Any]], tool_statuses: Dict[str, Any]) -> Dict[str, Any]:
+        context = RequestContext()
+        while True:
+            # Check if any suspension conditions are met
+            suspend_list = self._check_suspensions(context)
+            if suspend_list:
+                # If any suspension conditions are met, exit the agent
+                break
+
+            if not (tool_statuses["_approved_tool_calls"] or tool_statuses["_rejected_tool_calls"] or tool_statuses["_pending_tool_calls"] or tool_statuses["_unapproved_tool_calls"]):
+                status, raw_tool_calls = await self._call_model_and_check_status(messages, context=context)
+                if status in TERMINAL_STATUSES:
+                    break
+                self._prepare_tools(raw_tool_calls, tool_statuses)
+            context.tool_calls += len(tool_statuses["_approved_tool_calls"])
+            await self._call_all_tools(tool_statuses, messages)
+
+            if tool_statuses["_unapproved_tool_calls"] or tool_statuses["_rejected_tool_calls"] or tool_statuses["_pending_tool_calls"]:
+                break
+
+        return self._store_response(self._create_response(messages, tool_statuses, suspend_list, context), tool_statuses)
+
+    async def _call_all_tools(self, tool_statuses, messages):
+        results = await self._run_tool_calls(tool_statuses["_approved_tool_calls"])
+        self._apply_tool_results(tool_statuses, results, messages)
+
+    @traced("tool.call", _tool_call_attributes)
+    async def _call_tool(self, tool_call: Dict[str, Any]) -> Tuple[Any, bool]:
+        # The deferred result given on resume
+        if "result" in tool_call:
+            return tool_call["result"], False
+        function_params = tool_call['function']
+        if self.tool_map.get(function_params['name']):
+            func = self.tool_map[function_params['name']]
+            if func._tool.is_agent:
+                if "continuation" in tool_call:
+                    return await _invoke(func, tool_call), True
+                try:
+                    arguments = func._tool.validate_arguments(function_params['arguments'])
+                except ToolArgumentError as e:
+                    # Returned to the model as the result of a plain tool
+                    return str(e), False
+                return await _invoke(func, arguments), True
+            elif func._tool.defer_after:
+                # Runs outside the event loop, so the call survives the end of the request
+                future = deferred.submit(lambda: Agent._invoke_tool(self, func, function_params['arguments']))
+                try:
+                    return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), func._tool.defer_after), False
+                except asyncio.TimeoutError:
+                    return PendingResult({"deferred_after": func._tool.defer_after}, future), False
+            else:
+                return await self._invoke_tool(func, function_params['arguments']), False
+        raise ValueError(f"Tool {function_params['name']} not found in the list of tools.")
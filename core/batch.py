@@ -0,0 +1,159 @@
+from typing import Dict, Any, Optional, Set, Iterator, Tuple, TextIO
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from core.clients import run_async
+import inspect
+import json
+import os
+
+# Responses that wait for an approval or a resume instead of being finished
+PENDING_END_REASONS = ("approval_required", "suspended", "awaiting_tool_result")
+
+class BatchRunner:
+    """
+    Stream a JSONL file of agent inputs through a pool of concurrent workers.
+
+    Every non-empty line of the input file is a request for `agent.request`: a prompt, or a
+    continuation with its `approval_info`. Each line produces one JSONL record
+    `{"line": <line number>, "response": {...}}`, or `{"line": <line number>, "error": "..."}` when the
+    request failed. Responses waiting for an approval or a resume are written to the pending file,
+    when one is given, so that they can be queued for approval.
+
+    With a checkpoint file, the line numbers of the written records are appended to it, and lines already
+    recorded there are skipped, so an interrupted run can be restarted with the same arguments and only
+    processes the unfinished lines. Every line gets exactly one record, failed lines included; they are
+    retried by running a file of those lines again.
+    """
+    def __init__(self, agent: Any, workers: int = 4, order: str = "input", checkpoint_path: Optional[str] = None, pending_path: Optional[str] = None):
+        """
+        Args:
+            agent: The agent handling the requests, `request` may be a coroutine function
+            workers: Number of requests processed at the same time
+            order: "input" to write records in input order, "completion" to write them as soon as they finish
+            checkpoint_path: File recording the finished line numbers, to skip them when resuming
+            pending_path: File receiving the records of responses waiting for an approval or a resume
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if order not in ("input", "completion"):
+            raise ValueError(f"Unknown order {order}, expected 'input' or 'completion'")
+        self.agent = agent
+        self.workers = workers
+        self.order = order
+        self.checkpoint_path = checkpoint_path
+        self.pending_path = pending_path
+
+    def run(self, input_path: str, output_path: str) -> Dict[str, int]:
+        """
+        Process the input file, appending the records to the output files.
+
+        Args:
+            input_path: The JSONL file of requests
+            output_path: The JSONL file receiving the records
+
+        Returns:
+            Dict[str, int]: The number of completed, pending, failed and skipped lines
+        """
+        done = self._read_checkpoint()
+        summary = {"completed": 0, "pending": 0, "errors": 0, "skipped": 0}
+        # Line numbers submitted but not written yet, in input order, and the finished records among them.
+        # Bounding the unwritten lines, rather than the running ones, also bounds the records held back
+        # behind a slow line when writing in input order.
+        unwritten = deque()
+        finished: Dict[int, Dict[str, Any]] = {}
+        futures = {}
+        window = self.workers * 2
+
+        with open(input_path, "r") as input_file, \
+             open(output_path, "a") as output_file, \
+             _open_optional(self.pending_path) as pending_file, \
+             _open_optional(self.checkpoint_path) as checkpoint_file, \
+             ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-worker") as pool:
+
+            def write(record: Dict[str, Any]):
+                try:
+                    encoded = json.dumps(record, default=str)
+                except (TypeError, ValueError) as e:
+                    # Such as circular references, one response must not stop the run
+                    record = {"line": record["line"], "error": f"Unserializable response: {type(e).__name__}: {e}"}
+                    encoded = json.dumps(record)
+                target = output_file
+                if "error" in record:
+                    summary["errors"] += 1
+                elif record["response"].get("end_reason") in PENDING_END_REASONS:
+                    summary["pending"] += 1
+                    target = pending_file or output_file
+                else:
+                    summary["completed"] += 1
+                target.write(encoded + "\n")
+                target.flush()
+                # The checkpoint is only written once the record is safely on disk, so a line is never
+                # recorded twice
+                if checkpoint_file:
+                    checkpoint_file.write(f"{record['line']}\n")
+                    checkpoint_file.flush()
+
+            def collect(block: bool):
+                if block:
+                    completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                else:
+                    completed = [future for future in futures if future.done()]
+                for future in completed:
+                    line_number = futures.pop(future)
+                    if self.order == "completion":
+                        unwritten.remove(line_number)
+                        write(future.result())
+                    else:
+                        finished[line_number] = future.result()
+                while unwritten and unwritten[0] in finished:
+                    write(finished.pop(unwritten.popleft()))
+
+            for line_number, line in _numbered_lines(input_file):
+                if line_number in done:
+                    summary["skipped"] += 1
+                    continue
+                while len(unwritten) >= window:
+                    collect(block=True)
+                futures[pool.submit(self._process, line_number, line)] = line_number
+                unwritten.append(line_number)
+                collect(block=False)
+            while futures:
+                collect(block=True)
+
+        return summary
+
+    def _process(self, line_number: int, line: str) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+            response = self.agent.request(request)
+            if inspect.isawaitable(response):
+                response = run_async(response)
+            return {"line": line_number, "response": response}
+        except Exception as e:
+            return {"line": line_number, "error": f"{type(e).__name__}: {e}"}
+
+    def _read_checkpoint(self) -> Set[int]:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path, "r") as f:
+            return set(int(line) for line in f if line.strip())
+
+def _numbered_lines(input_file: TextIO) -> Iterator[Tuple[int, str]]:
+    for line_number, line in enumerate(input_file, start=1):
+        if line.strip():
+            yield line_number, line
+
+class _open_optional:
+    """Open a file for appending when a path is given, `None` otherwise."""
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.file = None
+
+    def __enter__(self) -> Optional[TextIO]:
+        if self.path:
+            self.file = open(self.path, "a")
+        return self.file
+
+    def __exit__(self, *exc_info):
+        if self.file:
+            self.file.close()
@@ -0,0 +1,183 @@
+from typing import Dict, Any, Optional, Awaitable
+import threading
+import weakref
+import atexit
+import json
+
+class ClientRegistry:
+    """
+    Process-wide registry of pooled OpenAI clients.
+
+    Clients are created on first use and shared by every backend asking for the same configuration,
+    so nested agents reuse the same keep-alive connections. Each client owns an HTTP connection pool
+    bounded by `max_connections`.
+
+    The connections of an async client belong to the event loop that opened them, so async clients are
+    shared per event loop. `aclose_loop()` closes the clients of the running loop before it ends, as
+    `run_async` does; the entries of loops closed without it are dropped when the next loop asks for a client.
+    """
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20):
+        """
+        Args:
+            max_connections: Maximum number of concurrent connections of each client
+            max_keepalive_connections: Maximum number of idle connections kept open by each client
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self._clients: Dict[str, Any] = {}
+        # The clients reference their loop, so an entry outlives its loop until it is closed or pruned
+        self._async_clients: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def configure(self, max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None):
+        """
+        Change the connection limits of the clients created from now on.
+        """
+        with self._lock:
+            if max_connections is not None:
+                self.max_connections = max_connections
+            if max_keepalive_connections is not None:
+                self.max_keepalive_connections = max_keepalive_connections
+
+    def get(self, kind: str = "sync", **config) -> Any:
+        """
+        Get the shared client of a configuration, creating it on first use.
+
+        Args:
+            kind: "sync" for `OpenAI`, "async" for `AsyncOpenAI`
+            **config: Keyword arguments of the client constructor, such as `api_key` or `base_url`
+
+        Returns:
+            Any: The client
+
+        Raises:
+            RuntimeError: If an async client is asked for outside of a running event loop
+        """
+        if kind not in ("sync", "async"):
+            raise ValueError(f"Unknown client kind {kind}, expected 'sync' or 'async'")
+        key = _config_key(config)
+        if kind == "async":
+            import asyncio
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise RuntimeError("Async clients are shared per event loop and can only be taken from a running loop") from None
+            with self._lock:
+                clients = self._async_clients.get(loop)
+                if clients is None:
+                    self._prune_closed_loops()
+                    clients = self._async_clients[loop] = {}
+                client = clients.get(key)
+                if client is None:
+                    client = clients[key] = self._create(kind, config)
+            return client
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._create(kind, config)
+        return client
+
+    def _create(self, kind: str, config: Dict[str, Any]) -> Any:
+        # Imported on the first model call, so importing the framework does not pay for the SDK
+        from openai import OpenAI, AsyncOpenAI
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive_connections)
+        # The model call scheduler retries within the rate limits, the SDK retrying as well would bypass them
+        config = {"max_retries": 0, **config}
+        if kind == "async":
+            return AsyncOpenAI(http_client=httpx.AsyncClient(limits=limits), **config)
+        return OpenAI(http_client=httpx.Client(limits=limits), **config)
+
+    def _prune_closed_loops(self):
+        # Called with the lock held. The connections of a closed loop cannot be used or closed anymore
+        for loop in [loop for loop in self._async_clients if loop.is_closed()]:
+            del self._async_clients[loop]
+
+    def close(self):
+        """
+        Close every client and its connections. Clients are created again if they are used afterwards.
+
+        Async clients are closed on their own loop: in the background for the running loop and the loops
+        running in other threads. The clients of a loop that is not running are dropped, their connections
+        can only be closed by that loop, with `aclose_loop()`, before it ends.
+        """
+        import asyncio
+
+        with self._lock:
+            clients, self._clients = self._clients, {}
+            async_clients, self._async_clients = dict(self._async_clients), weakref.WeakKeyDictionary()
+        for client in clients.values():
+            client.close()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for loop, loop_clients in async_clients.items():
+            if loop is running:
+                asyncio.ensure_future(_close_all(loop_clients.values()))
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(_close_all(loop_clients.values()), loop)
+
+    async def aclose(self):
+        """
+        asyncio counterpart of `close`, awaiting the async clients of the running event loop.
+        """
+        import asyncio
+
+        with self._lock:
+            clients, self._clients = self._clients, {}
+            async_clients, self._async_clients = dict(self._async_clients), weakref.WeakKeyDictionary()
+        for client in clients.values():
+            client.close()
+        running = asyncio.get_running_loop()
+        for loop, loop_clients in async_clients.items():
+            if loop is running:
+                await _close_all(loop_clients.values())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(_close_all(loop_clients.values()), loop)
+
+    async def aclose_loop(self):
+        """
+        Close the async clients of the running event loop and forget them, the sync clients and the
+        clients of other loops are kept. Await it at the end of the coroutine run by `asyncio.run`.
+        """
+        import asyncio
+
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        await _close_all(clients.values())
+
+async def _close_all(clients):
+    import asyncio
+
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+_registry = ClientRegistry()
+atexit.register(_registry.close)
+
+def _config_key(config: Dict[str, Any]) -> str:
+    # Canonical JSON, so dictionary values such as default_headers can be part of the key
+    return json.dumps(config, sort_keys=True, default=repr)
+
+def run_async(awaitable: Awaitable[Any]) -> Any:
+    """
+    Run an awaitable to completion in a new event loop, like `asyncio.run`, closing the async clients
+    the loop opened before it ends.
+    """
+    import asyncio
+
+    async def main():
+        try:
+            return await awaitable
+        finally:
+            await _registry.aclose_loop()
+    return asyncio.run(main())
+
+def get_client_registry() -> ClientRegistry:
+    """
+    The process-wide client registry, closed when the interpreter exits.
+    """
+    return _registry
@@ -0,0 +1,113 @@
+from typing import List, Dict, Any, Callable, Optional
+from abc import ABC, abstractmethod
+
+class CompactionStrategy(ABC):
+    """
+    Shrinks the conversation in place before each model call.
+
+    The compacted messages are the ones kept in the conversation, so continuations created
+    afterwards carry the compacted conversation too. Strategies never separate an assistant message
+    with tool calls from the tool messages answering it.
+
+    Subclasses implement `compact`.
+    """
+    @abstractmethod
+    def compact(self, messages: List[Dict[str, Any]]):
+        """
+        Compact the conversation.
+
+        Args:
+            messages: The conversation, modified in place
+        """
+
+class KeepLastTurns(CompactionStrategy):
+    """
+    Keep the developer prompt, the first user message and the last `turns` turns of the conversation.
+
+    A turn is a user message, or an assistant message followed by the tool messages answering its tool calls.
+    """
+    def __init__(self, turns: int = 10, keep_first_user: bool = True):
+        """
+        Args:
+            turns: Number of most recent turns kept
+            keep_first_user: Also keep the first user message, usually the task of the conversation
+        """
+        if turns < 1:
+            raise ValueError("turns must be at least 1")
+        self.turns = turns
+        self.keep_first_user = keep_first_user
+
+    def compact(self, messages: List[Dict[str, Any]]):
+        head = _head_length(messages, self.keep_first_user)
+        starts = _turn_starts(messages, head)
+        if len(starts) > self.turns:
+            del messages[head:starts[-self.turns]]
+
+class TruncateToolOutputs(CompactionStrategy):
+    """
+    Shorten the tool outputs older than the last `keep_turns` turns to at most `max_chars` characters,
+    or replace them with a summary.
+    """
+    def __init__(self, max_chars: int = 2000, keep_turns: int = 1, summarize: Optional[Callable[[str], str]] = None):
+        """
+        Args:
+            max_chars: Maximum length of an old tool output
+            keep_turns: Number of most recent turns whose tool outputs are left intact
+            summarize: Called with a tool output longer than `max_chars` to get its replacement, the output
+                is truncated when omitted. The replacement is cut to `max_chars` as well.
+        """
+        if max_chars < 1:
+            raise ValueError("max_chars must be at least 1")
+        if keep_turns < 0:
+            raise ValueError("keep_turns must not be negative")
+        self.max_chars = max_chars
+        self.keep_turns = keep_turns
+        self.summarize = summarize
+
+    def compact(self, messages: List[Dict[str, Any]]):
+        starts = _turn_starts(messages, _head_length(messages, True))
+        if not self.keep_turns:
+            end = len(messages)
+        elif len(starts) > self.keep_turns:
+            end = starts[-self.keep_turns]
+        else:
+            return
+        for message in messages[:end]:
+            content = message.get("content")
+            if message.get("role") == "tool" and isinstance(content, str) and len(content) > self.max_chars:
+                if self.summarize is not None:
+                    content = self.summarize(content)
+                message["content"] = _truncate(content, self.max_chars)
+
+def compact_messages(messages: List[Dict[str, Any]], strategies: List[CompactionStrategy]):
+    """
+    Apply compaction strategies in order.
+
+    Args:
+        messages: The conversation, modified in place
+        strategies: The strategies to apply
+    """
+    for strategy in strategies:
+        strategy.compact(messages)
+
+def _head_length(messages: List[Dict[str, Any]], keep_first_user: bool) -> int:
+    # The leading developer/system messages, and the first user message following them
+    head = 0
+    while head < len(messages) and messages[head].get("role") in ("developer", "system"):
+        head += 1
+    if keep_first_user and head < len(messages) and messages[head].get("role") == "user":
+        head += 1
+    return head
+
+def _turn_starts(messages: List[Dict[str, Any]], head: int) -> List[int]:
+    # Tool messages belong to the turn of the assistant message calling them
+    return [i for i in range(head, len(messages)) if messages[i].get("role") != "tool"]
+
+def _truncate(content: str, max_chars: int) -> str:
+    if len(content) <= max_chars:
+        return content
+    # The marker is counted in max_chars, so compacting again leaves the output unchanged
+    marker = f"\n[{len(content)} characters, truncated]"
+    if len(marker) >= max_chars:
+        return content[:max_chars]
+    return content[:max_chars - len(marker)] + marker
@@ -1,60 +1,152 @@
-from core.agent import Agent, AgentExecutionStatus, TERMINAL_STATUSES
-from typing import List, Dict, Any, Tuple, Callable
-import json
+from core.agent import Agent, AgentExecutionStatus, TERMINAL_STATUSES, _resolve, _tool_call_attributes, is_agent_tool_call
+from core.tracing import traced, traced_request
+from core.model_backend import ModelBackend
+from core.request_context import RequestContext
+from core.scheduler import prioritized_request
+from core.approval_policy import ApprovalPolicy, APPROVE, REJECT, ASK, compile_policies, parse_arguments, current_caller, record_decision, audited_request
+from core.continuation_store import ContinuationStore
+from core.compaction import CompactionStrategy
+from core.suspend_function import accepts_context
+from core.tool_arguments import ToolArgumentError
+from core.deferred import PendingResult
+from core import serialization, deferred
+from typing import List, Dict, Any, Tuple, Callable, Optional, Union, BinaryIO
+import copy
 
 class ContinuationAgent(Agent):
-    def __init__(self, instruction: str, tools: List[Callable], suspension_list: List[Callable]=[]):
-        super().__init__(instruction, tools)
+    def __init__(self, instruction: str, tools: List[Callable], suspension_list: List[Callable]=[], max_concurrency: int = 1, compact_continuations: bool = False, backend: Optional[ModelBackend] = None, stream: bool = False, store: Optional[ContinuationStore] = None, trace: bool = False, compaction: Optional[Union[CompactionStrategy, List[CompactionStrategy]]] = None, partial_approvals: bool = False, approval_policies: Optional[List[ApprovalPolicy]] = None):
+        """
+        Initialize a new ContinuationAgent.
+        
+        Args:
+            instruction: The system prompt for the agent
+            tools: List of tools the agent can use
+            suspension_list: Suspension functions checked at the beginning of every Agent loop, the functions
+                accepting an argument receive the `RequestContext` of the request
+            max_concurrency: Maximum number of tool calls of a single turn executed at the same time
+            compact_continuations: Strip null fields from the continuation and let `approval_info` entries
+                refer to their tool call by `path_ids` only, instead of embedding the tool call and tool names
+            backend: The model backend, the process-wide default backend when omitted
+            stream: Stream the model responses and start the tool calls that do not need approval
+                as soon as their arguments are complete
+            store: Keep the continuations in this store and return a `continuation_id` handle instead of the
+                continuation. Ignored while the agent runs as the tool of another agent, sub-agents return their
+                continuation to the parent
+            trace: Attach a timing and token summary of the request, sub-agents included, to the `trace` field
+                of the top-level responses, see `core.tracing`
+            compaction: Compaction strategies shrinking the conversation in place before each model call,
+                see `core.compaction`. Continuations carry the compacted conversation.
+            partial_approvals: Accept resumes where only some `approval_info` entries are decided. The approved
+                tool calls run right away, the undecided ones (`approved` left null) stay pending in a new, smaller
+                continuation, and the rejected ones are answered to the model with a tool message instead of
+                ending the request with `rejected_tool_calls`. Set it on every agent of a nested tree.
+            approval_policies: Policies approving or rejecting the calls of their tool from the arguments and the
+                caller, see `core.approval_policy`. Only the calls they leave undecided wait for a human approval,
+                the rejected ones are answered to the model with a tool message.
+        """
+        super().__init__(instruction, tools, max_concurrency=max_concurrency, backend=backend, stream=stream, trace=trace, compaction=compaction)
         self.suspension_list = suspension_list
+        self.compact_continuations = compact_continuations
+        self.store = store
+        self.partial_approvals = partial_approvals
+        self.approval_policies = compile_policies(approval_policies or [], self.tool_map)
+        # Decisions of the tool calls evaluated while the model response was streaming, keyed by tool call id
+        self._early_decisions = {}
         
+    @traced_request
+    @prioritized_request
+    @audited_request
     def request(self, input: Dict[str, Any]) -> Dict[str, Any]:
         tool_statuses = {
             "_approved_tool_calls": [],
             "_uncategorized_tool_calls": [],
             "_unapproved_tool_calls": [],
-            "_rejected_tool_calls": []
+            "_rejected_tool_calls": [],
+            "_pending_tool_calls": []
         }
-        messages = self._form_input(input, tool_statuses)
+        try:
+            messages = self._form_input(input, tool_statuses)
+            return self._run_turns(messages, tool_statuses)
+        except BaseException:
+            self._restore_taken(tool_statuses)
+            raise
+
+    def _run_turns(self, messages: List[Dict[str, Any]], tool_statuses: Dict[str, Any]) -> Dict[str, Any]:
+        context = RequestContext()
         while True:
             # Check if any suspension conditions are met
-            suspend_list = [suspend.__name__ for suspend in self.suspension_list if suspend()]
+            suspend_list = self._check_suspensions(context)
             if suspend_list:
                 # If any suspension conditions are met, exit the agent
                 break
 
-            if not tool_statuses["_approved_tool_calls"] and not tool_statuses["_rejected_tool_calls"]:
-                status, raw_tool_calls = self._call_model_and_check_status(messages)
+            # Resumed tool calls are executed before the model is called again, unless some are still pending
+            if not (tool_statuses["_approved_tool_calls"] or tool_statuses["_rejected_tool_calls"] or tool_statuses["_pending_tool_calls"] or tool_statuses["_unapproved_tool_calls"]):
+                status, raw_tool_calls = self._call_model_and_check_status(messages, context=context)
                 if status in TERMINAL_STATUSES:
                     break
                 self._prepare_tools(raw_tool_calls, tool_statuses)
+            context.tool_calls += len(tool_statuses["_approved_tool_calls"])
             self._call_all_tools(tool_statuses, messages)
             
-            if tool_statuses["_unapproved_tool_calls"] or tool_statuses["_rejected_tool_calls"]:
+            if tool_statuses["_unapproved_tool_calls"] or tool_statuses["_rejected_tool_calls"] or tool_statuses["_pending_tool_calls"]:
                 break
             
-        return self._create_response(messages, tool_statuses, suspend_list)
+        return self._store_response(self._create_response(messages, tool_statuses, suspend_list, context), tool_statuses)
+    
+    @traced("suspension.check")
+    def _check_suspensions(self, context: RequestContext) -> List[str]:
+        """
+        Call the suspension functions, passing the request context to the ones accepting an argument.
+        
+        Returns:
+            List[str]: The names of the functions asking for a suspension
+        """
+        return [suspend.__name__ for suspend in self.suspension_list if (suspend(context) if accepts_context(suspend) else suspend())]
     
-    def _create_response(self, messages: List[Dict[str, Any]], tool_statuses: Dict[str, Any], suspend_list: List[str]) -> Dict[str, Any]:
+    def _create_response(self, messages: List[Dict[str, Any]], tool_statuses: Dict[str, Any], suspend_list: List[str], context: Optional[RequestContext] = None) -> Dict[str, Any]:
         if suspend_list:
-            return {
-                "continuation": {
-                    "messages": messages
-                },
+            continuation = {"messages": messages}
+            response = {
+                "continuation": _strip_nulls(continuation) if self.compact_continuations else continuation,
                 "suspend_list": suspend_list,
                 "end_reason": "suspended"
             }
-        if tool_statuses["_unapproved_tool_calls"]:
+            # Tell which budgets made the built-in suspension functions fire
+            budgets = {name: context.budgets[name] for name in suspend_list if name in context.budgets} if context else {}
+            if budgets:
+                response["suspend_budgets"] = budgets
+            return response
+        if tool_statuses["_unapproved_tool_calls"] or tool_statuses["_pending_tool_calls"]:
+            # Tool calls awaiting a result are already approved, they only wait for their result on resume
+            undecided = None if self.partial_approvals else False
             continuation = {
                 "messages": messages,
-                "resume_request": tool_statuses["_unapproved_tool_calls"],
-                "processed": [{"id": tc['id'], "approved": False} for tc in tool_statuses["_unapproved_tool_calls"]]
+                "resume_request": tool_statuses["_unapproved_tool_calls"] + tool_statuses["_pending_tool_calls"],
+                "processed": [{"id": tc['id'], "approved": undecided} for tc in tool_statuses["_unapproved_tool_calls"]]
+                    + [{"id": tc['id'], "approved": True} for tc in tool_statuses["_pending_tool_calls"]]
             }
-            return {
+            if self.compact_continuations:
+                # The pending tool calls are referenced by id, their definition lives in the last assistant message
+                continuation["resume_request"] = [{key: value for key, value in tc.items() if key not in ("function", "type")} for tc in continuation["resume_request"]]
+                continuation = _strip_nulls(continuation)
+            pending_tool_calls = []
+            approval_info = ContinuationAgent.__flatten_continuation_obj(continuation, self.compact_continuations, pending_tool_calls, undecided)
+            if not tool_statuses["_unapproved_tool_calls"]:
+                return {
+                    "continuation": continuation,
+                    "pending_tool_calls": pending_tool_calls,
+                    "end_reason": "awaiting_tool_result"
+                }
+            response = {
                 "continuation": continuation,
-                "approval_info": ContinuationAgent.__flatten_continuation_obj(continuation),
+                "approval_info": approval_info,
                 "end_reason": "approval_required"
             }
-            
+            if pending_tool_calls:
+                response["pending_tool_calls"] = pending_tool_calls
+            return response
+
         elif tool_statuses["_rejected_tool_calls"]:
             return {
                 "messages": messages,
@@ -63,23 +155,102 @@ class ContinuationAgent(Agent):
             }
         else:
             return {
-                "result": messages[-1]['content'],
+                "result": messages[-1].get('content'),
                 "messages": messages,
                 "end_reason": "completed"
             }
     
+    def _store_response(self, response: Dict[str, Any], tool_statuses: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Move the continuation of a response to the store, leaving its `continuation_id` in its place.
+
+        Sub-agents return their continuation to the parent, which nests it in its own, so the store is
+        only used by the top-level agent.
+        """
+        if self.store is None or "continuation" not in response or is_agent_tool_call():
+            return response
+        stored = {"continuation_id": self.store.put(response["continuation"])}
+        stored.update((key, value) for key, value in response.items() if key != "continuation")
+        return stored
+    
     def _prepare_tools(self, uncategorized_tool_calls: List[Dict[str, Any]], tool_statuses: Dict[str, Any]):
-        # Filter out tools that require approval
-        tool_statuses["_approved_tool_calls"] = [tool for tool in uncategorized_tool_calls if not self._check_tool_requires_approval(tool['function']['name'])]
-        tool_statuses["_unapproved_tool_calls"] = [tool for tool in uncategorized_tool_calls if self._check_tool_requires_approval(tool['function']['name'])]
+        # Decide every tool call once, the ones left to a human wait for approval
+        approved, unapproved = [], []
+        for tool_call in uncategorized_tool_calls:
+            decision = self._decide_approval(tool_call)
+            if decision == ASK:
+                unapproved.append(tool_call)
+                continue
+            if decision == REJECT:
+                # Answered to the model like a rejection on resume, without ending the request
+                tool_call["result"] = REJECTED_TOOL_CALL_MESSAGE
+            approved.append(tool_call)
+        tool_statuses["_approved_tool_calls"] = approved
+        tool_statuses["_unapproved_tool_calls"] = unapproved
         tool_statuses["_uncategorized_tool_calls"] = []
     
+    def _decide_approval(self, tool_call: Dict[str, Any]) -> str:
+        """
+        Decide a tool call with the approval policy of its tool, or with its `need_approval` flag, and record
+        the decisions of the policies in the audit trail of the request.
+        
+        A tool call decided while the model response was streaming is not evaluated again.
+        
+        Args:
+            tool_call: The tool call
+            
+        Returns:
+            str: "approve", "reject", or "ask" when the call waits for a human approval
+        """
+        decision = self._early_decisions.pop(tool_call['id'], None) if self._early_decisions else None
+        if decision is None:
+            decision = self._evaluate_approval(tool_call)
+        if "reason" in decision and decision["decision"] != ASK:
+            record_decision(tool_call, decision)
+        return decision["decision"]
+    
+    def _evaluate_approval(self, tool_call: Dict[str, Any]) -> Dict[str, str]:
+        # The decision of the policy with its reason, or the need_approval flag of the tool without one
+        policy = self.approval_policies.get(tool_call['function']['name'])
+        if policy is not None:
+            arguments = parse_arguments(tool_call)
+            decision = policy.evaluate(arguments, current_caller()) if arguments is not None else None
+            if decision is not None:
+                return decision
+        return {"decision": ASK if self._check_tool_requires_approval(tool_call['function']['name']) else APPROVE}
+    
+    def _can_dispatch_early(self, tool_call: Dict[str, Any]) -> bool:
+        if not super()._can_dispatch_early(tool_call):
+            return False
+        # Kept for _prepare_tools, so every tool call is evaluated once
+        decision = self._early_decisions[tool_call['id']] = self._evaluate_approval(tool_call)
+        return decision["decision"] == APPROVE
+    
+    def _discard_early_results(self, dispatched: List[str]):
+        super()._discard_early_results(dispatched)
+        for tool_call_id in dispatched:
+            self._early_decisions.pop(tool_call_id, None)
+    
     def _call_all_tools(self, tool_statuses, messages):
-        for tool_call in tool_statuses["_approved_tool_calls"]:
-            result, is_agent = self._call_tool(tool_call)
+        results = self._run_tool_calls(tool_statuses["_approved_tool_calls"])
+        self._apply_tool_results(tool_statuses, results, messages)
+    
+    def _apply_tool_results(self, tool_statuses: Dict[str, Any], results: List[Tuple[Any, bool]], messages: List[Dict[str, Any]]):
+        # Results are processed in the original tool call order, whichever finished first
+        for tool_call, (result, is_agent) in zip(tool_statuses["_approved_tool_calls"], results):
+            # If the tool deferred its result, wait for it on resume
+            if isinstance(result, PendingResult):
+                tool_call['pending'] = result.info if result.info is not None else {}
+                if result.future is not None:
+                    deferred.track(tool_call['id'], result.future)
+                tool_statuses["_pending_tool_calls"].append(tool_call)
             # If tool call is not from an agent, append the result to messages
-            if not is_agent:
+            elif not is_agent:
                 messages.append({"role": "tool", "tool_call_id": tool_call['id'], "content": result})
+            # If the sub-agent only awaits tool results, it is resumed without approvals
+            elif result.get('continuation') and result.get('end_reason') == "awaiting_tool_result":
+                tool_call['continuation'] = result['continuation']
+                tool_statuses["_pending_tool_calls"].append(tool_call)
             # If the tool call contains continuation
             elif result.get('continuation'):
                 tool_call['continuation'] = result['continuation']
@@ -91,35 +262,131 @@ class ContinuationAgent(Agent):
             else: 
                 messages.append({"role": "tool", "tool_call_id": tool_call['id'], "content": result['result']})
         tool_statuses["_approved_tool_calls"] = []
+        if self.partial_approvals:
+            # The model is told about the rejections and carries on
+            for tool_call in tool_statuses["_rejected_tool_calls"]:
+                messages.append({"role": "tool", "tool_call_id": tool_call['id'], "content": REJECTED_TOOL_CALL_MESSAGE})
+            tool_statuses["_rejected_tool_calls"] = []
             
+    @traced("tool.call", _tool_call_attributes)
     def _call_tool(self, tool_call: Dict[str, Any]) -> Tuple[Any, bool]:
+        # The deferred result given on resume
+        if "result" in tool_call:
+            return tool_call["result"], False
         function_params = tool_call['function']
         if self.tool_map.get(function_params['name']):
             func = self.tool_map[function_params['name']]
             if func._tool.is_agent:
                 if "continuation" in tool_call:
-                    return func(tool_call), True
-                return func(json.loads(function_params['arguments'])), True
+                    return _resolve(func(tool_call)), True
+                try:
+                    arguments = func._tool.validate_arguments(function_params['arguments'])
+                except ToolArgumentError as e:
+                    # Returned to the model as the result of a plain tool
+                    return str(e), False
+                return _resolve(func(arguments)), True
+            elif func._tool.defer_after:
+                return deferred.run_deferrable(lambda: self._invoke_tool(func, function_params['arguments']), func._tool.defer_after), False
             else:
-                return func(**json.loads(function_params['arguments'])), False
+                return self._invoke_tool(func, function_params['arguments']), False
         raise ValueError(f"Tool {function_params['name']} not found in the list of tools.")
     
+    @staticmethod
+    def dumps(response: Dict[str, Any], codec: Optional[str] = None, compression: Optional[str] = None) -> bytes:
+        """
+        Encode a response, or a request built from one, into a versioned compressed binary envelope.
+        
+        The envelope can be passed back to `request` as is, or as the value of the `continuation` key.
+        
+        Args:
+            response: The response or continuation to encode
+            codec: "json" or "msgpack", msgpack when installed by default
+            compression: "none", "zlib" or "zstd", zstd when installed by default
+            
+        Returns:
+            bytes: The envelope
+        """
+        return serialization.encode(response, codec=codec, compression=compression)
+    
+    @staticmethod
+    def loads(data: Union[bytes, BinaryIO]) -> Dict[str, Any]:
+        """
+        Decode an envelope created by `dumps`, from bytes or streamed from a binary file object.
+        
+        Args:
+            data: The envelope
+            
+        Returns:
+            Dict[str, Any]: The decoded response or continuation
+        """
+        return serialization.decode(data)
+    
     def _form_input(self, input, tools_statuses: Dict[str, Any]):
         messages = []
+        if not isinstance(input, dict) and serialization.is_envelope(input):
+            input = serialization.decode(input)
+        elif not isinstance(input.get("continuation", {}), dict) and serialization.is_envelope(input["continuation"]):
+            input = {**input, "continuation": serialization.decode(input["continuation"])}
+        elif "continuation_id" in input:
+            if self.store is None:
+                raise ValueError("A continuation_id was given but the agent has no continuation store")
+            # Taken out of the store, so concurrent resumes of the same id do not both run the tools
+            continuation = self.store.take(input["continuation_id"])
+            tools_statuses["_taken_continuation"] = (input["continuation_id"], copy.deepcopy(continuation))
+            input = {**input, "continuation": continuation}
         if "continuation" in input:
             messages = input["continuation"]["messages"]
             approval_info = input.get("approval_info", [])
             continuation = input["continuation"]
             continuation = ContinuationAgent.__reconstruct_continuation_obj(approval_info, continuation)
-            ContinuationAgent.__prepare_tools_from_resume_request(continuation.get('resume_request', []), continuation.get("processed", []), tools_statuses)
+            if input.get("tool_results"):
+                ContinuationAgent.__attach_tool_results(input["tool_results"], continuation)
+            ContinuationAgent.__prepare_tools_from_resume_request(_expand_resume_request(continuation), continuation.get("processed", []), tools_statuses, self.partial_approvals)
                 
         else:
             messages = super()._form_input(input)   
         return messages
     
+    def _restore_taken(self, tool_statuses: Dict[str, Any]):
+        # The resume failed, the continuation it took from the store can be resumed again
+        taken = tool_statuses.pop("_taken_continuation", None)
+        if taken is not None:
+            self.store.restore(*taken)
+
+    @staticmethod
+    def find_tool_call(continuation: Dict[str, Any], path_ids: List[str]) -> Dict[str, Any]:
+        """
+        Resolve the `path_ids` of an `approval_info` entry to the tool call it refers to.
+        
+        Args:
+            continuation: The continuation object the approval info was created from
+            path_ids: The tool call ids leading from the outermost agent to the tool call
+            
+        Returns:
+            Dict[str, Any]: The tool call
+            
+        Raises:
+            ValueError: If no tool call matches the path
+        """
+        tool_call = None
+        for tool_call_id in path_ids:
+            if tool_call is not None:
+                continuation = tool_call.get("continuation", {})
+            tool_call = next((req for req in continuation.get("resume_request", []) if req["id"] == tool_call_id), None)
+            if tool_call is None:
+                raise ValueError(f"Tool call {tool_call_id} not found in the continuation")
+            if "function" not in tool_call:
+                tool_call = _expand_resume_request(continuation)[[req["id"] for req in continuation["resume_request"]].index(tool_call_id)]
+        if tool_call is None:
+            raise ValueError("path_ids must not be empty")
+        return tool_call
+    
     @staticmethod
-    def __flatten_helper(continuation_obj: Dict[str, Any], current_path: List[str], current_id_path: List[str], flattened_list: List[Dict[str, Any]]):
+    def __flatten_helper(continuation_obj: Dict[str, Any], current_path: List[str], current_id_path: List[str], flattened_list: List[Dict[str, Any]], compact: bool = False, pending_list: Optional[List[Dict[str, Any]]] = None, undecided: Optional[bool] = False):
         if not continuation_obj.get("resume_request") and continuation_obj.get("messages"):
+            if compact:
+                flattened_list.append({"path_ids": list(current_id_path), "approved": True})
+                return
             flattened_list.append({
                 "paths": list(current_path),
                 "path_ids": list(current_id_path),
@@ -129,70 +396,174 @@ class ContinuationAgent(Agent):
         if not continuation_obj.get("resume_request"):
             return
         for req in continuation_obj["resume_request"]:
-            current_path.append(req["function"]["name"])
+            current_path.append(req["function"]["name"] if "function" in req else None)
             current_id_path.append(req["id"])
             if req.get("continuation"):
-                ContinuationAgent.__flatten_helper(req["continuation"], current_path, current_id_path, flattened_list)
+                ContinuationAgent.__flatten_helper(req["continuation"], current_path, current_id_path, flattened_list, compact, pending_list, undecided)
+            elif "pending" in req:
+                # Awaiting its result, not an approval
+                if pending_list is not None:
+                    entry = {"path_ids": list(current_id_path), "info": req["pending"]}
+                    if not compact:
+                        entry = {"paths": list(current_path), **entry, "tool_call": req}
+                    pending_list.append(entry)
+            elif compact:
+                flattened_list.append({"path_ids": list(current_id_path), "approved": undecided})
             else:
                 flattened_list.append({
                     "paths": list(current_path),
                     "path_ids": list(current_id_path),
                     "tool_call": req,
-                    "approved": False
+                    "approved": undecided
                 })
             current_path.pop()
             current_id_path.pop()
     
     @staticmethod
-    def __flatten_continuation_obj(continuation_obj: Dict[str, Any]) -> List[Dict[str, Any]]:
+    @traced("continuation.flatten")
+    def __flatten_continuation_obj(continuation_obj: Dict[str, Any], compact: bool = False, pending_list: Optional[List[Dict[str, Any]]] = None, undecided: Optional[bool] = False) -> List[Dict[str, Any]]:
         flattened_result = []
-        ContinuationAgent.__flatten_helper(continuation_obj, [], [], flattened_result)
+        ContinuationAgent.__flatten_helper(continuation_obj, [], [], flattened_result, compact, pending_list, undecided)
         return flattened_result
     
     @staticmethod
-    def __prepare_tools_from_resume_request(resume_requests: List[Dict[str, Any]], processed_list: List[Dict[str, Any]], tool_statuses: Dict[str, Any]):
-        approved_list = set(item['id'] for item in processed_list if item.get("approved"))
-        tool_statuses['_approved_tool_calls'] = [req for req in resume_requests if req['id'] in approved_list]
-        rejected_list = set(item['id'] for item in processed_list if not item.get("approved"))
-        tool_statuses['_rejected_tool_calls'] = [req for req in resume_requests if req['id'] in rejected_list]
-        if len(tool_statuses['_approved_tool_calls']) + len(tool_statuses['_rejected_tool_calls']) != len(resume_requests):
-            raise ValueError("Some requests are neither approved nor rejected")
+    def __prepare_tools_from_resume_request(resume_requests: List[Dict[str, Any]], processed_list: List[Dict[str, Any]], tool_statuses: Dict[str, Any], partial: bool = False):
+        if partial:
+            decisions = {item['id']: item.get("approved") for item in reversed(processed_list)}
+        else:
+            decisions = {item['id']: bool(item.get("approved")) for item in reversed(processed_list)}
+        tool_statuses['_approved_tool_calls'] = []
+        tool_statuses['_rejected_tool_calls'] = []
+        tool_statuses['_pending_tool_calls'] = []
+        tool_statuses['_unapproved_tool_calls'] = []
+        for req in resume_requests:
+            decision = decisions.get(req['id'])
+            if decision is None:
+                if not partial:
+                    raise ValueError("Some requests are neither approved nor rejected")
+                # Left undecided, it stays in the continuation
+                tool_statuses['_unapproved_tool_calls'].append(req)
+                continue
+            if decision and "pending" in req and "result" not in req:
+                # A deferred call still running in this process may have finished since
+                polled = deferred.poll_result(req['id'])
+                if polled is None:
+                    tool_statuses['_pending_tool_calls'].append(req)
+                    continue
+                req["result"] = polled["result"]
+            tool_statuses['_approved_tool_calls' if decision else '_rejected_tool_calls'].append(req)
     
     @staticmethod
+    @traced("continuation.reconstruct", lambda approval_info, continuation: {"approvals": len(approval_info)})
     def __reconstruct_continuation_obj(approval_info: List[Dict[str, Any]], continuation: Dict[str, Any]) -> Dict[str, Any]:
         if not approval_info:
             return continuation
+        index = ContinuationAgent.__index_continuation_tree(continuation)
         for item in approval_info:
-            ContinuationAgent.__reconstruct_helper(item, continuation)
+            ContinuationAgent.__reconstruct_helper(item, continuation, index)
         return continuation    
-            
+    
     @staticmethod
-    def __reconstruct_helper(approval_obj: Dict[str, Any], continuation: Dict[str, Any]) -> Dict[str, Any]:
-       path_ids = approval_obj["path_ids"]
-       ContinuationAgent.__reconstruct_nested_helper(0, approval_obj, path_ids, continuation) 
-        
+    def __attach_tool_results(tool_results: Dict[str, Any], continuation: Dict[str, Any]):
+        """
+        Attach the given results to the tool calls awaiting them, at any level of the continuation tree.
+        Each agent uses them when its level is resumed.
+        """
+        index = ContinuationAgent.__index_continuation_tree(continuation)
+        for tool_call_id, result in tool_results.items():
+            entry = index.get(tool_call_id)
+            if entry is None or entry[2] is None or "pending" not in entry[2]:
+                raise ValueError(f"Tool call {tool_call_id} is not awaiting a result")
+            entry[2]["result"] = result
+            deferred.forget(tool_call_id)
+    
     @staticmethod
-    def __reconstruct_nested_helper(index: int, approval_obj: Dict[str, Any], path_ids: List[str], continuation: Dict[str, Any]):
-        processed_list = continuation.get("processed", [])
-        if not processed_list:
-            processed_list.append(
-                {
-                    "id": path_ids[index],
-                    "approved": True if index == len(path_ids) - 1 else approval_obj["approved"]
-                }
-            )
-        else:
-            for item in processed_list:
-                if item["id"] == path_ids[index]:
-                    item["approved"] = True if index == len(path_ids) - 1 else approval_obj["approved"]
-                    break
-        continuation["processed"] = processed_list
-        if (index == len(path_ids) - 1):
-            return
-        if not continuation.get("resume_request") :
-            raise ValueError("Number of path IDs is greater than nested levels")
+    def __index_continuation_tree(continuation: Dict[str, Any]) -> Dict[str, List[Any]]:
+        """
+        Index every level of the continuation tree by tool call id, in a single walk.
         
-        for req in continuation["resume_request"]:
-            if req["id"] == path_ids[index]:
-                ContinuationAgent.__reconstruct_nested_helper(index + 1, approval_obj, path_ids, req["continuation"])
-    
\ No newline at end of file
+        Each entry is [continuation level, processed item, resume request] of the tool call.
+        """
+        index = {}
+        levels = [continuation]
+        while levels:
+            level = levels.pop()
+            for item in level.setdefault("processed", []):
+                entry = index.setdefault(item["id"], [level, None, None])
+                if entry[0] is level and entry[1] is None:
+                    entry[1] = item
+            for req in level.get("resume_request") or []:
+                entry = index.setdefault(req["id"], [level, None, None])
+                if entry[0] is level and entry[2] is None:
+                    entry[2] = req
+                if req.get("continuation"):
+                    levels.append(req["continuation"])
+        return index
+            
+    @staticmethod
+    def __reconstruct_helper(approval_obj: Dict[str, Any], continuation: Dict[str, Any], index: Dict[str, List[Any]]):
+        path_ids = approval_obj["path_ids"]
+        if not path_ids:
+            raise ValueError("path_ids must not be empty")
+        last = len(path_ids) - 1
+        decision = approval_obj.get("approved")
+        for level, path_id in enumerate(path_ids):
+            entry = index.get(path_id)
+            if entry is not None and entry[0] is not continuation:
+                entry = None
+            # The sub-agents leading to a decided tool call are resumed and apply the decision themselves,
+            # an undecided tool call leaves them as they are
+            if level == last or decision is not None:
+                approved = decision if level == last else True
+                if entry is not None and entry[1] is not None:
+                    entry[1]["approved"] = approved
+                elif not continuation["processed"]:
+                    item = {"id": path_id, "approved": approved}
+                    continuation["processed"].append(item)
+                    if entry is None:
+                        index.setdefault(path_id, [continuation, item, None])
+                    else:
+                        entry[1] = item
+            if level == last:
+                return
+            if not continuation.get("resume_request"):
+                raise ValueError("Number of path IDs is greater than nested levels")
+            if entry is None or entry[2] is None:
+                return
+            continuation = entry[2]["continuation"]
+
+# Tool message answering a rejected tool call, with partial_approvals
+REJECTED_TOOL_CALL_MESSAGE = "The tool call was rejected by the approver and was not executed."
+
+def _strip_nulls(obj: Any) -> Any:
+    """
+    Return a copy of a JSON-like object without the keys whose value is None.
+    """
+    if isinstance(obj, dict):
+        return {key: _strip_nulls(value) for key, value in obj.items() if value is not None}
+    if isinstance(obj, list):
+        return [_strip_nulls(item) for item in obj]
+    return obj
+
+def _expand_resume_request(continuation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Return the resume requests of a continuation level, restoring the tool call definitions that
+    compact continuations only reference by id from the last assistant message.
+    """
+    resume_requests = continuation.get("resume_request", [])
+    if all("function" in req for req in resume_requests):
+        return resume_requests
+    tool_calls = {}
+    for message in reversed(continuation["messages"]):
+        if message.get("role") == "assistant" and message.get("tool_calls"):
+            tool_calls = {tc["id"]: tc for tc in message["tool_calls"]}
+            break
+    expanded = []
+    for req in resume_requests:
+        if "function" not in req:
+            if req["id"] not in tool_calls:
+                raise ValueError(f"Tool call {req['id']} not found in the continuation messages")
+            tool_call = tool_calls[req["id"]]
+            req = {**tool_call, "function": dict(tool_call["function"]), **req}
+        expanded.append(req)
+    return expanded
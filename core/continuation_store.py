@@ -0,0 +1,296 @@
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+from core import serialization
+import threading
+import sqlite3
+import uuid
+import time
+import os
+import re
+
+_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+class UnknownContinuationError(ValueError):
+    """
+    A continuation id is malformed, unknown, expired or already taken.
+    """
+
+class ContinuationStore(ABC):
+    """
+    Server-side storage of continuations, so that responses only carry a `continuation_id` handle.
+
+    Continuations are stored as binary envelopes (see `core.serialization`). Expired continuations are
+    removed by `gc`, which also runs from `put` at most once every `gc_interval` seconds.
+
+    Subclasses implement `_get`, `_take`, `_set`, `delete` and `_gc`.
+    """
+    def __init__(self, ttl: Optional[float] = None, gc_interval: float = 60):
+        """
+        Args:
+            ttl: Seconds a continuation can be resumed, forever when omitted
+            gc_interval: Minimum seconds between two garbage collections triggered by `put`
+        """
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._last_gc = time.time()
+
+    def put(self, continuation: Dict[str, Any]) -> str:
+        """
+        Store a continuation.
+
+        Returns:
+            str: The id of the continuation
+        """
+        if self.ttl is not None and time.time() - self._last_gc >= self.gc_interval:
+            self.gc()
+        continuation_id = uuid.uuid4().hex
+        self._set(continuation_id, serialization.encode(continuation), None if self.ttl is None else time.time() + self.ttl)
+        return continuation_id
+
+    def get(self, continuation_id: str) -> Dict[str, Any]:
+        """
+        Load a continuation.
+
+        Raises:
+            UnknownContinuationError: If the id is malformed, unknown or expired
+        """
+        _check_id(continuation_id)
+        found, blob = self._get(continuation_id)
+        if not found:
+            raise UnknownContinuationError(f"Unknown or expired continuation {continuation_id}")
+        return serialization.decode(blob)
+
+    def take(self, continuation_id: str) -> Dict[str, Any]:
+        """
+        Load and remove a continuation in one step, so that concurrent resumes of the same id cannot both
+        get it. `restore` puts it back when its resume fails.
+
+        Raises:
+            UnknownContinuationError: If the id is malformed, unknown, expired or already taken
+        """
+        _check_id(continuation_id)
+        found, blob = self._take(continuation_id)
+        if not found:
+            raise UnknownContinuationError(f"Unknown or expired continuation {continuation_id}")
+        return serialization.decode(blob)
+
+    def restore(self, continuation_id: str, continuation: Dict[str, Any]):
+        """Store a taken continuation again under its id, resumable for another `ttl`."""
+        _check_id(continuation_id)
+        self._set(continuation_id, serialization.encode(continuation), None if self.ttl is None else time.time() + self.ttl)
+
+    @abstractmethod
+    def delete(self, continuation_id: str):
+        """Remove a continuation, if it exists."""
+
+    def gc(self) -> int:
+        """
+        Remove the expired continuations.
+
+        Returns:
+            int: The number of removed continuations
+        """
+        self._last_gc = time.time()
+        return self._gc(self._last_gc)
+
+    @abstractmethod
+    def _get(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        """Load an envelope, an expired one is not found."""
+
+    @abstractmethod
+    def _take(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        """Load and remove an envelope atomically, an expired one is not found."""
+
+    @abstractmethod
+    def _set(self, continuation_id: str, blob: bytes, expires_at: Optional[float]):
+        """Store an envelope, resumable until the `expires_at` timestamp, forever when None."""
+
+    @abstractmethod
+    def _gc(self, now: float) -> int:
+        """Remove the continuations expired at `now` and return how many were removed."""
+
+class MemoryContinuationStore(ContinuationStore):
+    """
+    In-process store keeping the `maxsize` most recently stored or resumed continuations.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, gc_interval: float = 60):
+        """
+        Args:
+            maxsize: Maximum number of stored continuations
+            ttl: Seconds a continuation can be resumed, forever when omitted
+            gc_interval: Minimum seconds between two garbage collections triggered by `put`
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        super().__init__(ttl, gc_interval)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def delete(self, continuation_id: str):
+        with self._lock:
+            self._entries.pop(continuation_id, None)
+
+    def _get(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        with self._lock:
+            entry = self._entries.get(continuation_id)
+            if entry is None:
+                return False, None
+            blob, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[continuation_id]
+                return False, None
+            self._entries.move_to_end(continuation_id)
+            return True, blob
+
+    def _take(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        with self._lock:
+            entry = self._entries.pop(continuation_id, None)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            return False, None
+        return True, entry[0]
+
+    def _set(self, continuation_id: str, blob: bytes, expires_at: Optional[float]):
+        with self._lock:
+            self._entries[continuation_id] = (blob, expires_at)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _gc(self, now: float) -> int:
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+class SQLiteContinuationStore(ContinuationStore):
+    """
+    SQLite-backed store, shared by the processes using the same file.
+    """
+    def __init__(self, path: str, ttl: Optional[float] = None, gc_interval: float = 60):
+        """
+        Args:
+            path: Path of the SQLite database file
+            ttl: Seconds a continuation can be resumed, forever when omitted
+            gc_interval: Minimum seconds between two garbage collections triggered by `put`
+        """
+        super().__init__(ttl, gc_interval)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS continuations (id TEXT PRIMARY KEY, envelope BLOB NOT NULL, expires_at REAL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS continuations_expires_at ON continuations (expires_at)")
+
+    def delete(self, continuation_id: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM continuations WHERE id = ?", (continuation_id,))
+
+    def _get(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        with self._lock:
+            row = self._connection.execute("SELECT envelope, expires_at FROM continuations WHERE id = ?", (continuation_id,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return False, None
+        return True, row[0]
+
+    def _take(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        # A single statement, so two processes sharing the file cannot both take the continuation
+        with self._lock:
+            rows = self._connection.execute("DELETE FROM continuations WHERE id = ? RETURNING envelope, expires_at", (continuation_id,)).fetchall()
+        row = rows[0] if rows else None
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return False, None
+        return True, row[0]
+
+    def _set(self, continuation_id: str, blob: bytes, expires_at: Optional[float]):
+        with self._lock:
+            self._connection.execute("INSERT INTO continuations (id, envelope, expires_at) VALUES (?, ?, ?)", (continuation_id, blob, expires_at))
+
+    def _gc(self, now: float) -> int:
+        with self._lock:
+            return self._connection.execute("DELETE FROM continuations WHERE expires_at <= ?", (now,)).rowcount
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+class FileContinuationStore(ContinuationStore):
+    """
+    Store writing one envelope file per continuation in a directory, expiry is based on the file
+    modification time.
+    """
+    SUFFIX = ".cont"
+
+    def __init__(self, directory: str, ttl: Optional[float] = None, gc_interval: float = 60):
+        """
+        Args:
+            directory: The directory of the continuation files, created when missing
+            ttl: Seconds a continuation can be resumed, forever when omitted
+            gc_interval: Minimum seconds between two garbage collections triggered by `put`
+        """
+        super().__init__(ttl, gc_interval)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def delete(self, continuation_id: str):
+        _check_id(continuation_id)
+        try:
+            os.remove(self._path(continuation_id))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, continuation_id: str) -> str:
+        return os.path.join(self.directory, continuation_id + self.SUFFIX)
+
+    def _get(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        path = self._path(continuation_id)
+        try:
+            if self.ttl is not None and os.path.getmtime(path) + self.ttl <= time.time():
+                return False, None
+            with open(path, "rb") as f:
+                return True, f.read()
+        except FileNotFoundError:
+            return False, None
+
+    def _take(self, continuation_id: str) -> Tuple[bool, Optional[bytes]]:
+        # Renamed first, only one of the concurrent renames of the file succeeds
+        taken = self._path(continuation_id) + "." + uuid.uuid4().hex + ".taken"
+        try:
+            os.rename(self._path(continuation_id), taken)
+        except FileNotFoundError:
+            return False, None
+        try:
+            if self.ttl is not None and os.path.getmtime(taken) + self.ttl <= time.time():
+                return False, None
+            with open(taken, "rb") as f:
+                return True, f.read()
+        finally:
+            os.remove(taken)
+
+    def _set(self, continuation_id: str, blob: bytes, expires_at: Optional[float]):
+        # Written under a temporary name then renamed, so readers never see a partial file
+        path = self._path(continuation_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(blob)
+        os.replace(path + ".tmp", path)
+
+    def _gc(self, now: float) -> int:
+        if self.ttl is None:
+            return 0
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.SUFFIX):
+                    continue
+                try:
+                    if entry.stat().st_mtime + self.ttl <= now:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+def _check_id(continuation_id: Any):
+    if not isinstance(continuation_id, str) or not _ID_PATTERN.fullmatch(continuation_id):
+        raise UnknownContinuationError(f"Invalid continuation id {continuation_id!r}")
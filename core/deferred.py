@@ -0,0 +1,146 @@
+"""
+Deferred tool results, for tools that take too long to hold a request open.
+
+A tool called by a `ContinuationAgent` defers its result by returning a `PendingResult`, or automatically
+when it is declared with `@tool(defer_after=seconds)` and runs longer than that. The agent then ends the
+request with the `awaiting_tool_result` end_reason, and the request is resumed later with the results keyed
+by tool call id:
+
+    response = agent.request({"prompt": "..."})
+    # {"continuation": {...}, "pending_tool_calls": [{"path_ids": [...], "info": {...}, ...}], "end_reason": "awaiting_tool_result"}
+    results = wait_for_results(response)  # or {tool_call_id: result} from wherever the work finished
+    response = agent.request({"continuation": response["continuation"], "tool_results": results})
+
+A deferred call that runs in this process keeps running in the background, its result is used on resume
+when it is not given in `tool_results` and the call has finished by then. The result of a finished call is
+kept `RESULT_TTL` seconds, so the calls of abandoned continuations are eventually dropped.
+"""
+
+from typing import Dict, Any, Optional, List
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from contextvars import copy_context
+import threading
+import time
+
+class PendingResult:
+    """
+    Result of a tool call that finishes later.
+
+    Only continuation agents defer tool results, other agents pass the handle to the model as is.
+    """
+    def __init__(self, info: Any = None, future: Optional[Future] = None):
+        """
+        Args:
+            info: JSON-serializable details for the caller, such as a job id, returned in `pending_tool_calls`
+            future: The running work, when it runs in this process. Its result is used on resume
+                unless another result is given for the tool call.
+        """
+        self.info = info
+        self.future = future
+
+    def __repr__(self):
+        return f"PendingResult(info={self.info!r}, running={self.future is not None and not self.future.done()})"
+
+# Seconds the result of a finished deferred call is kept for the resume of its continuation
+RESULT_TTL = 3600.0
+
+# Deferred calls running in this process, keyed by tool call id, and when they finished
+_running: Dict[str, Future] = {}
+_finished_at: Dict[str, float] = {}
+_running_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def run_deferrable(call, defer_after: float) -> Any:
+    """
+    Run a call in the background thread pool and wait at most `defer_after` seconds for it.
+
+    Args:
+        call: The callable without arguments to run, in a copy of the current context
+        defer_after: Seconds to wait before deferring the result
+
+    Returns:
+        Any: The result of the call, or a `PendingResult` of the running call
+    """
+    future = submit(call)
+    try:
+        return future.result(defer_after)
+    except FutureTimeoutError:
+        return PendingResult({"deferred_after": defer_after}, future)
+
+def submit(call) -> Future:
+    """Start a call in the background thread pool of the deferred calls, in a copy of the current context."""
+    global _executor
+    if _executor is None:
+        with _running_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(thread_name_prefix="deferred-tool")
+    return _executor.submit(copy_context().run, call)
+
+def track(tool_call_id: str, future: Future):
+    """Remember the running work of a deferred tool call until its result is used or expires."""
+    with _running_lock:
+        _prune(time.time())
+        _running[tool_call_id] = future
+        _finished_at.pop(tool_call_id, None)
+    # Outside of the lock, the callback runs right away when the call has already finished
+    future.add_done_callback(lambda future: _finished(tool_call_id, future))
+
+def _finished(tool_call_id: str, future: Future):
+    with _running_lock:
+        if _running.get(tool_call_id) is future:
+            _finished_at[tool_call_id] = time.time()
+
+def _prune(now: float):
+    # Called with the lock held
+    expired = [tool_call_id for tool_call_id, finished_at in _finished_at.items() if finished_at + RESULT_TTL <= now]
+    for tool_call_id in expired:
+        del _finished_at[tool_call_id]
+        del _running[tool_call_id]
+
+def poll_result(tool_call_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Take the result of a deferred tool call running in this process, if it has finished.
+
+    Args:
+        tool_call_id: The id of the tool call
+
+    Returns:
+        Optional[Dict[str, Any]]: {"result": ...} once the call has finished, None otherwise. A call
+            that raised returns the error message as its result.
+    """
+    with _running_lock:
+        future = _running.get(tool_call_id)
+        if future is None or not future.done():
+            return None
+        del _running[tool_call_id]
+        _finished_at.pop(tool_call_id, None)
+    error = future.exception()
+    return {"result": f"Error: {error}" if error is not None else future.result()}
+
+def forget(tool_call_id: str):
+    """Stop tracking a deferred tool call, after its result was given explicitly."""
+    with _running_lock:
+        _running.pop(tool_call_id, None)
+        _finished_at.pop(tool_call_id, None)
+
+def wait_for_results(response: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Wait for the deferred tool calls of an `awaiting_tool_result` response that run in this process.
+
+    Args:
+        response: The agent response listing `pending_tool_calls`
+        timeout: Seconds to wait, forever when None
+
+    Returns:
+        Dict[str, Any]: The results of the finished calls keyed by tool call id, to pass as `tool_results`
+    """
+    ids: List[str] = [entry["path_ids"][-1] for entry in response.get("pending_tool_calls", [])]
+    with _running_lock:
+        futures = [_running[tool_call_id] for tool_call_id in ids if tool_call_id in _running]
+    wait(futures, timeout)
+    results = {}
+    for tool_call_id in ids:
+        polled = poll_result(tool_call_id)
+        if polled is not None:
+            results[tool_call_id] = polled["result"]
+    return results
@@ -0,0 +1,28 @@
+"""
+Compact representation of the conversation messages.
+
+The SDK dumps every assistant message with all of its fields, most of them null (`refusal`, `annotations`,
+`audio`, `function_call`, ...), and these dictionaries are copied into the messages, the continuations and the
+`approval_info` of every response. The agents keep the minimal wire form instead, the same message without its
+null fields, which the API accepts as is, and `expand_message` restores the form dumped by the SDK. The gain is
+in the serialized size of the responses, see `benchmarks/bench_messages.py`; the memory held barely changes.
+"""
+
+from typing import Dict, Any
+
+# The fields of `ChatCompletionMessage.model_dump()`, in order
+ASSISTANT_FIELDS = ("content", "refusal", "role", "annotations", "audio", "function_call", "tool_calls")
+
+def compact_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The minimal wire form of a message dictionary, without its null fields.
+    """
+    return {key: value for key, value in message.items() if value is not None}
+
+def expand_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The full form of a message dictionary, assistant messages get every field of `ChatCompletionMessage.model_dump()`.
+    """
+    if message.get("role") == "assistant":
+        return {**{key: None for key in ASSISTANT_FIELDS}, **message}
+    return dict(message)
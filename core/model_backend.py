@@ -0,0 +1,349 @@
+from typing import List, Dict, Any, Optional, Callable, Union
+from core.clients import get_client_registry
+from abc import ABC, abstractmethod
+import itertools
+import threading
+import time
+import json
+
+class ModelResponse:
+    """
+    The model output of one turn, independent of the backend that produced it.
+    """
+    def __init__(self, message: Dict[str, Any], finish_reason: str, usage: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            message: The assistant message, in the format of `ChatCompletionMessage.model_dump()`
+            finish_reason: "stop", "tool_calls", or any other reason reported by the model
+            usage: Token usage with `prompt_tokens` and `completion_tokens`, when known
+        """
+        self.message = message
+        self.finish_reason = finish_reason
+        self.usage = usage
+
+    def __repr__(self):
+        return f"ModelResponse(finish_reason='{self.finish_reason}', message={self.message}, usage={self.usage})"
+
+class ModelBackend(ABC):
+    """
+    Interface between an agent and the language model.
+
+    Subclasses implement `complete`, and `acomplete` when they can do better than running
+    `complete` in a worker thread.
+    """
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        """
+        Call the model with the conversation and the tool payload.
+
+        Args:
+            messages: The conversation so far
+            tools: The tool payload, in the OpenAI function format
+            model: The model name
+
+        Returns:
+            ModelResponse: The model output
+        """
+
+    async def acomplete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        """
+        asyncio counterpart of `complete`.
+        """
+        import asyncio
+        return await asyncio.to_thread(self.complete, messages, tools, model)
+
+    def stream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        """
+        Call the model in streaming mode, reporting every tool call as soon as it is fully generated.
+
+        The returned response is the same as the one `complete` would return. Backends that cannot
+        stream report the tool calls once the whole response is available.
+
+        Args:
+            messages: The conversation so far
+            tools: The tool payload, in the OpenAI function format
+            model: The model name
+            on_tool_call: Called with each complete tool call whose arguments are valid JSON
+
+        Returns:
+            ModelResponse: The model output
+        """
+        response = self.complete(messages, tools, model)
+        for tool_call in response.message.get("tool_calls") or []:
+            on_tool_call(tool_call)
+        return response
+
+    async def astream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        """
+        asyncio counterpart of `stream`.
+        """
+        response = await self.acomplete(messages, tools, model)
+        for tool_call in response.message.get("tool_calls") or []:
+            on_tool_call(tool_call)
+        return response
+
+class OpenAIBackend(ModelBackend):
+    """
+    Chat completions through the OpenAI SDK.
+
+    Unless clients are given, they are taken from the process-wide `ClientRegistry` on the first
+    model call, so every backend with the same configuration shares one connection pool.
+    """
+    def __init__(self, client: Optional[Any] = None, async_client: Optional[Any] = None, **client_config):
+        """
+        Args:
+            client: An `OpenAI` client to use instead of the shared one
+            async_client: An `AsyncOpenAI` client to use instead of the shared one
+            **client_config: Keyword arguments of the shared clients, such as `api_key` or `base_url`
+        """
+        self._client = client
+        self._async_client = async_client
+        self.client_config = client_config
+
+    @property
+    def client(self) -> Any:
+        return self._client or get_client_registry().get("sync", **self.client_config)
+
+    @property
+    def async_client(self) -> Any:
+        return self._async_client or get_client_registry().get("async", **self.client_config)
+
+    def complete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        chat_completion = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=tools,
+            parallel_tool_calls=True
+        )
+        return _to_model_response(chat_completion)
+
+    async def acomplete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        chat_completion = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=tools,
+            parallel_tool_calls=True
+        )
+        return _to_model_response(chat_completion)
+
+    def stream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        chunks = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=tools,
+            parallel_tool_calls=True,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        assembler = _StreamAssembler(on_tool_call)
+        for chunk in chunks:
+            assembler.add_chunk(chunk)
+        return assembler.finish()
+
+    async def astream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        chunks = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=tools,
+            parallel_tool_calls=True,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        assembler = _StreamAssembler(on_tool_call)
+        async for chunk in chunks:
+            assembler.add_chunk(chunk)
+        return assembler.finish()
+
+class _StreamAssembler:
+    """
+    Rebuild the message of a streamed chat completion from its chunks.
+
+    Tool call deltas arrive in index order, so a tool call is complete as soon as a delta of the
+    next index, or the end of the stream, is seen.
+    """
+    def __init__(self, on_tool_call: Callable[[Dict[str, Any]], None]):
+        self.on_tool_call = on_tool_call
+        self.content = []
+        self.refusal = []
+        self.tool_calls = {}
+        self.current_index = None
+        self.finish_reason = None
+        self.usage = None
+
+    def add_chunk(self, chunk: Any):
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage.model_dump()
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta.content:
+            self.content.append(delta.content)
+        if getattr(delta, "refusal", None):
+            self.refusal.append(delta.refusal)
+        for tool_call_delta in delta.tool_calls or []:
+            if tool_call_delta.index != self.current_index:
+                self._complete(self.current_index)
+                self.current_index = tool_call_delta.index
+            tool_call = self.tool_calls.setdefault(tool_call_delta.index, {"id": None, "function": {"arguments": "", "name": ""}, "type": "function"})
+            if tool_call_delta.id:
+                tool_call["id"] = tool_call_delta.id
+            if tool_call_delta.function:
+                tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+
+    def finish(self) -> ModelResponse:
+        from openai.types.chat import ChatCompletionMessage
+
+        self._complete(self.current_index)
+        # Built through the SDK type so the message is the same as the one of a non-streaming call
+        message = ChatCompletionMessage.model_validate({
+            "role": "assistant",
+            "content": "".join(self.content) if self.content else None,
+            "refusal": "".join(self.refusal) if self.refusal else None,
+            "tool_calls": [self.tool_calls[index] for index in sorted(self.tool_calls)] or None,
+        })
+        return ModelResponse(message.model_dump(), self.finish_reason, self.usage)
+
+    def _complete(self, index: Optional[int]):
+        if index is None:
+            return
+        tool_call = self.tool_calls[index]
+        try:
+            json.loads(tool_call["function"]["arguments"] or "{}")
+        except ValueError:
+            return
+        self.on_tool_call(dict(tool_call, function=dict(tool_call["function"])))
+
+def _to_model_response(chat_completion: Any) -> ModelResponse:
+    choice = chat_completion.choices[0]
+    usage = chat_completion.usage.model_dump() if getattr(chat_completion, "usage", None) else None
+    return ModelResponse(choice.message.model_dump(), choice.finish_reason, usage)
+
+# A scripted reply: the final answer as a string, a list of tool calls, or a ModelResponse
+ScriptedReply = Union[str, List[Dict[str, Any]], ModelResponse]
+
+class FakeBackend(ModelBackend):
+    """
+    Local, scriptable stand-in for an OpenAI-compatible model, to test and load-test agents offline.
+
+    The script is either a list of replies returned in turn, or a callable receiving the messages and
+    the tool payload of every call and returning the reply. A reply is the final answer as a string,
+    a list of tool calls built with `FakeBackend.tool_call`, or a `ModelResponse`.
+
+    Example:
+        backend = FakeBackend([
+            [FakeBackend.tool_call("create_account", username="tfan")],
+            "The account has been created.",
+        ], latency=0.2)
+    """
+    _ids = itertools.count()
+
+    def __init__(self, script: Union[List[ScriptedReply], Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], ScriptedReply]], latency: float = 0.0):
+        """
+        Args:
+            script: The replies, or a callable producing the reply of each call
+            latency: Seconds slept before every reply, to simulate the model
+        """
+        self.script = script
+        self.latency = latency
+        self.calls = 0
+        self._replies = iter(script) if not callable(script) else None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tool_call(name: str, **arguments) -> Dict[str, Any]:
+        """
+        Build a tool call, in the format of `ChatCompletionMessageToolCall.model_dump()`.
+        """
+        return {
+            "id": f"call_fake{next(FakeBackend._ids):020d}",
+            "function": {"arguments": json.dumps(arguments), "name": name},
+            "type": "function"
+        }
+
+    def complete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._next_reply(messages, tools)
+
+    async def acomplete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        import asyncio
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._next_reply(messages, tools)
+
+    def stream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        # The latency is spread over the tool calls, as if they were generated one after the other
+        response = self._next_reply(messages, tools)
+        tool_calls = response.message.get("tool_calls") or []
+        for tool_call in tool_calls:
+            if self.latency:
+                time.sleep(self.latency / len(tool_calls))
+            on_tool_call(dict(tool_call, function=dict(tool_call["function"])))
+        if self.latency and not tool_calls:
+            time.sleep(self.latency)
+        return response
+
+    async def astream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        import asyncio
+        response = self._next_reply(messages, tools)
+        tool_calls = response.message.get("tool_calls") or []
+        for tool_call in tool_calls:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(tool_calls))
+            on_tool_call(dict(tool_call, function=dict(tool_call["function"])))
+        if self.latency and not tool_calls:
+            await asyncio.sleep(self.latency)
+        return response
+
+    def _next_reply(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> ModelResponse:
+        with self._lock:
+            self.calls += 1
+            if self._replies is None:
+                reply = self.script(messages, tools)
+            else:
+                try:
+                    reply = next(self._replies)
+                except StopIteration:
+                    raise RuntimeError("FakeBackend script is exhausted")
+        if isinstance(reply, ModelResponse):
+            return reply
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in messages) // 4
+        if isinstance(reply, str):
+            return ModelResponse(_assistant_message(reply, None), "stop", _usage(prompt_tokens, len(reply) // 4))
+        tool_calls = [dict(tool_call, function=dict(tool_call["function"])) for tool_call in reply]
+        completion_tokens = sum(len(tool_call["function"]["arguments"]) for tool_call in tool_calls) // 4
+        return ModelResponse(_assistant_message(None, tool_calls), "tool_calls", _usage(prompt_tokens, completion_tokens))
+
+def _assistant_message(content: Optional[str], tool_calls: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    # Same keys as ChatCompletionMessage.model_dump()
+    return {"content": content, "refusal": None, "role": "assistant", "annotations": None, "audio": None, "function_call": None, "tool_calls": tool_calls}
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+_default_backend: Optional[ModelBackend] = None
+_default_backend_lock = threading.Lock()
+
+def get_default_backend() -> ModelBackend:
+    """
+    The backend used by agents created without one, an `OpenAIBackend` unless replaced.
+    """
+    global _default_backend
+    if _default_backend is None:
+        with _default_backend_lock:
+            if _default_backend is None:
+                _default_backend = OpenAIBackend()
+    return _default_backend
+
+def set_default_backend(backend: Optional[ModelBackend]):
+    """
+    Replace the backend used by agents created without one, including nested sub-agents.
+    `None` restores the `OpenAIBackend`.
+    """
+    global _default_backend
+    with _default_backend_lock:
+        _default_backend = backend
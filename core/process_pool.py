@@ -0,0 +1,228 @@
+"""
+Process pool running the tools decorated with `@tool(executor="process")`.
+
+Tools are not pickled: a worker process imports the tool's module and looks the tool up by its qualified
+name, then calls the undecorated function. A process tool must therefore be defined at the top level of
+an importable module (not inside a function), and its arguments and result must be picklable. Workers
+are started with the "spawn" method, so they do not inherit locks or threads from the agent process.
+
+Each call takes a worker to itself, waiting for one to be free, and its `timeout` starts when the worker
+receives it. A call exceeding its timeout cannot be interrupted otherwise, so its worker is terminated and
+replaced; the other workers and their calls are not affected. A call whose worker dies is not run again,
+since it may have had side effects, and fails with `ToolWorkerError`. Workers are recycled after
+`max_tasks_per_child` calls.
+
+Example:
+    configure_process_pool(max_workers=4, max_tasks_per_child=50)
+
+    @tool(executor="process", timeout=30)
+    def parse_document(path: str) -> str:
+        ...
+"""
+
+from typing import Dict, Any, Optional, Tuple, Callable, List
+import importlib
+import threading
+import atexit
+import os
+
+class ToolTimeoutError(TimeoutError):
+    """
+    A process tool call exceeded its timeout. The message is meant for the model.
+    """
+
+class ToolWorkerError(RuntimeError):
+    """
+    The worker process running a process tool call died. The message is meant for the model.
+    """
+
+class _Worker:
+    """
+    A worker process and the pipe its calls go through, used by one call at a time.
+    """
+    def __init__(self, generation: int):
+        import multiprocessing
+
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), name="tool-worker", daemon=True)
+        self.process.start()
+        child.close()
+        self.generation = generation
+        self.tasks = 0
+
+    def stop(self, terminate: bool = False):
+        if terminate:
+            self.process.terminate()
+        else:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join(None if terminate else 5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+class ToolProcessPool:
+    """
+    Process pool for process tools, replacing its workers one by one.
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_tasks_per_child: Optional[int] = 100):
+        """
+        Args:
+            max_workers: Number of worker processes, the number of CPUs by default
+            max_tasks_per_child: Calls run by a worker before it is replaced, never replaced when None
+        """
+        self.max_workers = max_workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self._idle: List[_Worker] = []
+        self._workers = 0
+        self._generation = 0
+        self._available = threading.Condition()
+
+    def call(self, module: str, qualname: str, args: tuple, kwargs: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a process tool and wait for its result.
+
+        Args:
+            module: The module defining the tool
+            qualname: The qualified name of the tool in its module
+            args: The positional arguments of the call
+            kwargs: The keyword arguments of the call
+            timeout: Seconds the call may run once a worker has started it, forever when None
+
+        Returns:
+            Any: The result of the tool
+
+        Raises:
+            ToolTimeoutError: If the call did not finish within `timeout`
+            ToolWorkerError: If the worker process died during the call
+        """
+        worker = self._acquire()
+        try:
+            worker.connection.send((module, qualname, args, kwargs))
+            finished = worker.connection.poll(timeout)
+            reply = worker.connection.recv() if finished else None
+        except (EOFError, OSError):
+            self._discard(worker, terminate=True)
+            raise ToolWorkerError(f"Tool {qualname} failed: its worker process exited during the call")
+        except BaseException:
+            # Interrupted while the call may still be running, the worker cannot be reused
+            self._discard(worker, terminate=True)
+            raise
+        if reply is None:
+            # Only the stuck worker is stopped, the calls of the other workers go on
+            self._discard(worker, terminate=True)
+            raise ToolTimeoutError(f"Tool {qualname} did not finish within {timeout} seconds")
+        self._release(worker)
+        status, value = reply
+        if status == "error":
+            raise value
+        return value
+
+    async def acall(self, module: str, qualname: str, args: tuple, kwargs: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        asyncio counterpart of `call`, waiting in a worker thread so the event loop is not blocked.
+        """
+        import asyncio
+        return await asyncio.to_thread(self.call, module, qualname, args, kwargs, timeout)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the idle worker processes, the busy ones are stopped when their call returns. The pool is
+        started again if it is used afterwards.
+        """
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._workers -= len(idle)
+            self._generation += 1
+            self._available.notify_all()
+        for worker in idle:
+            worker.stop(terminate=not wait)
+
+    def _acquire(self) -> _Worker:
+        # Waiting for a free worker does not count in the timeout of the call
+        with self._available:
+            while not self._idle and self._workers >= (self.max_workers or os.cpu_count() or 1):
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._workers += 1
+            generation = self._generation
+        try:
+            return _Worker(generation)
+        except BaseException:
+            with self._available:
+                self._workers -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, worker: _Worker):
+        worker.tasks += 1
+        with self._available:
+            retire = worker.generation != self._generation or (self.max_tasks_per_child is not None and worker.tasks >= self.max_tasks_per_child)
+            if not retire:
+                self._idle.append(worker)
+                self._available.notify()
+                return
+        self._discard(worker)
+
+    def _discard(self, worker: _Worker, terminate: bool = False):
+        worker.stop(terminate)
+        with self._available:
+            self._workers -= 1
+            self._available.notify()
+
+_pool = ToolProcessPool()
+atexit.register(_pool.shutdown, wait=False)
+
+def get_process_pool() -> ToolProcessPool:
+    """
+    The process-wide pool of the process tools, shut down when the interpreter exits.
+    """
+    return _pool
+
+def configure_process_pool(max_workers: Optional[int] = None, max_tasks_per_child: Optional[int] = 100):
+    """
+    Change the size and the recycling of the process-wide pool, restarting its workers.
+
+    Args:
+        max_workers: Number of worker processes, the number of CPUs by default
+        max_tasks_per_child: Calls run by a worker before it is replaced, never replaced when None
+    """
+    _pool.shutdown(wait=True)
+    _pool.max_workers = max_workers
+    _pool.max_tasks_per_child = max_tasks_per_child
+
+# Tools resolved by a worker process, keyed by (module, qualname)
+_resolved: Dict[Tuple[str, str], Callable] = {}
+
+def _run_tool(module: str, qualname: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+    func = _resolved.get((module, qualname))
+    if func is None:
+        func = importlib.import_module(module)
+        for part in qualname.split("."):
+            func = getattr(func, part)
+        # The undecorated function, the decorated one would submit the call to a pool again
+        func = _resolved[(module, qualname)] = func._tool.func
+    return func(*args, **kwargs)
+
+def _serve(connection: Any):
+    # The loop of a worker process, one call at a time until it receives None or its pipe is closed
+    while True:
+        try:
+            task = connection.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        try:
+            reply = ("ok", _run_tool(*task))
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # The result or the exception could not be pickled
+            connection.send(("error", ToolWorkerError(f"Tool {task[1]} returned a value that cannot be sent back: {e}")))
@@ -0,0 +1,159 @@
+"""
+Record and replay of model calls, for regression and load tests that run the same scenarios again and again.
+
+`RecordReplayBackend` wraps another backend. Each model call is keyed by a SHA-256 hash of the model name,
+the conversation and the tool payload, and its response is stored zlib-compressed in a SQLite file. Replayed
+responses carry the same tool call ids as the recorded ones, so the following turns hash to the recorded keys
+as well and a whole scenario, approvals and resumes included, replays offline.
+
+Set it as the default backend so nested sub-agents, which usually have no backend of their own, go through it:
+
+Example:
+    set_default_backend(RecordReplayBackend(path="tests/recordings.db", mode="replay"))
+    response = hr_agent.request({"prompt": "Onboard stzhang"})
+"""
+
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from core.model_backend import ModelBackend, ModelResponse, OpenAIBackend
+import threading
+import hashlib
+import sqlite3
+import time
+import json
+import zlib
+
+MODES = ("record", "replay", "passthrough")
+
+class ReplayMissError(ValueError):
+    """
+    A model call has no recording in replay mode.
+    """
+
+def make_replay_key(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> str:
+    """
+    Build the key of a model call.
+
+    The null fields of the messages are left out, so messages with or without them hash the same.
+
+    Args:
+        messages: The conversation
+        tools: The tool payload
+        model: The model name
+
+    Returns:
+        str: The hex SHA-256 of the canonical JSON of the call
+    """
+    canonical = json.dumps({"model": model, "messages": _without_nulls(messages), "tools": tools}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class RecordReplayBackend(ModelBackend):
+    """
+    Backend answering model calls from recordings.
+
+    Modes:
+        record: Answer from the recordings, call the inner backend and record its response on a miss
+        replay: Answer from the recordings only, a miss raises `ReplayMissError`
+        passthrough: Always call the inner backend, without reading or writing recordings
+    """
+    def __init__(self, inner: Optional[ModelBackend] = None, path: str = "recordings.db", mode: str = "record"):
+        """
+        Args:
+            inner: The backend called on a miss, an `OpenAIBackend` when omitted. Not used, nor created, in
+                replay mode
+            path: Path of the SQLite database file of the recordings
+            mode: "record", "replay" or "passthrough"
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {', '.join(MODES)}")
+        # Replay mode never calls the inner backend, so it runs without the openai package or an API key
+        self.inner = inner if inner is not None or mode == "replay" else OpenAIBackend()
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS recordings (key TEXT PRIMARY KEY, response BLOB NOT NULL, recorded_at REAL NOT NULL)")
+
+    def complete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        key, response = self._lookup(messages, tools, model)
+        if response is None:
+            response = self.inner.complete(messages, tools, model)
+            self._record(key, response)
+        return response
+
+    async def acomplete(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> ModelResponse:
+        key, response = self._lookup(messages, tools, model)
+        if response is None:
+            response = await self.inner.acomplete(messages, tools, model)
+            self._record(key, response)
+        return response
+
+    def stream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        key, response = self._lookup(messages, tools, model)
+        if response is None:
+            response = self.inner.stream(messages, tools, model, on_tool_call)
+            self._record(key, response)
+            return response
+        for tool_call in response.message.get("tool_calls") or []:
+            on_tool_call(dict(tool_call, function=dict(tool_call["function"])))
+        return response
+
+    async def astream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str, on_tool_call: Callable[[Dict[str, Any]], None]) -> ModelResponse:
+        key, response = self._lookup(messages, tools, model)
+        if response is None:
+            response = await self.inner.astream(messages, tools, model, on_tool_call)
+            self._record(key, response)
+            return response
+        for tool_call in response.message.get("tool_calls") or []:
+            on_tool_call(dict(tool_call, function=dict(tool_call["function"])))
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        """The hit and miss counters, and the number of recordings."""
+        with self._lock:
+            recordings = self._connection.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "recordings": recordings}
+
+    def clear(self):
+        """Drop every recording."""
+        with self._lock:
+            self._connection.execute("DELETE FROM recordings")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _lookup(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str) -> Tuple[Optional[str], Optional[ModelResponse]]:
+        # Returns the key to record the response under, None in passthrough mode
+        if self.mode == "passthrough":
+            return None, None
+        key = make_replay_key(messages, tools, model)
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM recordings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is not None:
+            recorded = json.loads(zlib.decompress(row[0]))
+            return key, ModelResponse(recorded["message"], recorded["finish_reason"], recorded["usage"])
+        if self.mode == "replay":
+            raise ReplayMissError(f"No recording of the model call {key} in {self.path}")
+        return key, None
+
+    def _record(self, key: Optional[str], response: ModelResponse):
+        if key is None:
+            return
+        recorded = {"message": response.message, "finish_reason": response.finish_reason, "usage": response.usage}
+        blob = zlib.compress(json.dumps(recorded, separators=(",", ":"), default=str).encode("utf-8"))
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO recordings (key, response, recorded_at) VALUES (?, ?, ?)", (key, blob, time.time()))
+
+def _without_nulls(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {key: _without_nulls(value) for key, value in obj.items() if value is not None}
+    if isinstance(obj, list):
+        return [_without_nulls(item) for item in obj]
+    return obj
@@ -0,0 +1,58 @@
+from typing import Dict, Any, Optional
+import time
+
+class RequestContext:
+    """
+    Progress of a single `request` call, passed to the suspension functions that accept an argument.
+
+    A new context is created by every `request` call, so budgets are per request and a resumed
+    continuation starts with a fresh budget. Suspension functions explain why they fired through
+    `record_budget`, the recorded budgets are returned in the `suspend_budgets` field of the response.
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tool_calls = 0
+        self.budgets: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the request started."""
+        return time.monotonic() - self.started_at
+
+    @property
+    def total_tokens(self) -> int:
+        """Prompt and completion tokens used by the model calls of the request."""
+        return self.prompt_tokens + self.completion_tokens
+
+    def record_model_call(self, usage: Optional[Dict[str, Any]]):
+        """
+        Count a model call and its token usage, when the backend reports it.
+        """
+        self.turns += 1
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+
+    def record_budget(self, name: str, limit: Any, used: Any):
+        """
+        Record the budget that made a suspension function fire.
+
+        Args:
+            name: The name of the suspension function
+            limit: The configured limit
+            used: The amount used when the function fired
+        """
+        self.budgets[name] = {"limit": limit, "used": used}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The counters of the context."""
+        return {
+            "turns": self.turns,
+            "elapsed": self.elapsed,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tool_calls": self.tool_calls
+        }
@@ -0,0 +1,302 @@
+"""
+Process-wide scheduler of the model calls, shared by every agent and nested sub-agent.
+
+Model calls wait in a priority queue for the request and token budgets of the provider, kept as token buckets
+refilled continuously over a minute. Calls of resumed continuations are served before the calls of fresh requests,
+so work that a user already approved finishes first. A call failing with a rate limit (429) or a server error (5xx)
+is retried after a jittered exponential backoff, or after the delay asked by the provider with `Retry-After`, which
+also holds back the other calls. The pooled clients of `core.clients` do not retry on their own, so every attempt
+goes through the budgets.
+
+The token budget is charged with an estimate of the prompt before the call, then corrected with the usage reported
+by the model.
+
+Example:
+    set_scheduler(ModelCallScheduler(requests_per_minute=500, tokens_per_minute=200_000))
+    ...
+    get_scheduler().stats()  # {"queue_depth": 3, "wait_time_max": 1.2, "retries": 4, ...}
+"""
+
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from contextvars import ContextVar
+import functools
+import threading
+import inspect
+import random
+import heapq
+import itertools
+import time
+import json
+
+# Priority classes, lower is served first
+PRIORITY_RESUME = 0
+PRIORITY_REQUEST = 1
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_current_priority: ContextVar[int] = ContextVar("model_call_priority", default=PRIORITY_REQUEST)
+
+class _TokenBucket:
+    """
+    A budget per minute. The level may go below zero when a call used more tokens than estimated,
+    the following calls then wait for the debt to be refilled.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        # Seconds until `amount` is available, a call larger than the whole budget waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+class ModelCallScheduler:
+    """
+    Rate limiter, priority queue and retry policy of the model calls.
+    """
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Args:
+            requests_per_minute: Model calls allowed per minute, unlimited when omitted
+            tokens_per_minute: Prompt and completion tokens allowed per minute, unlimited when omitted
+            max_retries: Retries of a call failing with a rate limit or a server error, 0 disables them
+            base_delay: Seconds of the first backoff, doubled on every retry
+            max_delay: Upper bound of a backoff, in seconds
+        """
+        for name, value in (("requests_per_minute", requests_per_minute), ("tokens_per_minute", tokens_per_minute)):
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive")
+        if max_retries < 0:
+            raise ValueError("max_retries must not be negative")
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._queue = []
+        self._sequence = itertools.count()
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+        self._metrics = {"calls": 0, "retries": 0, "rate_limited": 0, "max_queue_depth": 0, "wait_time_total": 0.0, "wait_time_max": 0.0}
+
+    def call(self, func: Callable[[], Any], messages: List[Dict[str, Any]], can_retry: Optional[Callable[[], bool]] = None) -> Any:
+        """
+        Call the model once the budgets allow it, retrying on rate limits and server errors.
+
+        Args:
+            func: Makes the model call and returns a `ModelResponse`
+            messages: The conversation sent, to estimate the tokens of the call
+            can_retry: Whether a failed call may be made again, always when omitted
+
+        Returns:
+            Any: The result of `func`
+        """
+        estimate = estimate_tokens(messages) if self._tokens is not None else 0
+        for attempt in itertools.count():
+            ticket = self._enqueue(estimate)
+            try:
+                with self._condition:
+                    delay = self._try_acquire(ticket)
+                    while delay is not None:
+                        self._condition.wait(delay)
+                        delay = self._try_acquire(ticket)
+            except BaseException:
+                self._cancel(ticket)
+                raise
+            try:
+                response = func()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._settle(estimate, response)
+            return response
+
+    async def acall(self, func: Callable[[], Awaitable[Any]], messages: List[Dict[str, Any]], can_retry: Optional[Callable[[], bool]] = None) -> Any:
+        """
+        asyncio counterpart of `call`, waiting without blocking the event loop.
+        """
+        import asyncio
+
+        estimate = estimate_tokens(messages) if self._tokens is not None else 0
+        for attempt in itertools.count():
+            ticket = self._enqueue(estimate)
+            try:
+                while True:
+                    with self._condition:
+                        delay = self._try_acquire(ticket)
+                    if delay is None:
+                        break
+                    # Polled, threads waiting on the condition are not woken up by an event loop
+                    await asyncio.sleep(min(delay, 0.05))
+            except BaseException:
+                self._cancel(ticket)
+                raise
+            try:
+                response = await func()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._settle(estimate, response)
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        The queue and wait time metrics.
+
+        Returns:
+            Dict[str, Any]: The current and maximum queue depth, the calls made, the retries and how many
+                of them were rate limits, and the total, mean and maximum seconds waited in the queue
+        """
+        with self._condition:
+            metrics = dict(self._metrics, queue_depth=len(self._queue))
+        metrics["wait_time_mean"] = metrics["wait_time_total"] / metrics["calls"] if metrics["calls"] else 0.0
+        return metrics
+
+    def _enqueue(self, estimate: int) -> List[Any]:
+        ticket = [_current_priority.get(), next(self._sequence), time.monotonic(), estimate]
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], len(self._queue))
+        return ticket
+
+    def _try_acquire(self, ticket: List[Any]) -> Optional[float]:
+        # Called with the condition held, returns None when the call may start, or the seconds to wait
+        if self._queue[0] is not ticket:
+            return 0.05
+        now = time.monotonic()
+        delay = self._blocked_until - now
+        for bucket, amount in ((self._requests, 1), (self._tokens, ticket[3])):
+            if bucket is not None:
+                bucket.refill(now)
+                delay = max(delay, bucket.delay(amount))
+        if delay > 0:
+            return delay
+        heapq.heappop(self._queue)
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= ticket[3]
+        waited = now - ticket[2]
+        self._metrics["calls"] += 1
+        self._metrics["wait_time_total"] += waited
+        self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], waited)
+        self._condition.notify_all()
+        return None
+
+    def _cancel(self, ticket: List[Any]):
+        with self._condition:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+    def _settle(self, estimate: int, response: Any):
+        # Replace the estimate by the tokens actually used
+        usage = getattr(response, "usage", None)
+        if self._tokens is None or not usage:
+            return
+        used = usage.get("total_tokens") or (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+        with self._condition:
+            self._tokens.level -= used - estimate
+
+    def _retry_delay(self, error: Exception, attempt: int, can_retry: Optional[Callable[[], bool]]) -> Optional[float]:
+        status_code = _status_code(error)
+        if status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries or (can_retry is not None and not can_retry()):
+            return None
+        # Full jitter, so the calls limited together do not retry together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        with self._condition:
+            self._metrics["retries"] += 1
+            if status_code == 429:
+                self._metrics["rate_limited"] += 1
+            if retry_after is not None:
+                delay = min(self.max_delay, retry_after)
+                # The provider asked every caller to wait
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        return delay
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    Estimate the prompt tokens of a conversation, about four characters per token.
+    """
+    return len(json.dumps(messages, separators=(",", ":"), default=str)) // 4
+
+def _status_code(error: Exception) -> Optional[int]:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+def prioritized_request(func: Callable) -> Callable:
+    """
+    Decorator of the `request` methods of the continuation agents, serving the model calls of a resumed
+    continuation, its nested sub-agents included, with `PRIORITY_RESUME`.
+    """
+    def enter(input: Any) -> Optional[Any]:
+        resumed = not isinstance(input, dict) or "continuation" in input or "continuation_id" in input
+        if resumed and _current_priority.get() > PRIORITY_RESUME:
+            return _current_priority.set(PRIORITY_RESUME)
+        return None
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, input, *args, **kwargs):
+            token = enter(input)
+            try:
+                return await func(self, input, *args, **kwargs)
+            finally:
+                if token:
+                    _current_priority.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, input, *args, **kwargs):
+        token = enter(input)
+        try:
+            return func(self, input, *args, **kwargs)
+        finally:
+            if token:
+                _current_priority.reset(token)
+    return wrapper
+
+_scheduler: Optional[ModelCallScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> ModelCallScheduler:
+    """
+    The scheduler of every model call of the process, without rate limits unless replaced.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ModelCallScheduler()
+    return _scheduler
+
+def set_scheduler(scheduler: Optional[ModelCallScheduler]):
+    """
+    Replace the scheduler of every model call of the process. `None` restores one without rate limits.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,136 @@
+"""
+Versioned binary envelope for continuations.
+
+Layout: MAGIC (4 bytes) | format version (1 byte) | codec (1 byte) | compression (1 byte) | payload
+
+The payload is the response or continuation dictionary encoded with the codec, then compressed.
+msgpack and zstd are used when the `msgpack` and `zstandard` packages are installed, otherwise
+JSON and zlib from the standard library are used. Decoding dispatches on the header, so an envelope
+can always be read back whatever the defaults of the library doing the decoding.
+"""
+
+from typing import Dict, Any, Optional, Union, BinaryIO, Iterator
+import importlib.util
+import struct
+import json
+import zlib
+
+MAGIC = b"ACNT"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct(">4sBBB")
+_CHUNK_SIZE = 64 * 1024
+
+CODECS = {"json": 1, "msgpack": 2}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2}
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def default_codec() -> str:
+    """msgpack when installed, JSON otherwise."""
+    return "msgpack" if _available("msgpack") else "json"
+
+def default_compression() -> str:
+    """zstd when installed, zlib otherwise."""
+    return "zstd" if _available("zstandard") else "zlib"
+
+def encode(obj: Dict[str, Any], codec: Optional[str] = None, compression: Optional[str] = None, level: Optional[int] = None) -> bytes:
+    """
+    Encode a response or continuation into a versioned binary envelope.
+
+    Args:
+        obj: The JSON-compatible dictionary to encode
+        codec: "json" or "msgpack", defaults to `default_codec()`
+        compression: "none", "zlib" or "zstd", defaults to `default_compression()`
+        level: Compression level, the compressor's default when omitted
+
+    Returns:
+        bytes: The envelope
+
+    Raises:
+        ValueError: If the codec or compression is unknown
+    """
+    codec = codec or default_codec()
+    compression = compression or default_compression()
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}, expected one of {list(CODECS)}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression}, expected one of {list(COMPRESSIONS)}")
+
+    if codec == "msgpack":
+        import msgpack
+        payload = msgpack.packb(obj, use_bin_type=True)
+    else:
+        payload = json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    if compression == "zlib":
+        payload = zlib.compress(payload, -1 if level is None else level)
+    elif compression == "zstd":
+        import zstandard
+        payload = zstandard.ZstdCompressor(level=3 if level is None else level).compress(payload)
+
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, CODECS[codec], COMPRESSIONS[compression]) + payload
+
+def decode(source: Union[bytes, bytearray, memoryview, BinaryIO]) -> Dict[str, Any]:
+    """
+    Decode a binary envelope, either from bytes or streamed from a binary file object.
+
+    Args:
+        source: The envelope bytes, or a binary file object positioned at the start of the envelope
+
+    Returns:
+        Dict[str, Any]: The decoded dictionary
+
+    Raises:
+        ValueError: If the data is not an envelope, or was written by a newer format version
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source)
+        header, chunks = bytes(data[:_HEADER.size]), iter([data[_HEADER.size:]])
+    else:
+        header, chunks = source.read(_HEADER.size), iter(lambda: source.read(_CHUNK_SIZE), b"")
+
+    if len(header) < _HEADER.size:
+        raise ValueError("Truncated continuation envelope")
+    magic, version, codec_id, compression_id = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Not a continuation envelope")
+    if version not in _DECODERS:
+        raise ValueError(f"Unsupported continuation format version {version}, this library reads versions {sorted(_DECODERS)}")
+    return _DECODERS[version](codec_id, compression_id, chunks)
+
+def is_envelope(data: Any) -> bool:
+    """Check whether a value is, or is a binary stream that may hold, an encoded envelope."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data[:len(MAGIC)]) == MAGIC
+    return hasattr(data, "read")
+
+def _decompress(compression_id: int, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    if compression_id == COMPRESSIONS["none"]:
+        yield from chunks
+    elif compression_id == COMPRESSIONS["zlib"]:
+        decompressor = zlib.decompressobj()
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+    elif compression_id == COMPRESSIONS["zstd"]:
+        import zstandard
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+    else:
+        raise ValueError(f"Unknown compression id {compression_id}")
+
+def _decode_v1(codec_id: int, compression_id: int, chunks: Iterator[bytes]) -> Dict[str, Any]:
+    if codec_id == CODECS["msgpack"]:
+        import msgpack
+        unpacker = msgpack.Unpacker(raw=False)
+        for chunk in _decompress(compression_id, chunks):
+            unpacker.feed(chunk)
+        return next(unpacker)
+    if codec_id == CODECS["json"]:
+        return json.loads(b"".join(_decompress(compression_id, chunks)))
+    raise ValueError(f"Unknown codec id {codec_id}")
+
+# One decoder per format version ever written, so stored continuations survive library upgrades
+_DECODERS = {1: _decode_v1}
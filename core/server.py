@@ -0,0 +1,298 @@
+"""
+Long-running local server exposing named agents over HTTP, on a TCP port or a unix socket.
+
+The agents stay in memory between requests, so their imports, clients and caches are warm. Requests and
+responses use the same dictionaries as `agent.request`:
+
+    POST /agents/<name>/request   {"prompt": "..."}
+    POST /agents/<name>/resume    {"continuation": {...}, "approval_info": [...]}, or a continuation_id, or the
+                                  binary envelope of `ContinuationAgent.dumps` with Content-Type application/octet-stream
+    GET  /agents                  the names of the agents
+    GET  /health                  {"status": "ok" | "draining", "active": ..., "workers": ..., "served": ...}
+
+At most `workers` requests run at the same time, the others wait for a free worker. The requests of async
+agents run on one event loop kept by the server, so their clients stay warm as well. Malformed requests are
+answered 400 before the agent runs, an unknown or expired `continuation_id` 404, and every error raised by
+the agent 500. On shutdown the server stops accepting requests, answering 503, and waits for the running
+ones to finish.
+
+Example:
+    server = AgentServer({"hr_agent": create_hr_agent(), "account_agent": get_account_agent()}, address="unix:/tmp/agents.sock")
+    server.serve_forever()  # until SIGINT or SIGTERM
+
+    curl --unix-socket /tmp/agents.sock -d '{"prompt": "Onboard stzhang"}' http://localhost/agents/hr_agent/request
+"""
+
+from typing import Dict, Any, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.continuation_store import UnknownContinuationError
+from core.clients import get_client_registry
+from core import serialization
+import socketserver
+import threading
+import inspect
+import asyncio
+import signal
+import json
+import os
+
+UNIX_PREFIX = "unix:"
+
+class AgentServer:
+    """
+    HTTP server of a registry of named agents.
+    """
+    def __init__(self, agents: Dict[str, Any], address: str = "127.0.0.1:8080", workers: int = 4, drain_timeout: float = 30.0):
+        """
+        Args:
+            agents: The agents by name, `request` may be a coroutine function
+            address: "host:port", port 0 picks a free port, or "unix:<path>" for a unix socket
+            workers: Maximum number of requests processed at the same time
+            drain_timeout: Seconds `shutdown` waits for the running requests by default
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if not agents:
+            raise ValueError("At least one agent is required")
+        self.agents = dict(agents)
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self.active = 0
+        self.served = 0
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        self._httpd = _bind(address)
+        self._httpd.agent_server = self
+
+    @property
+    def address(self) -> str:
+        """The address the server listens on, with the actual port when port 0 was asked."""
+        if isinstance(self._httpd, _UnixHTTPServer):
+            return UNIX_PREFIX + self._httpd.server_address
+        host, port = self._httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread.
+
+        Returns:
+            threading.Thread: The serving thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="agent-server", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def serve_forever(self):
+        """
+        Serve until SIGINT or SIGTERM, then drain and stop. Must be called from the main thread.
+        """
+        stop = threading.Event()
+        previous = {sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGINT, signal.SIGTERM)}
+        self.start()
+        try:
+            # Woken up regularly so the signal handlers get to run
+            while not stop.wait(0.5):
+                pass
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            self.shutdown()
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop accepting requests, wait for the running ones, and close the server.
+
+        Args:
+            timeout: Seconds to wait for the running requests, `drain_timeout` by default
+
+        Returns:
+            bool: Whether every running request finished in time
+        """
+        self.draining = True
+        with self._idle:
+            drained = self._idle.wait_for(lambda: self.active == 0, self.drain_timeout if timeout is None else timeout)
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        self._stop_loop()
+        if isinstance(self._httpd, _UnixHTTPServer) and os.path.exists(self._httpd.server_address):
+            os.remove(self._httpd.server_address)
+        return drained
+
+    def health(self) -> Dict[str, Any]:
+        """The state of the server, as returned by `GET /health`."""
+        return {"status": "draining" if self.draining else "ok", "active": self.active, "workers": self.workers, "served": self.served}
+
+    def handle(self, name: str, action: str, input: Any) -> Tuple[int, Dict[str, Any]]:
+        """
+        Run a request or a resume of an agent.
+
+        Args:
+            name: The agent name
+            action: "request" or "resume"
+            input: The decoded request body, a dictionary or a binary envelope
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: The HTTP status and the response body
+        """
+        agent = self.agents.get(name)
+        if agent is None:
+            return 404, {"error": f"Unknown agent {name}"}
+        try:
+            input = _validate(agent, action, input)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        with self._idle:
+            if self.draining:
+                return 503, {"error": "The server is shutting down"}
+            self.active += 1
+        try:
+            with self._slots:
+                return 200, self._run(agent.request(input))
+        except UnknownContinuationError as e:
+            return 404, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            with self._idle:
+                self.active -= 1
+                self.served += 1
+                self._idle.notify_all()
+
+    def _run(self, result: Any) -> Any:
+        # The coroutine of an async agent runs on the loop of the server, shared by all its requests
+        if not inspect.isawaitable(result):
+            return result
+        return asyncio.run_coroutine_threadsafe(result, self._get_loop()).result()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="agent-server-loop", daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    def _stop_loop(self):
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is None:
+            return
+        # The async clients are closed on their own loop before it stops
+        try:
+            asyncio.run_coroutine_threadsafe(get_client_registry().aclose_loop(), loop).result(5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+def _validate(agent: Any, action: str, input: Any) -> Any:
+    """
+    Check a request body before the agent runs, decoding binary envelopes.
+
+    Raises:
+        ValueError: If the body does not fit the action
+    """
+    if not isinstance(input, dict):
+        if action == "request":
+            raise ValueError("A binary envelope can only be resumed")
+        if not serialization.is_envelope(input):
+            raise ValueError("The body is not a continuation envelope")
+        return serialization.decode(input)
+    if action == "request":
+        if "prompt" not in input:
+            raise ValueError("A request needs a prompt, use resume to continue a conversation")
+        return input
+    if "continuation_id" in input and "continuation" not in input:
+        if getattr(agent, "store", None) is None:
+            raise ValueError("A continuation_id was given but the agent has no continuation store")
+        return input
+    if "continuation" not in input:
+        raise ValueError("A resume needs a continuation or a continuation_id")
+    continuation = input["continuation"]
+    if isinstance(continuation, dict):
+        if not isinstance(continuation.get("messages"), list):
+            raise ValueError("The continuation has no messages")
+    elif not serialization.is_envelope(continuation):
+        raise ValueError("The continuation must be an object or a continuation envelope")
+    approval_info = input.get("approval_info", [])
+    if not isinstance(approval_info, list) or not all(isinstance(item, dict) and isinstance(item.get("path_ids"), list) and item["path_ids"] for item in approval_info):
+        raise ValueError("approval_info must be a list of objects with their path_ids")
+    if not isinstance(input.get("tool_results", {}), dict):
+        raise ValueError("tool_results must be an object keyed by tool call id")
+    return input
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        agent_server = self.server.agent_server
+        if self.path == "/health":
+            self._reply(200, agent_server.health())
+        elif self.path == "/agents":
+            self._reply(200, {"agents": sorted(agent_server.agents)})
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if len(parts) != 3 or parts[0] != "agents" or parts[2] not in ("request", "resume"):
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        if self.headers.get("Content-Type", "").startswith("application/octet-stream"):
+            input = body
+        else:
+            try:
+                input = json.loads(body or b"{}")
+            except ValueError as e:
+                self._reply(400, {"error": f"Invalid JSON body: {e}"})
+                return
+            if not isinstance(input, dict):
+                self._reply(400, {"error": "The body must be a JSON object"})
+                return
+        self._reply(*self.server.agent_server.handle(parts[1], parts[2], input))
+
+    def _reply(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else UNIX_PREFIX
+
+    def log_message(self, format: str, *args):
+        pass
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def _bind(address: str) -> socketserver.BaseServer:
+    if address.startswith(UNIX_PREFIX):
+        path = address[len(UNIX_PREFIX):]
+        if os.path.exists(path):
+            # Left over by a server that did not shut down
+            os.remove(path)
+        return _UnixHTTPServer(path, _Handler)
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid address {address}, expected host:port or unix:<path>")
+    return _TCPHTTPServer((host, int(port)), _Handler)
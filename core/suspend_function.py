@@ -1,4 +1,7 @@
+from typing import Callable
+from core.request_context import RequestContext
 import functools
+import inspect
 
 class suspend_function:
     """
@@ -34,4 +37,72 @@ class suspend_function:
         for key, value in self.initial_state.items():
             setattr(wrapper, key, value)
 
-        return wrapper
\ No newline at end of file
+        return wrapper
+
+def accepts_context(func: Callable) -> bool:
+    """
+    Whether a suspension function takes the `RequestContext` as argument, functions without
+    positional parameters are called with no arguments.
+
+    The answer is kept on the function itself, so it lives as long as the function, which matters
+    for the closures built by `deadline`, `token_budget` and `max_turns` for every request.
+    """
+    flag = getattr(func, "_accepts_context", None)
+    if flag is None:
+        try:
+            parameters = inspect.signature(func).parameters.values()
+            flag = any(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD, p.VAR_POSITIONAL) for p in parameters)
+        except (TypeError, ValueError):
+            flag = False
+        try:
+            func._accepts_context = flag
+        except (AttributeError, TypeError):
+            # Bound methods and builtins, inspected on every call
+            pass
+    return flag
+
+def deadline(seconds: float) -> Callable[[RequestContext], bool]:
+    """
+    Built-in suspension function suspending the request once it has run for `seconds`.
+    Example: suspension_list=[deadline(30)]
+    """
+    if seconds < 0:
+        raise ValueError("seconds must not be negative")
+    def deadline(context: RequestContext) -> bool:
+        if context.elapsed < seconds:
+            return False
+        context.record_budget("deadline", seconds, context.elapsed)
+        return True
+    deadline._accepts_context = True
+    return deadline
+
+def token_budget(max_tokens: int) -> Callable[[RequestContext], bool]:
+    """
+    Built-in suspension function suspending the request once its model calls used `max_tokens`
+    prompt and completion tokens.
+    Example: suspension_list=[token_budget(20000)]
+    """
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be at least 1")
+    def token_budget(context: RequestContext) -> bool:
+        if context.total_tokens < max_tokens:
+            return False
+        context.record_budget("token_budget", max_tokens, context.total_tokens)
+        return True
+    token_budget._accepts_context = True
+    return token_budget
+
+def max_turns(turns: int) -> Callable[[RequestContext], bool]:
+    """
+    Built-in suspension function suspending the request after `turns` model calls.
+    Example: suspension_list=[max_turns(10)]
+    """
+    if turns < 1:
+        raise ValueError("turns must be at least 1")
+    def max_turns(context: RequestContext) -> bool:
+        if context.turns < turns:
+            return False
+        context.record_budget("max_turns", turns, context.turns)
+        return True
+    max_turns._accepts_context = True
+    return max_turns
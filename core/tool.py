@@ -1,36 +1,95 @@
 from typing import List, Callable, Dict, Any, Optional, Union
-from inspect import signature, getdoc, Parameter
+from core.tool_cache import ToolCache, LRUCache
+from core.tool_arguments import ArgumentValidator, annotation_to_schema, resolve_type_hints
+from core.process_pool import get_process_pool
+from inspect import signature, getdoc, Parameter, Signature, iscoroutinefunction
 from functools import wraps
+from collections import OrderedDict
+import threading
 import json
 
+_AGENT_SIGNATURE = Signature([Parameter("prompt", Parameter.KEYWORD_ONLY), Parameter("fields", Parameter.VAR_KEYWORD)])
+
 class Tool:
     def __init__(self, 
                  func: Callable, 
                  name: Optional[str] = None, 
                  description: Optional[str] = None,
                  need_approval: bool = False,
-                 is_agent: bool = False):
+                 is_agent: bool = False,
+                 cache: Union[bool, int, ToolCache, None] = None,
+                 force_cache: bool = False,
+                 executor: str = "thread",
+                 timeout: Optional[float] = None,
+                 defer_after: Optional[float] = None):
+        """
+        Args:
+            func: The function bound to the tool
+            name: The tool name, the function name by default
+            description: The tool description, the docstring of the function by default
+            need_approval: Whether calls must be approved before they are executed
+            is_agent: Whether the function is an agent request
+            cache: Memoize the results by tool name and arguments. True for an `LRUCache` of 128 entries,
+                an int for an `LRUCache` of that size, or any `ToolCache` such as a `DiskCache`
+            force_cache: Allow `cache` on tools that need approval, which are excluded by default.
+                Agent tools are never cached.
+            executor: "thread" to run the tool in the agent's threads, "process" to run it in the process pool
+                of `core.process_pool`, for CPU-bound tools. Process tools must be defined at the top level
+                of a module, their arguments and results must be picklable.
+            timeout: Seconds a process tool call may take once a worker has started it, waiting for a free
+                worker excluded. The model receives an error message when it is exceeded.
+            defer_after: Seconds a call may take before a continuation agent stops waiting for it and ends the
+                request with the `awaiting_tool_result` end_reason, see `core.deferred`. The call keeps running
+                in the background. Other agents wait for the result.
+        """
         self.func = func
         self.name = name or func.__name__
         self.description = description or getdoc(func) or ""
         self.need_approval = need_approval
         self.is_agent = is_agent
+        self.is_async = iscoroutinefunction(func)
         self.signature = signature(func)
+        type_hints = resolve_type_hints(func)
+        arguments = [param for param in self.signature.parameters.values() if param.kind not in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD)]
         self.parameters = {
             "prompt": {"type": "string"}
         } if self.is_agent else {
-            param_name: _annotation_to_json_schema_type(param.annotation)
-            for param_name, param in self.signature.parameters.items()
-            if param.annotation is not Parameter.empty
+            param.name: annotation_to_schema(type_hints.get(param.name, param.annotation))
+            for param in arguments
         }
+        # Parameters with a default value are optional for the model
+        self.required = ["prompt"] if self.is_agent else [param.name for param in arguments if param.default is Parameter.empty]
+        # Compiled once here, agent tools receive the prompt dictionary, with any other field the model adds
+        self.validate_arguments = ArgumentValidator(self.name, _AGENT_SIGNATURE, {"prompt": str}) if self.is_agent else ArgumentValidator(self.name, self.signature, type_hints)
         self.return_type = self.signature.return_annotation
+        self.cache = _make_cache(cache)
+        if self.cache is not None and is_agent:
+            raise ValueError(f"Tool {self.name} is an agent, its results cannot be cached")
+        if self.cache is not None and need_approval and not force_cache:
+            raise ValueError(f"Tool {self.name} needs approval, its results are not cached unless force_cache=True")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor {executor}, expected 'thread' or 'process'")
+        if executor == "process":
+            if is_agent or self.is_async:
+                raise ValueError(f"Tool {self.name} is an agent or a coroutine function, it cannot run in a process")
+            if "<locals>" in func.__qualname__:
+                raise ValueError(f"Tool {self.name} is defined inside a function, process tools must be importable from the top level of their module")
+        if timeout is not None and (executor != "process" or timeout <= 0):
+            raise ValueError("timeout must be positive, and is only supported with executor='process'")
+        if defer_after is not None and (is_agent or defer_after <= 0):
+            raise ValueError("defer_after must be positive, and is not supported by agent tools")
+        self.executor = executor
+        self.timeout = timeout
+        self.defer_after = defer_after
 
     
     def __call__(self, *args, **kwargs):
+        if self.executor == "process":
+            return get_process_pool().call(self.func.__module__, self.func.__qualname__, args, kwargs, self.timeout)
         return self.func(*args, **kwargs)
     
     def __repr__(self):
-        return f"Tool(name='{self.name}', parameters={self.parameters}, require_approval={self.need_approval}, is_agent={self.is_agent})"
+        return f"Tool(name='{self.name}', parameters={self.parameters}, require_approval={self.need_approval}, is_agent={self.is_agent}, is_async={self.is_async}, executor='{self.executor}')"
     
     def to_openai_function(self) -> Dict[str, Any]:
         """Convert the Tool to a format suitable for OpenAI API."""
@@ -45,58 +104,77 @@ class Tool:
                         param_name: param_type
                         for param_name, param_type in self.parameters.items()
                     },
-                    "required": list(self.parameters.keys())
+                    "required": self.required
                 }
             }
         }
     
-def _annotation_to_json_schema_type(annotation):
-    """Convert Python type annotations to JSON Schema types."""
-    # Basic type mappings
-    type_mapping = {
-        str: "string",
-        int: "integer",
-        float: "number",
-        bool: "boolean",
-        list: "array",
-        dict: "object",
-        None: "null"
-    }
-    
-    # Handle typing module types
-    if hasattr(annotation, "__origin__"):
-        origin = annotation.__origin__
-        if origin is list or origin is set:
-            # For List[int], etc.
-            return {
-                "type": "array",
-                "items": _annotation_to_json_schema_type(annotation.__args__[0]) if hasattr(annotation, "__args__") else {}
-            }
-        elif origin is dict:
-            # For Dict[str, int], etc.
-            if hasattr(annotation, "__args__"):
-                key_type, value_type = annotation.__args__
-                if key_type is str:  # JSON only supports string keys
-                    return {
-                        "type": "object",
-                        "additionalProperties": _annotation_to_json_schema_type(value_type)
-                    }
-            return {"type": "object"}
-        elif origin is Union:
-            # For Union[str, int], Optional[str], etc.
-            types = [_annotation_to_json_schema_type(arg) for arg in annotation.__args__]
-            return {"anyOf": types}
-    
-    # For basic types
-    if annotation in type_mapping:
-        return {"type": type_mapping[annotation]}
-    
-    # For class annotations (custom classes)
-    if isinstance(annotation, type):
-        return {"type": "object"}
-    
-    # Default fallback
-    return {}
+class ToolSchemas:
+    """
+    The OpenAI tool payload of a tool set, built once and shared by every agent using the same tools.
+    """
+    def __init__(self, tools: List[Callable]):
+        self.payload = [tool._tool.to_openai_function() for tool in tools]
+        self.stale = False
+        self._json_bytes = None
+
+    @property
+    def json_bytes(self) -> bytes:
+        """The payload serialized as compact JSON, built on first access."""
+        if self._json_bytes is None:
+            self._json_bytes = json.dumps(self.payload, separators=(",", ":")).encode("utf-8")
+        return self._json_bytes
+
+# Keyed by the tuple of Tool instances so agents built from the same tools share one payload. Bounded, so tools
+# redefined at runtime do not accumulate; an evicted payload is marked stale and its agents fetch it again.
+_TOOL_SCHEMA_CACHE_SIZE = 256
+_tool_schema_cache: "OrderedDict[tuple, ToolSchemas]" = OrderedDict()
+_tool_schema_cache_lock = threading.Lock()
+
+def get_tool_schemas(tools: List[Callable]) -> ToolSchemas:
+    """
+    Get the cached tool payload of a tool set, building it on first use.
+
+    Args:
+        tools: The decorated tool functions
+
+    Returns:
+        ToolSchemas: The shared payload of the tool set
+    """
+    key = tuple(tool._tool for tool in tools)
+    with _tool_schema_cache_lock:
+        schemas = _tool_schema_cache.get(key)
+        if schemas is None:
+            schemas = _tool_schema_cache[key] = ToolSchemas(tools)
+            while len(_tool_schema_cache) > _TOOL_SCHEMA_CACHE_SIZE:
+                _tool_schema_cache.popitem(last=False)[1].stale = True
+        else:
+            _tool_schema_cache.move_to_end(key)
+    return schemas
+
+def invalidate_tool_schemas(tools: Optional[List[Callable]] = None):
+    """
+    Drop cached tool payloads so they are rebuilt on next use.
+
+    Args:
+        tools: Only drop the payloads containing any of these tools. Drops every payload when omitted.
+    """
+    changed = None if tools is None else set(tool._tool for tool in tools)
+    with _tool_schema_cache_lock:
+        for key in list(_tool_schema_cache):
+            if changed is None or changed.intersection(key):
+                _tool_schema_cache.pop(key).stale = True
+
+def _make_cache(cache: Union[bool, int, ToolCache, None]) -> Optional[ToolCache]:
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return LRUCache()
+    if isinstance(cache, int):
+        return LRUCache(maxsize=cache)
+    if isinstance(cache, ToolCache):
+        return cache
+    raise ValueError(f"Unsupported cache option {cache!r}, expected a bool, an int or a ToolCache")
 
 def tool(**kwargs):
     """Decorator to register a function as a tool/capability."""
@@ -107,9 +185,14 @@ def tool(**kwargs):
         # Preserve the tool instance on the function for later access
         func._tool = tool_instance
         
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            return tool_instance(*args, **kwargs)
+        if tool_instance.is_async:
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await tool_instance(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return tool_instance(*args, **kwargs)
         
         # Attach the tool instance to the wrapper as well
         wrapper._tool = tool_instance
@@ -0,0 +1,344 @@
+from typing import Dict, Any, Callable, List, Optional, Union, Tuple, Literal, get_type_hints, get_origin, get_args, is_typeddict
+from inspect import Signature, Parameter
+from collections.abc import Sequence, Mapping
+import dataclasses
+import enum
+import json
+
+class ToolArgumentError(ValueError):
+    """
+    Arguments of a tool call that do not match the tool signature. The message is meant for the model.
+    """
+
+def annotation_to_schema(annotation: Any) -> Dict[str, Any]:
+    """
+    Convert a Python type annotation to a JSON Schema.
+
+    Supports the basic types, containers, Optional/Union, Literal, Enum, dataclasses and TypedDict.
+    Annotations without a JSON Schema equivalent map to the empty schema, accepting any value.
+
+    Args:
+        annotation: The type annotation
+
+    Returns:
+        Dict[str, Any]: The JSON Schema
+    """
+    return _schema(annotation, set())
+
+def compile_converter(annotation: Any) -> Callable[[Any, str], Any]:
+    """
+    Compile a function validating a JSON value against a type annotation and converting it to that type.
+
+    Lenient conversions are applied where the intent is unambiguous, such as "3" to 3 for an `int`,
+    a list to a tuple, or a dictionary to a dataclass instance.
+
+    Args:
+        annotation: The type annotation
+
+    Returns:
+        Callable[[Any, str], Any]: Takes the value and its path in the arguments, returns the converted
+            value or raises `ToolArgumentError`
+    """
+    return _converter(annotation, {})
+
+class ArgumentValidator:
+    """
+    Validator and converter of the arguments of a tool, compiled once from the function signature.
+    """
+    def __init__(self, tool_name: str, signature: Signature, type_hints: Dict[str, Any]):
+        """
+        Args:
+            tool_name: The tool name, used in the error messages
+            signature: The signature of the tool function
+            type_hints: The resolved annotations of the tool function
+        """
+        self.tool_name = tool_name
+        self.converters: Dict[str, Callable[[Any, str], Any]] = {}
+        self.required: List[str] = []
+        self.accepts_extra = False
+        for name, param in signature.parameters.items():
+            if param.kind == Parameter.VAR_KEYWORD:
+                self.accepts_extra = True
+            elif param.kind != Parameter.VAR_POSITIONAL:
+                self.converters[name] = compile_converter(type_hints.get(name, Any))
+                if param.default is Parameter.empty:
+                    self.required.append(name)
+
+    def __call__(self, arguments: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Parse, validate and convert the arguments of a tool call.
+
+        Args:
+            arguments: The arguments chosen by the model, as a JSON string or a dictionary
+
+        Returns:
+            Dict[str, Any]: The keyword arguments of the tool function
+
+        Raises:
+            ToolArgumentError: Describing every invalid argument
+        """
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError as e:
+                raise ToolArgumentError(f"Invalid arguments for tool {self.tool_name}: not valid JSON ({e})")
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError(f"Invalid arguments for tool {self.tool_name}: expected a JSON object")
+
+        errors = [f"missing required argument '{name}'" for name in self.required if name not in arguments]
+        converted = {}
+        for name, value in arguments.items():
+            converter = self.converters.get(name)
+            if converter is None:
+                if self.accepts_extra:
+                    converted[name] = value
+                else:
+                    errors.append(f"unexpected argument '{name}'")
+                continue
+            try:
+                converted[name] = converter(value, name)
+            except ToolArgumentError as e:
+                errors.append(str(e))
+        if errors:
+            raise ToolArgumentError(f"Invalid arguments for tool {self.tool_name}: " + "; ".join(errors))
+        return converted
+
+def resolve_type_hints(func: Callable) -> Dict[str, Any]:
+    """The annotations of a function with string annotations resolved, the raw annotations if they cannot be."""
+    try:
+        return get_type_hints(func)
+    except Exception:
+        return dict(getattr(func, "__annotations__", {}))
+
+_BASIC_SCHEMAS = {
+    str: {"type": "string"},
+    int: {"type": "integer"},
+    float: {"type": "number"},
+    bool: {"type": "boolean"},
+    list: {"type": "array"},
+    tuple: {"type": "array"},
+    set: {"type": "array"},
+    dict: {"type": "object"},
+    type(None): {"type": "null"},
+    None: {"type": "null"}
+}
+
+def _schema(annotation: Any, seen: set) -> Dict[str, Any]:
+    if annotation in _BASIC_SCHEMAS:
+        return dict(_BASIC_SCHEMAS[annotation])
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is Union:
+        return {"anyOf": [_schema(arg, seen) for arg in args]}
+    if origin is Literal:
+        types = {_BASIC_SCHEMAS.get(type(value), {}).get("type") for value in args}
+        schema = {"enum": list(args)}
+        if len(types) == 1 and None not in types:
+            schema["type"] = types.pop()
+        return schema
+    if origin in (list, set, frozenset) or (origin is tuple and len(args) == 2 and args[1] is Ellipsis) or _is_sequence_origin(origin):
+        return {"type": "array", "items": _schema(args[0], seen)} if args else {"type": "array"}
+    if origin is tuple:
+        return {"type": "array", "items": {"anyOf": [_schema(arg, seen) for arg in args]}, "minItems": len(args), "maxItems": len(args)} if args else {"type": "array"}
+    if origin is dict or _is_mapping_origin(origin):
+        return {"type": "object", "additionalProperties": _schema(args[1], seen)} if args else {"type": "object"}
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        values = [member.value for member in annotation]
+        schema = {"enum": values}
+        types = {_BASIC_SCHEMAS.get(type(value), {}).get("type") for value in values}
+        if len(types) == 1 and None not in types:
+            schema["type"] = types.pop()
+        return schema
+    if (dataclasses.is_dataclass(annotation) and isinstance(annotation, type)) or is_typeddict(annotation):
+        if annotation in seen:
+            # Recursive type, the nested level is left open
+            return {"type": "object"}
+        seen = seen | {annotation}
+        hints = resolve_type_hints(annotation)
+        properties = {name: _schema(hint, seen) for name, hint in hints.items() if name in _field_names(annotation)}
+        return {"type": "object", "properties": properties, "required": _required_fields(annotation)}
+    if annotation is Any or annotation is Parameter.empty:
+        return {}
+    if isinstance(annotation, type):
+        return {"type": "object"}
+    return {}
+
+def _is_sequence_origin(origin: Any) -> bool:
+    return isinstance(origin, type) and issubclass(origin, Sequence) and not issubclass(origin, (str, bytes, tuple))
+
+def _is_mapping_origin(origin: Any) -> bool:
+    return isinstance(origin, type) and issubclass(origin, Mapping)
+
+def _field_names(cls: type) -> List[str]:
+    if dataclasses.is_dataclass(cls):
+        return [field.name for field in dataclasses.fields(cls) if field.init]
+    return list(resolve_type_hints(cls))
+
+def _required_fields(cls: type) -> List[str]:
+    if dataclasses.is_dataclass(cls):
+        return [field.name for field in dataclasses.fields(cls)
+                if field.init and field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING]
+    return sorted(cls.__required_keys__)
+
+def _fail(path: str, expected: str, value: Any):
+    raise ToolArgumentError(f"'{path}' expected {expected}, got {json.dumps(value, default=str)[:80]}")
+
+def _identity(value: Any, path: str) -> Any:
+    return value
+
+def _to_str(value: Any, path: str) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    _fail(path, "a string", value)
+
+def _to_int(value: Any, path: str) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    _fail(path, "an integer", value)
+
+def _to_float(value: Any, path: str) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            pass
+    _fail(path, "a number", value)
+
+def _to_bool(value: Any, path: str) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    _fail(path, "a boolean", value)
+
+def _to_none(value: Any, path: str) -> None:
+    if value is not None:
+        _fail(path, "null", value)
+    return None
+
+_BASIC_CONVERTERS = {
+    str: _to_str,
+    int: _to_int,
+    float: _to_float,
+    bool: _to_bool,
+    type(None): _to_none,
+    None: _to_none
+}
+
+def _converter(annotation: Any, compiled: Dict[Any, Callable]) -> Callable[[Any, str], Any]:
+    if annotation in _BASIC_CONVERTERS:
+        return _BASIC_CONVERTERS[annotation]
+    if annotation is Any or annotation is Parameter.empty:
+        return _identity
+    # Recursive types refer to the converter being compiled through this indirection
+    try:
+        if annotation in compiled:
+            return lambda value, path: compiled[annotation](value, path)
+    except TypeError:
+        pass
+
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is Union:
+        return _union_converter(annotation, args, compiled)
+    if origin is Literal:
+        allowed = list(args)
+        def literal(value, path):
+            if value in allowed:
+                return allowed[allowed.index(value)]
+            _fail(path, f"one of {json.dumps(allowed, default=str)}", value)
+        return literal
+    if annotation in (list, set, frozenset, tuple) or origin in (list, set, frozenset) or _is_sequence_origin(origin) \
+            or (origin is tuple and (not args or (len(args) == 2 and args[1] is Ellipsis))):
+        container = origin or annotation
+        if container not in (set, frozenset, tuple):
+            container = list
+        item = _converter(args[0], compiled) if args else _identity
+        def sequence(value, path):
+            if not isinstance(value, (list, tuple)):
+                _fail(path, "an array", value)
+            return container(item(element, f"{path}[{i}]") for i, element in enumerate(value))
+        return sequence
+    if origin is tuple:
+        items = [_converter(arg, compiled) for arg in args]
+        def fixed_tuple(value, path):
+            if not isinstance(value, (list, tuple)) or len(value) != len(items):
+                _fail(path, f"an array of {len(items)} items", value)
+            return tuple(convert(element, f"{path}[{i}]") for i, (convert, element) in enumerate(zip(items, value)))
+        return fixed_tuple
+    if annotation is dict or origin is dict or _is_mapping_origin(origin):
+        key = _converter(args[0], compiled) if args else _identity
+        item = _converter(args[1], compiled) if args else _identity
+        def mapping(value, path):
+            if not isinstance(value, dict):
+                _fail(path, "an object", value)
+            return {key(k, path): item(v, f"{path}.{k}") for k, v in value.items()}
+        return mapping
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        members = {member.value: member for member in annotation}
+        names = {member.name: member for member in annotation}
+        def enumeration(value, path):
+            if isinstance(value, annotation):
+                return value
+            try:
+                if value in members:
+                    return members[value]
+            except TypeError:
+                pass
+            if isinstance(value, str) and value in names:
+                return names[value]
+            _fail(path, f"one of {json.dumps(list(members), default=str)}", value)
+        return enumeration
+    if (dataclasses.is_dataclass(annotation) and isinstance(annotation, type)) or is_typeddict(annotation):
+        return _record_converter(annotation, compiled)
+    if isinstance(annotation, type):
+        # Other classes are passed through as decoded from JSON, as before validation existed
+        return _identity
+    return _identity
+
+def _union_converter(annotation: Any, args: Tuple[Any, ...], compiled: Dict[Any, Callable]) -> Callable[[Any, str], Any]:
+    converters = [_converter(arg, compiled) for arg in args]
+    # A value already of one of the types is kept as is, before trying the lenient conversions in order
+    exact = [(arg, convert) for arg, convert in zip(args, converters) if arg in _BASIC_CONVERTERS]
+    def union(value, path):
+        for arg, convert in exact:
+            if (arg in (None, type(None)) and value is None) or (isinstance(arg, type) and type(value) is arg):
+                return value
+        errors = []
+        for convert in converters:
+            try:
+                return convert(value, path)
+            except ToolArgumentError as e:
+                errors.append(str(e))
+        raise ToolArgumentError(" or ".join(errors))
+    return union
+
+def _record_converter(cls: type, compiled: Dict[Any, Callable]) -> Callable[[Any, str], Any]:
+    typed_dict = is_typeddict(cls)
+    def record(value, path):
+        if not typed_dict and isinstance(value, cls):
+            return value
+        if not isinstance(value, dict):
+            _fail(path, "an object", value)
+        missing = [name for name in required if name not in value]
+        if missing:
+            raise ToolArgumentError(f"'{path}' is missing {', '.join(repr(name) for name in missing)}")
+        unexpected = [name for name in value if name not in fields]
+        if unexpected:
+            raise ToolArgumentError(f"'{path}' has unexpected {', '.join(repr(name) for name in unexpected)}")
+        converted = {name: fields[name](item, f"{path}.{name}") for name, item in value.items()}
+        return converted if typed_dict else cls(**converted)
+    compiled[cls] = record
+    hints = resolve_type_hints(cls)
+    fields = {name: _converter(hints.get(name, Any), compiled) for name in _field_names(cls)}
+    required = _required_fields(cls)
+    return record
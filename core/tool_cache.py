@@ -0,0 +1,154 @@
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+import threading
+import sqlite3
+import pickle
+import time
+import json
+
+def make_cache_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """
+    Build the cache key of a tool call from the tool name and its canonicalized arguments.
+
+    Args:
+        tool_name: The name of the tool
+        arguments: The keyword arguments of the call
+
+    Returns:
+        str: The key, identical for calls whose arguments only differ in key order or whitespace
+    """
+    return tool_name + ":" + json.dumps(arguments, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+class ToolCache(ABC):
+    """
+    Memoization cache of tool results, with hit and miss counters.
+
+    Subclasses implement `_get`, `_set` and `clear`.
+    """
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        Args:
+            ttl: Seconds a result stays valid, forever when omitted
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up a result.
+
+        Returns:
+            Tuple[bool, Any]: Whether the key was found, and the cached result
+        """
+        found, value = self._get(key)
+        with self._counter_lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found, value
+
+    def set(self, key: str, value: Any):
+        """Store a result."""
+        self._set(key, value, None if self.ttl is None else time.time() + self.ttl)
+
+    def stats(self) -> Dict[str, int]:
+        """The hit and miss counters."""
+        return {"hits": self.hits, "misses": self.misses}
+
+    @abstractmethod
+    def clear(self):
+        """Drop every cached result."""
+
+    @abstractmethod
+    def _get(self, key: str) -> Tuple[bool, Any]:
+        """Look up a result, without counting the hit or the miss."""
+
+    @abstractmethod
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        """Store a result, valid until the `expires_at` timestamp, forever when None."""
+
+class LRUCache(ToolCache):
+    """
+    In-process cache keeping the `maxsize` most recently used results.
+    """
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        """
+        Args:
+            maxsize: Maximum number of cached results
+            ttl: Seconds a result stays valid, forever when omitted
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+class DiskCache(ToolCache):
+    """
+    SQLite-backed cache, shared across conversations and processes using the same file.
+
+    Results are pickled, so they must be picklable.
+    """
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        """
+        Args:
+            path: Path of the SQLite database file
+            ttl: Seconds a result stays valid, forever when omitted
+        """
+        super().__init__(ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS tool_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM tool_cache")
+
+    def _get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM tool_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            if row[1] is not None and row[1] <= time.time():
+                self._connection.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+                return False, None
+        return True, pickle.loads(row[0])
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        blob = pickle.dumps(value)
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO tool_cache (key, value, expires_at) VALUES (?, ?, ?)", (key, blob, expires_at))
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
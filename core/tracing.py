@@ -0,0 +1,271 @@
+"""
+Spans around the agent loop: requests, model calls, tool calls, suspension checks and continuation
+flatten/reconstruct.
+
+The current span is kept in a context variable, so the spans of a sub-agent called as a tool are
+children of the tool call span, also when tool calls run on a thread pool or as asyncio tasks.
+Spans are only created while a processor is registered with `add_processor`, or while a request of
+an agent created with `trace=True` is running, otherwise the instrumented methods are called directly.
+
+Example:
+    add_processor(JSONLExporter("spans.jsonl"))
+    hr_agent = ContinuationAgent(instruction=..., tools=[...], trace=True)
+    response = hr_agent.request({"prompt": "..."})
+    response["trace"]  # {"trace_id": ..., "duration": ..., "prompt_tokens": ..., "spans": {"model.call": {...}, ...}}
+"""
+
+from typing import Dict, Any, Optional, List, Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import threading
+import inspect
+import json
+import time
+import uuid
+
+class Span:
+    """
+    A timed operation, with its parent span and attributes such as the tool name or the token usage.
+    """
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+    def __repr__(self):
+        return f"Span(name='{self.name}', span_id='{self.span_id}', parent_id={self.parent_id!r}, duration={self.duration})"
+
+class SpanProcessor:
+    """
+    Hook receiving every span. Subclasses override `on_start` and/or `on_end`.
+    """
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+class TraceCollector(SpanProcessor):
+    """
+    Built-in collector summarizing the spans of one top-level request, including its sub-agents.
+    """
+    def __init__(self):
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def summary(self, root: Span) -> Dict[str, Any]:
+        """
+        Timing and token summary of the request.
+
+        Args:
+            root: The span of the top-level request
+
+        Returns:
+            Dict[str, Any]: The request duration, the tokens of every model call, and the count and total
+                duration of the spans of each name
+        """
+        spans: Dict[str, Dict[str, Any]] = {}
+        prompt_tokens = completion_tokens = 0
+        with self._lock:
+            collected = list(self._spans)
+        for span in collected:
+            entry = spans.setdefault(span.name, {"count": 0, "duration": 0.0, "errors": 0})
+            entry["count"] += 1
+            entry["duration"] += span.duration or 0.0
+            entry["errors"] += span.error is not None
+            prompt_tokens += span.attributes.get("prompt_tokens") or 0
+            completion_tokens += span.attributes.get("completion_tokens") or 0
+        return {
+            "trace_id": root.trace_id,
+            "duration": root.duration,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "spans": spans
+        }
+
+class JSONLExporter(SpanProcessor):
+    """
+    Append every finished span as a JSON line to a local file.
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path: The JSONL file, created when missing
+        """
+        self.path = path
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """Close the file."""
+        with self._lock:
+            self._file.close()
+
+_processors: List[SpanProcessor] = []
+_current_span: ContextVar[Optional[Span]] = ContextVar("agent_current_span", default=None)
+_current_collector: ContextVar[Optional[TraceCollector]] = ContextVar("agent_trace_collector", default=None)
+
+def add_processor(processor: SpanProcessor):
+    """Register a processor receiving the spans of every agent."""
+    _processors.append(processor)
+
+def remove_processor(processor: SpanProcessor):
+    """Unregister a processor."""
+    _processors.remove(processor)
+
+def is_enabled() -> bool:
+    """Whether spans are being recorded in the current context."""
+    return bool(_processors) or _current_collector.get() is not None
+
+def current_span() -> Optional[Span]:
+    """The innermost open span of the current context."""
+    return _current_span.get()
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Open a child span of the current span. Yields `None` when tracing is disabled.
+
+    Example:
+        with span("model.call", model=model) as current:
+            ...
+            if current:
+                current.set(prompt_tokens=usage["prompt_tokens"])
+    """
+    if not is_enabled():
+        yield None
+        return
+    collector = _current_collector.get()
+    current = Span(name, _current_span.get(), attributes)
+    for processor in _processors:
+        processor.on_start(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration = time.perf_counter() - current._started
+        if collector is not None:
+            collector.on_end(current)
+        for processor in _processors:
+            processor.on_end(current)
+
+def traced(name: str, attributes: Optional[Callable[..., Dict[str, Any]]] = None) -> Callable:
+    """
+    Decorator running a function or coroutine function inside a span.
+
+    Args:
+        name: The span name
+        attributes: Builds the span attributes from the arguments of the call
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not is_enabled():
+                    return await func(*args, **kwargs)
+                with span(name, **(attributes(*args, **kwargs) if attributes else {})):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with span(name, **(attributes(*args, **kwargs) if attributes else {})):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traced_request(func: Callable) -> Callable:
+    """
+    Decorator of the `request` methods, opening the `agent.request` span.
+
+    The top-level request of an agent created with `trace=True` starts a `TraceCollector`, shared by the
+    sub-agents it calls, and attaches its summary to the `trace` field of the response.
+    """
+    def start(agent) -> Optional[TraceCollector]:
+        if getattr(agent, "trace", False) and _current_collector.get() is None:
+            return TraceCollector()
+        return None
+
+    def finish(response: Any, root: Optional[Span], collector: Optional[TraceCollector]) -> Any:
+        if collector is not None and root is not None and isinstance(response, dict):
+            response["trace"] = collector.summary(root)
+        return response
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, *args, **kwargs):
+            collector = start(self)
+            if collector is None and not is_enabled():
+                return await func(self, *args, **kwargs)
+            token = _current_collector.set(collector) if collector else None
+            try:
+                with span("agent.request", agent=type(self).__name__) as root:
+                    response = await func(self, *args, **kwargs)
+                return finish(response, root, collector)
+            finally:
+                if token:
+                    _current_collector.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        collector = start(self)
+        if collector is None and not is_enabled():
+            return func(self, *args, **kwargs)
+        token = _current_collector.set(collector) if collector else None
+        try:
+            with span("agent.request", agent=type(self).__name__) as root:
+                response = func(self, *args, **kwargs)
+            return finish(response, root, collector)
+        finally:
+            if token:
+                _current_collector.reset(token)
+    return wrapper
+
+def record_usage(current: Optional[Span], usage: Optional[Dict[str, Any]], **attributes):
+    """Add the token usage of a model response, and other attributes, to a span if there is one."""
+    if current is None:
+        return
+    if usage:
+        attributes["prompt_tokens"] = usage.get("prompt_tokens")
+        attributes["completion_tokens"] = usage.get("completion_tokens")
+    current.set(**attributes)
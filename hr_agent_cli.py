@@ -2,7 +2,8 @@ from core.continuation_agent import ContinuationAgent
 from core.agent import Agent
 from core.tool import tool
 from core.suspend_function import suspend_function
-from account_agent import account_agent
+from core.request_context import RequestContext
+from account_agent import get_account_agent
 import json
 
 HR_AGENT_SYSTEM_PROMPT = """
@@ -46,23 +47,29 @@ def send_email_tool(recipient: str, subject: str, message: str):
 @tool(is_agent=True)
 def account_agent_tool(*args, **kwargs):
     """This tool handles all account-related tasks based on natural language instructions. It can create accounts, assign security levels, and manage user access as needed. Input example: \"Help me open an account for our new colleague with username: tfan.\""""
-    return account_agent.request(*args, **kwargs)
+    return get_account_agent().request(*args, **kwargs)
 
 @suspend_function(n=2)
-def pause_per_n() -> bool:
+def pause_per_n(context: RequestContext) -> bool:
     """
     This function demonstrates the usage of the suspend_function decorator.
-    It pauses for 'n' calls and then returns False.
+    It lets the request make 'n' model calls and then returns True.
     """
-    # Access the state variable 'n' directly from the function object
+    # Access the configuration variable 'n' directly from the function object
     # The decorator attaches 'n' as an attribute to the decorated function (pause_per_n)
-    res = pause_per_n.n > 0
-    if res:
-        pause_per_n.n -= 1
-    return not res
+    # The per-request progress lives in the context, so concurrent requests do not share state
+    return context.turns >= pause_per_n.n
 
-hr_agent = ContinuationAgent(instruction=HR_AGENT_SYSTEM_PROMPT, tools=[send_email_tool, account_agent_tool], suspension_list=[pause_per_n])
-# hr_agent = Agent(instruction=HR_AGENT_SYSTEM_PROMPT, tools=[send_email_tool, account_agent_tool])
+def create_hr_agent(**options) -> ContinuationAgent:
+    """
+    Build the HR agent. The account agent it calls is built by its first call, and the model clients
+    by the first request.
+
+    Args:
+        **options: Keyword arguments of `ContinuationAgent`, such as `store`
+    """
+    # return Agent(instruction=HR_AGENT_SYSTEM_PROMPT, tools=[send_email_tool, account_agent_tool])
+    return ContinuationAgent(instruction=HR_AGENT_SYSTEM_PROMPT, tools=[send_email_tool, account_agent_tool], suspension_list=[pause_per_n], **options)
 
 if __name__ == "__main__":
     import argparse
@@ -72,9 +79,59 @@ if __name__ == "__main__":
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--json", help="Path to a JSON file containing the prompt dictionary.")
     group.add_argument("--prompt", help="A string prompt to be used as input.")
+    group.add_argument("--binary", help="Path to a binary continuation envelope written with --binary-output.")
+    group.add_argument("--batch", help="Path to a JSONL file with one prompt dictionary or continuation per line.")
+    group.add_argument("--serve", metavar="ADDRESS", help="Serve the HR and account agents on host:port or unix:<path> until interrupted.")
+    parser.add_argument("--binary-output", help="Also write the response as a binary continuation envelope to this path.")
+    parser.add_argument("--store", help="Keep continuations in this directory and return a continuation_id, resume with {\"continuation_id\": ..., \"approval_info\": [...]}.")
+    parser.add_argument("--recordings", help="Answer the model calls of every agent from this SQLite recordings file, see --record-mode.")
+    parser.add_argument("--record-mode", choices=["record", "replay", "passthrough"], default="record", help="With --recordings, record the missing model calls, replay only, or bypass the recordings.")
+    parser.add_argument("--rpm", type=float, help="Limit the model calls of every agent to this many requests per minute.")
+    parser.add_argument("--tpm", type=float, help="Limit the model calls of every agent to this many tokens per minute.")
+    parser.add_argument("--output", help="With --batch, the JSONL file receiving one response record per line.")
+    parser.add_argument("--pending", help="With --batch, write the responses waiting for an approval or a resume to this JSONL file instead.")
+    parser.add_argument("--checkpoint", help="With --batch, record the finished lines in this file and skip them when run again.")
+    parser.add_argument("--workers", type=int, default=4, help="With --batch or --serve, the number of requests processed at the same time.")
+    parser.add_argument("--order", choices=["input", "completion"], default="input", help="With --batch, write the records in input or completion order.")
 
     args = parser.parse_args()
 
+    # The optional features are imported when they are used, to keep one-shot runs fast
+    hr_agent = create_hr_agent()
+    if args.store:
+        from core.continuation_store import FileContinuationStore
+        hr_agent.store = FileContinuationStore(args.store)
+
+    if args.recordings:
+        from core.record_replay import RecordReplayBackend
+        from core.model_backend import set_default_backend
+        # The default backend, so the account agent nested in the HR agent is recorded too
+        set_default_backend(RecordReplayBackend(path=args.recordings, mode=args.record_mode))
+
+    if args.rpm or args.tpm:
+        from core.scheduler import ModelCallScheduler, set_scheduler
+        set_scheduler(ModelCallScheduler(requests_per_minute=args.rpm, tokens_per_minute=args.tpm))
+
+    if args.serve:
+        from core.server import AgentServer
+        server = AgentServer({"hr_agent": hr_agent, "account_agent": get_account_agent()}, address=args.serve, workers=args.workers)
+        print(f"Serving hr_agent and account_agent on {server.address}")
+        server.serve_forever()
+        exit(0)
+
+    if args.batch:
+        if not args.output:
+            parser.error("--output is required with --batch")
+        from core.batch import BatchRunner
+        runner = BatchRunner(hr_agent, workers=args.workers, order=args.order, checkpoint_path=args.checkpoint, pending_path=args.pending)
+        try:
+            summary = runner.run(args.batch, args.output)
+        except FileNotFoundError:
+            print(f"Error: JSONL file not found at {args.batch}")
+            exit(1)
+        print(json.dumps(summary, indent=4))
+        exit(0)
+
     input_data = {}
     if args.json:
         try:
@@ -89,5 +146,20 @@ if __name__ == "__main__":
     elif args.prompt:
         input_data = {"prompt": args.prompt}
 
-    hr_response1 = hr_agent.request(input_data)
+    if args.binary:
+        try:
+            with open(args.binary, 'rb') as f:
+                hr_response1 = hr_agent.request(f)
+        except FileNotFoundError:
+            print(f"Error: binary file not found at {args.binary}")
+            exit(1)
+        except ValueError as e:
+            print(f"Error: Invalid continuation envelope in {args.binary}: {e}")
+            exit(1)
+    else:
+        hr_response1 = hr_agent.request(input_data)
+
+    if args.binary_output:
+        with open(args.binary_output, 'wb') as f:
+            f.write(ContinuationAgent.dumps(hr_response1))
     print(json.dumps(hr_response1, indent=4))
\ No newline at end of file
@@ -0,0 +1,33 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core.tool import tool
+import pytest
+
+# The usernames of the authorize_account calls that ran, in order
+executed = []
+
+@tool(need_approval=True)
+def authorize_account(username: str, security_level: int = 0):
+    """Authorize a user account by taking a username and a security level."""
+    executed.append(username)
+    return f"Account {username} authorized with security level {security_level}."
+
+@pytest.fixture(autouse=True)
+def clear_executed():
+    executed.clear()
+
+def reply_once(tool_calls, answer="done"):
+    """
+    A `FakeBackend` reply requesting the tool calls, then answering once the tools have replied.
+
+    Args:
+        tool_calls: The tool calls, or a function of the tool payload returning them
+        answer: The final answer
+    """
+    def reply(messages, tools):
+        if messages[-1]["role"] == "tool":
+            return answer
+        return tool_calls(tools) if callable(tool_calls) else tool_calls
+    return reply
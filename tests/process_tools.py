@@ -0,0 +1,35 @@
+"""
+Process tools of the process pool tests, defined at the top level so that the workers can import them.
+"""
+from core.tool import tool
+import time
+import os
+
+@tool(executor="process", timeout=5)
+def worker_pid() -> int:
+    """Return the process id of the worker."""
+    return os.getpid()
+
+@tool(executor="process", timeout=0.5)
+def sleep_for(seconds: float) -> str:
+    """Sleep, then return how long."""
+    time.sleep(seconds)
+    return f"slept {seconds}"
+
+@tool(executor="process", timeout=5)
+def exit_worker(code: int) -> str:
+    """Exit the worker process without replying."""
+    os._exit(code)
+
+@tool(executor="process", timeout=5)
+def fail(message: str) -> str:
+    """Raise a ValueError."""
+    raise ValueError(message)
+
+class Parser:
+    """Holds a process tool under a nested qualified name."""
+    @staticmethod
+    @tool(executor="process", timeout=5)
+    def parse(text: str) -> list:
+        """Split a text into words."""
+        return text.split()
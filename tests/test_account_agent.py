@@ -0,0 +1,101 @@
+"""
+Tests of the sample agents: the account agent factory and singleton, and the suspension of the HR agent.
+"""
+from core.continuation_agent import ContinuationAgent
+from core.model_backend import FakeBackend
+from core.request_context import RequestContext
+from conftest import reply_once
+from concurrent.futures import ThreadPoolExecutor
+import account_agent
+import hr_agent_cli
+import threading
+import pytest
+
+@pytest.fixture
+def fresh_singleton(monkeypatch):
+    monkeypatch.setattr(account_agent, "_account_agent", None)
+
+def _authorize(username, security_level):
+    return reply_once([FakeBackend.tool_call("authorize_account", username=username, security_level=security_level)])
+
+def test_factory_builds_independent_agents_with_the_account_tools():
+    first = account_agent.create_account_agent(backend=FakeBackend([]))
+    second = account_agent.create_account_agent(backend=FakeBackend([]))
+
+    assert isinstance(first, ContinuationAgent) and first is not second
+    assert sorted(first.tool_map) == ["authorize_account", "create_account"]
+
+def test_default_security_level_is_approved_by_the_account_policies():
+    agent = account_agent.create_account_agent(backend=FakeBackend(_authorize("alice", 0)))
+
+    response = agent.request({"prompt": "authorize alice"})
+
+    assert response["end_reason"] == "completed"
+    assert "Account alice authorized with security level 0." in [message["content"] for message in response["messages"] if message["role"] == "tool"]
+
+def test_other_security_levels_need_an_approval():
+    agent = account_agent.create_account_agent(backend=FakeBackend(_authorize("alice", 2)))
+
+    response = agent.request({"prompt": "authorize alice"})
+
+    assert response["end_reason"] == "approval_required"
+    assert [item["paths"] for item in response["approval_info"]] == [["authorize_account"]]
+
+def test_privileged_users_are_rejected():
+    agent = account_agent.create_account_agent(backend=FakeBackend(_authorize("root", 0)))
+
+    response = agent.request({"prompt": "authorize root"})
+
+    assert response["end_reason"] == "completed"
+    assert [message["content"] for message in response["messages"] if message["role"] == "tool"] == ["The tool call was rejected by the approver and was not executed."]
+
+def test_empty_policies_ask_for_every_authorization():
+    agent = account_agent.create_account_agent(backend=FakeBackend(_authorize("alice", 0)), approval_policies=[])
+
+    response = agent.request({"prompt": "authorize alice"})
+
+    assert response["end_reason"] == "approval_required"
+
+def test_concurrent_first_calls_share_one_account_agent(fresh_singleton, monkeypatch):
+    built = []
+    create = account_agent.create_account_agent
+    barrier = threading.Barrier(8)
+    def counting_create(**options):
+        built.append(1)
+        return create(backend=FakeBackend([]), **options)
+    monkeypatch.setattr(account_agent, "create_account_agent", counting_create)
+
+    def get():
+        barrier.wait()
+        return account_agent.get_account_agent()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        agents = list(executor.map(lambda _: get(), range(8)))
+
+    assert len(built) == 1
+    assert all(agent is agents[0] for agent in agents)
+
+@pytest.mark.parametrize("turns, paused", [(0, False), (1, False), (2, True), (3, True)])
+def test_pause_per_n_pauses_after_n_model_calls_of_the_request(turns, paused):
+    context = RequestContext()
+    context.turns = turns
+
+    assert hr_agent_cli.pause_per_n(context) is paused
+
+def test_pause_per_n_counts_per_request():
+    # Two requests interleaved on one agent each count their own model calls
+    first, second = RequestContext(), RequestContext()
+    first.turns = 2
+    second.turns = 1
+
+    assert hr_agent_cli.pause_per_n(first)
+    assert not hr_agent_cli.pause_per_n(second)
+
+def test_hr_agent_suspends_after_two_model_calls(fresh_singleton, monkeypatch):
+    def reply(messages, tools):
+        return [FakeBackend.tool_call("send_email_tool", recipient="tfan@example.com", subject="Welcome", message=str(len(messages)))]
+    agent = hr_agent_cli.create_hr_agent(backend=FakeBackend(reply))
+
+    response = agent.request({"prompt": "Onboard tfan"})
+
+    assert response["end_reason"] == "suspended"
+    assert agent.backend.calls == 2
@@ -0,0 +1,121 @@
+"""
+Tests of the approval policies: deny lists, rules, allow lists, caller scopes, the audit trail of the automatic
+decisions, and the single evaluation of every tool call.
+"""
+from core.approval_policy import ApprovalPolicy, Rule, CompiledPolicy, APPROVE, REJECT, ASK
+from core.continuation_agent import ContinuationAgent, REJECTED_TOOL_CALL_MESSAGE
+from core.async_continuation_agent import AsyncContinuationAgent
+from core.model_backend import FakeBackend
+from conftest import authorize_account, executed, reply_once
+import asyncio
+import pytest
+
+POLICY = ApprovalPolicy("authorize_account", rules=[
+    Rule(APPROVE, when={"security_level": 0}, reason="default security level"),
+    Rule(ASK, when={"security_level": {"ge": 3}}),
+    {"decision": APPROVE, "when": {"username": {"matches": "svc_.*"}}, "callers": ["ops"]},
+], deny={"username": ["root"]}, allow={"username": ["tfan"]})
+
+def _authorize(username, security_level):
+    return FakeBackend.tool_call("authorize_account", username=username, security_level=security_level)
+
+def _agent(tool_calls, cls=ContinuationAgent, **options):
+    return cls(instruction="accounts", tools=[authorize_account], backend=FakeBackend(reply_once(tool_calls)), approval_policies=[POLICY], **options)
+
+def _evaluate(arguments, caller=None):
+    decision = CompiledPolicy(POLICY).evaluate(arguments, caller)
+    return decision and decision["decision"]
+
+def test_deny_list_comes_first():
+    assert _evaluate({"username": "root", "security_level": 0}) == REJECT
+
+def test_first_matching_rule_decides():
+    assert _evaluate({"username": "alice", "security_level": 0}) == APPROVE
+    assert _evaluate({"username": "tfan", "security_level": 5}) == ASK
+
+def test_allow_list_after_the_rules():
+    assert _evaluate({"username": "tfan", "security_level": 1}) == APPROVE
+    assert _evaluate({"username": "alice", "security_level": 1}) is None
+
+def test_caller_scoped_rule():
+    arguments = {"username": "svc_backup", "security_level": 1}
+    assert _evaluate(arguments, caller="ops") == APPROVE
+    assert _evaluate(arguments, caller="hr-portal") is None
+    assert _evaluate(arguments) is None
+
+def test_caller_scoped_policy():
+    policy = CompiledPolicy(ApprovalPolicy("authorize_account", rules=[Rule(APPROVE)], callers=["ops"]))
+    assert policy.evaluate({}, "ops")["decision"] == APPROVE
+    assert policy.evaluate({}, "hr-portal") is None
+
+def test_uncomparable_values_do_not_match():
+    assert _evaluate({"username": "alice", "security_level": "high"}) is None
+
+def test_booleans_do_not_match_numbers():
+    assert _evaluate({"username": "alice", "security_level": False}) is None
+    assert _evaluate({"username": "alice", "security_level": True}) is None
+    policy = CompiledPolicy(ApprovalPolicy("authorize_account", rules=[Rule(APPROVE, when={"security_level": {"in": [0, 1]}})], deny={"username": [0]}))
+    assert policy.evaluate({"username": "alice", "security_level": False}, None) is None
+    assert policy.evaluate({"username": False, "security_level": 0}, None)["decision"] == APPROVE
+    assert policy.evaluate({"username": 0, "security_level": 0}, None)["decision"] == REJECT
+
+def test_invalid_policies_are_rejected_at_construction():
+    with pytest.raises(ValueError):
+        ContinuationAgent(instruction="i", tools=[authorize_account], approval_policies=[ApprovalPolicy("unknown_tool")])
+    with pytest.raises(ValueError):
+        ContinuationAgent(instruction="i", tools=[authorize_account], approval_policies=[POLICY, POLICY])
+    with pytest.raises(ValueError):
+        Rule("maybe")
+    with pytest.raises(ValueError):
+        CompiledPolicy(ApprovalPolicy("authorize_account", rules=[Rule(APPROVE, when={"security_level": {"between": [0, 1]}})]))
+
+def test_routine_calls_run_and_only_exceptions_wait_for_approval():
+    calls = [_authorize("alice", 0), _authorize("root", 0), _authorize("tfan", 5), _authorize("bob", 1)]
+    response = _agent(calls).request({"prompt": "go"})
+
+    assert response["end_reason"] == "approval_required"
+    assert [item["path_ids"][-1] for item in response["approval_info"]] == [calls[2]["id"], calls[3]["id"]]
+    assert executed == ["alice"]
+    tool_messages = {message["tool_call_id"]: message["content"] for message in response["continuation"]["messages"] if message["role"] == "tool"}
+    assert tool_messages[calls[1]["id"]] == REJECTED_TOOL_CALL_MESSAGE
+    assert response["auto_decisions"] == [
+        {"id": calls[0]["id"], "tool": "authorize_account", "caller": None, "decision": APPROVE, "reason": "default security level"},
+        {"id": calls[1]["id"], "tool": "authorize_account", "caller": None, "decision": REJECT, "reason": "username is in the deny list"},
+    ]
+
+def test_caller_is_recorded_in_the_audit_trail():
+    calls = [_authorize("svc_backup", 1)]
+    response = _agent(calls).request({"prompt": "go", "caller": "ops"})
+
+    assert response["end_reason"] == "completed"
+    assert [(item["caller"], item["decision"]) for item in response["auto_decisions"]] == [("ops", APPROVE)]
+
+def test_audit_trail_of_nested_agents_is_returned_by_the_top_level_agent():
+    sub_agent = _agent([_authorize("alice", 0)])
+    reply = reply_once([FakeBackend.tool_call("account_agent", prompt="open an account")])
+    parent = ContinuationAgent(instruction="hr", tools=[sub_agent.as_tool(name="account_agent", description="Accounts")], backend=FakeBackend(reply))
+
+    response = parent.request({"prompt": "go", "caller": "hr-portal"})
+
+    assert response["end_reason"] == "completed"
+    assert executed == ["alice"]
+    assert [(item["caller"], item["reason"]) for item in response["auto_decisions"]] == [("hr-portal", "default security level")]
+
+def test_async_agent():
+    response = asyncio.run(_agent([_authorize("alice", 0)], cls=AsyncContinuationAgent).request({"prompt": "go"}))
+
+    assert response["end_reason"] == "completed"
+    assert [item["decision"] for item in response["auto_decisions"]] == [APPROVE]
+
+def test_streamed_calls_are_evaluated_once(monkeypatch):
+    evaluations = []
+    evaluate = CompiledPolicy.evaluate
+    monkeypatch.setattr(CompiledPolicy, "evaluate", lambda self, arguments, caller: evaluations.append(arguments["username"]) or evaluate(self, arguments, caller))
+    calls = [_authorize("alice", 0), _authorize("bob", 1)]
+
+    response = _agent(calls, stream=True).request({"prompt": "go"})
+
+    assert evaluations == ["alice", "bob"]
+    assert executed == ["alice"]
+    assert len(response["auto_decisions"]) == 1
+    assert [item["path_ids"][-1] for item in response["approval_info"]] == [calls[1]["id"]]
@@ -0,0 +1,111 @@
+"""
+Regression tests of the approval decisions applied on resume, at every nesting level.
+
+Before partial approvals, the decision of an `approval_info` entry was not applied to the tool call it names:
+the last path id was always approved, and the sub-agent calls leading to it took the decision of the entry
+applied last. A rejection was therefore ignored at the top level, and could reject a whole sub-agent when
+nested. The decision now goes to the tool call it names, and the sub-agent calls leading to a decided call
+are resumed.
+"""
+from core.continuation_agent import ContinuationAgent, REJECTED_TOOL_CALL_MESSAGE
+from core.model_backend import FakeBackend
+from conftest import authorize_account, executed, reply_once
+import pytest
+
+def _script(arguments):
+    # Calls the first tool once per argument
+    def tool_calls(tools):
+        name = tools[0]["function"]["name"]
+        key = "username" if name == "authorize_account" else "prompt"
+        return [FakeBackend.tool_call(name, **{key: argument}) for argument in arguments]
+    return reply_once(tool_calls)
+
+def _leaf(usernames, **options):
+    return ContinuationAgent(instruction="leaf", tools=[authorize_account], backend=FakeBackend(_script(usernames)), **options)
+
+def _wrap(sub_agent, name, prompts, **options):
+    tool = sub_agent.as_tool(name=f"{name}_tool", description=f"The {name} agent")
+    return ContinuationAgent(instruction=name, tools=[tool], backend=FakeBackend(_script(prompts)), **options)
+
+def _decide(response, decisions):
+    # Decisions by username, the approval_info entries are in the order of the tool calls
+    for item, approved in zip(response["approval_info"], decisions):
+        item["approved"] = approved
+    return response
+
+def _usernames(response):
+    return [item["tool_call"]["function"]["arguments"] for item in response["approval_info"]]
+
+def test_top_level_rejection_is_honoured():
+    agent = _leaf(["alice", "bob"])
+    response = _decide(agent.request({"prompt": "go"}), [False, True])
+
+    resumed = agent.request(response)
+
+    assert resumed["end_reason"] == "rejected_tool_calls"
+    assert executed == ["bob"]
+    assert [tc["id"] for tc in resumed["rejected_tool_calls"]] == [response["approval_info"][0]["path_ids"][-1]]
+
+def test_nested_rejection_reaches_the_sub_agent():
+    agent = _wrap(_leaf(["alice", "bob"]), "mid", ["open accounts"])
+    response = agent.request({"prompt": "go"})
+    assert [len(item["path_ids"]) for item in response["approval_info"]] == [2, 2]
+
+    resumed = agent.request(_decide(response, [True, False]))
+
+    # The sub-agent is resumed, runs the approved call and reports the rejected one
+    assert executed == ["alice"]
+    assert resumed["end_reason"] == "rejected_tool_calls"
+    sub_continuation = resumed["rejected_tool_calls"][0]["continuation"]
+    processed = {item["id"]: item["approved"] for item in sub_continuation["processed"]}
+    assert processed == {response["approval_info"][0]["path_ids"][-1]: True, response["approval_info"][1]["path_ids"][-1]: False}
+
+def test_all_approved_nested_completes():
+    agent = _wrap(_leaf(["alice", "bob"]), "mid", ["open accounts"])
+    resumed = agent.request(_decide(agent.request({"prompt": "go"}), [True, True]))
+
+    assert resumed["end_reason"] == "completed"
+    assert sorted(executed) == ["alice", "bob"]
+
+@pytest.mark.parametrize("depth", [2, 3])
+def test_mixed_decisions_with_partial_approvals(depth):
+    agent = _leaf(["alice", "bob", "carol"], partial_approvals=True)
+    for level in range(depth - 1):
+        agent = _wrap(agent, f"level{level}", ["open accounts"], partial_approvals=True)
+    response = agent.request({"prompt": "go"})
+    assert [len(item["path_ids"]) for item in response["approval_info"]] == [depth] * 3
+    assert [item["approved"] for item in response["approval_info"]] == [None, None, None]
+
+    resumed = agent.request(_decide(response, [None, True, False]))
+
+    # The approved call ran, the undecided one waits in a smaller continuation
+    assert executed == ["bob"]
+    assert resumed["end_reason"] == "approval_required"
+    assert len(resumed["approval_info"]) == 1
+    assert resumed["approval_info"][0]["path_ids"] == response["approval_info"][0]["path_ids"]
+    assert "alice" in _usernames(resumed)[0]
+
+    finished = agent.request(_decide(resumed, [True]))
+
+    assert finished["end_reason"] == "completed"
+    assert executed == ["bob", "alice"]
+
+def test_rejection_is_answered_to_the_model_with_partial_approvals():
+    agent = _leaf(["alice", "bob"], partial_approvals=True)
+    response = _decide(agent.request({"prompt": "go"}), [False, True])
+
+    resumed = agent.request(response)
+
+    assert resumed["end_reason"] == "completed"
+    assert executed == ["bob"]
+    tool_messages = {message["tool_call_id"]: message["content"] for message in resumed["messages"] if message["role"] == "tool"}
+    assert tool_messages[response["approval_info"][0]["path_ids"][-1]] == REJECTED_TOOL_CALL_MESSAGE
+
+def test_undecided_without_partial_approvals_is_a_rejection():
+    agent = _leaf(["alice", "bob"])
+    response = _decide(agent.request({"prompt": "go"}), [None, True])
+
+    resumed = agent.request(response)
+
+    assert resumed["end_reason"] == "rejected_tool_calls"
+    assert executed == ["bob"]
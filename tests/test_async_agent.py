@@ -0,0 +1,90 @@
+"""
+Tests of the asyncio agents, and of async tools called from the synchronous agents.
+"""
+from core.agent import Agent
+from core.async_agent import AsyncAgent
+from core.continuation_agent import ContinuationAgent
+from core.async_continuation_agent import AsyncContinuationAgent
+from core.model_backend import FakeBackend
+from core.tool import tool
+from conftest import authorize_account, executed, reply_once
+import asyncio
+import threading
+import time
+
+@tool()
+async def fetch_profile(username: str) -> str:
+    """Fetch the profile of a user."""
+    await asyncio.sleep(0.05)
+    return f"profile of {username}"
+
+@tool()
+def lookup_manager(username: str) -> str:
+    """Look up the manager of a user."""
+    return f"manager of {username} is {threading.current_thread().name}"
+
+def _calls(*usernames, tool_name="fetch_profile"):
+    return [FakeBackend.tool_call(tool_name, username=username) for username in usernames]
+
+def _tool_contents(response):
+    return [message["content"] for message in response["messages"] if message["role"] == "tool"]
+
+def test_async_agent_awaits_async_tools_concurrently():
+    agent = AsyncAgent(instruction="hr", tools=[fetch_profile], backend=FakeBackend(reply_once(_calls("alice", "bob", "carol"))), max_concurrency=3)
+
+    started = time.monotonic()
+    response = asyncio.run(agent.request({"prompt": "go"}))
+
+    assert time.monotonic() - started < 0.14
+    assert response["result"] == "done"
+    assert _tool_contents(response) == ["profile of alice", "profile of bob", "profile of carol"]
+
+def test_async_agent_runs_sync_tools_off_the_loop():
+    agent = AsyncAgent(instruction="hr", tools=[lookup_manager], backend=FakeBackend(reply_once(_calls("alice", tool_name="lookup_manager"))))
+
+    response = asyncio.run(agent.request({"prompt": "go"}))
+
+    assert "MainThread" not in _tool_contents(response)[0]
+
+def test_async_sub_agent():
+    sub_agent = AsyncAgent(instruction="profiles", tools=[fetch_profile], backend=FakeBackend(reply_once(_calls("alice"), answer="alice is an engineer")))
+    parent = AsyncAgent(instruction="hr", tools=[sub_agent.as_tool(name="profile_agent", description="Profiles")], backend=FakeBackend(reply_once([FakeBackend.tool_call("profile_agent", prompt="who is alice")])))
+
+    response = asyncio.run(parent.request({"prompt": "go"}))
+
+    assert _tool_contents(response) == ["alice is an engineer"]
+
+def test_async_continuation_agent_suspends_and_resumes():
+    agent = AsyncContinuationAgent(instruction="accounts", tools=[authorize_account], backend=FakeBackend(reply_once(_calls("alice", tool_name="authorize_account"))))
+    response = asyncio.run(agent.request({"prompt": "go"}))
+    assert response["end_reason"] == "approval_required"
+    assert executed == []
+    response["approval_info"][0]["approved"] = True
+
+    resumed = asyncio.run(agent.request(response))
+
+    assert resumed["end_reason"] == "completed"
+    assert executed == ["alice"]
+
+def test_continuations_are_shared_by_the_sync_and_async_agents():
+    backend = FakeBackend(reply_once(_calls("alice", tool_name="authorize_account")))
+    response = ContinuationAgent(instruction="accounts", tools=[authorize_account], backend=backend).request({"prompt": "go"})
+    response["approval_info"][0]["approved"] = True
+
+    resumed = asyncio.run(AsyncContinuationAgent(instruction="accounts", tools=[authorize_account], backend=backend).request(response))
+
+    assert resumed["end_reason"] == "completed"
+    assert executed == ["alice"]
+
+def test_sync_agent_calls_async_tools():
+    agent = Agent(instruction="hr", tools=[fetch_profile], backend=FakeBackend(reply_once(_calls("alice"))))
+
+    assert _tool_contents(agent.request({"prompt": "go"})) == ["profile of alice"]
+
+def test_sync_agent_calls_async_tools_inside_a_running_loop():
+    agent = Agent(instruction="hr", tools=[fetch_profile], backend=FakeBackend(reply_once(_calls("alice"))))
+
+    async def main():
+        return agent.request({"prompt": "go"})
+
+    assert _tool_contents(asyncio.run(main())) == ["profile of alice"]
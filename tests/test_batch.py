@@ -0,0 +1,75 @@
+"""
+Tests of the batch runner: records, checkpointed resume and failed lines.
+"""
+from core.batch import BatchRunner
+from core.agent import Agent
+from core.model_backend import FakeBackend
+import json
+import pytest
+
+class EchoAgent:
+    """Answers the prompt, and interrupts the run at the prompt "stop" while `interrupt` is set."""
+    def __init__(self, interrupt=False):
+        self.interrupt = interrupt
+        self.prompts = []
+
+    def request(self, input):
+        if input["prompt"] == "stop" and self.interrupt:
+            raise KeyboardInterrupt
+        self.prompts.append(input["prompt"])
+        if input["prompt"] == "circular":
+            response = {"end_reason": "completed"}
+            response["self"] = response
+            return response
+        return {"result": input["prompt"], "end_reason": "completed", "at": object()}
+
+def _write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+    return str(path)
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_every_line_gets_one_record(tmp_path):
+    input_path = _write_lines(tmp_path / "in.jsonl", ['{"prompt": "a"}', "", "{broken", '{"prompt": "circular"}', '{"prompt": "b"}'])
+    output = tmp_path / "out.jsonl"
+
+    summary = BatchRunner(EchoAgent(), workers=2).run(input_path, str(output))
+
+    records = {record["line"]: record for record in _records(output)}
+    assert sorted(records) == [1, 3, 4, 5]
+    assert records[1]["response"]["result"] == "a"
+    assert records[1]["response"]["at"].startswith("<object object")
+    assert records[3]["error"].startswith("JSONDecodeError")
+    assert records[4]["error"].startswith("Unserializable response: ValueError")
+    assert summary == {"completed": 2, "pending": 0, "errors": 2, "skipped": 0}
+
+def test_interrupted_run_resumes_from_the_checkpoint(tmp_path):
+    input_path = _write_lines(tmp_path / "in.jsonl", ['{"prompt": "a"}', "{broken", '{"prompt": "stop"}', '{"prompt": "b"}'])
+    output, checkpoint = tmp_path / "out.jsonl", str(tmp_path / "run.ckpt")
+
+    with pytest.raises(KeyboardInterrupt):
+        BatchRunner(EchoAgent(interrupt=True), workers=1, checkpoint_path=checkpoint).run(input_path, str(output))
+    agent = EchoAgent()
+    summary = BatchRunner(agent, workers=1, checkpoint_path=checkpoint).run(input_path, str(output))
+
+    # The lines written before the interruption are not processed again
+    assert "a" not in agent.prompts and agent.prompts[-2:] == ["stop", "b"]
+    assert summary["skipped"] >= 1
+    assert sorted(record["line"] for record in _records(output)) == [1, 2, 3, 4]
+
+@pytest.mark.parametrize("order", ["input", "completion"])
+def test_pending_responses_go_to_the_pending_file(tmp_path, order):
+    def reply(messages, tools):
+        return "done"
+    agent = Agent(instruction="echo", tools=[], backend=FakeBackend(reply))
+    input_path = _write_lines(tmp_path / "in.jsonl", ['{"prompt": "%d"}' % i for i in range(10)])
+    output = tmp_path / "out.jsonl"
+
+    summary = BatchRunner(agent, workers=4, order=order).run(input_path, str(output))
+
+    lines = [record["line"] for record in _records(output)]
+    assert sorted(lines) == list(range(1, 11))
+    if order == "input":
+        assert lines == list(range(1, 11))
+    assert summary["completed"] == 10
@@ -0,0 +1,89 @@
+"""
+Tests of the per event loop async clients of the client registry.
+"""
+from core.clients import ClientRegistry
+from core import clients
+import threading
+import asyncio
+import gc
+import pytest
+
+class LoopClient:
+    """Holds its loop like the connection pool of an `AsyncOpenAI` client."""
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+
+    async def close(self):
+        assert asyncio.get_running_loop() is self.loop
+        self.closed = True
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ClientRegistry()
+    monkeypatch.setattr(registry, "_create", lambda kind, config: LoopClient())
+    return registry
+
+def test_clients_are_shared_within_a_loop(registry):
+    async def main():
+        return registry.get("async", api_key="a"), registry.get("async", api_key="a"), registry.get("async", api_key="b")
+
+    first, second, other = asyncio.run(main())
+
+    assert first is second
+    assert other is not first
+
+def test_clients_are_closed_with_their_loop(registry):
+    async def main():
+        try:
+            return registry.get("async")
+        finally:
+            await registry.aclose_loop()
+
+    opened = [asyncio.run(main()) for _ in range(5)]
+
+    assert len(registry._async_clients) == 0
+    assert all(client.closed for client in opened)
+    assert len({id(client) for client in opened}) == 5
+
+def test_loops_closed_without_aclose_loop_are_pruned(registry):
+    async def main():
+        return registry.get("async")
+
+    for _ in range(5):
+        asyncio.run(main())
+    gc.collect()
+
+    assert len(registry._async_clients) <= 1
+
+def test_run_async_closes_the_clients_of_its_loop(registry, monkeypatch):
+    monkeypatch.setattr(clients, "_registry", registry)
+    async def main():
+        return registry.get("async")
+
+    client = clients.run_async(main())
+
+    assert client.closed
+    assert len(registry._async_clients) == 0
+
+def test_close_closes_the_clients_of_loops_running_in_other_threads(registry):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        async def get():
+            return registry.get("async")
+        client = asyncio.run_coroutine_threadsafe(get(), loop).result()
+
+        registry.close()
+
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result()
+        assert client.closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+def test_async_client_needs_a_running_loop(registry):
+    with pytest.raises(RuntimeError):
+        registry.get("async")
@@ -0,0 +1,137 @@
+"""
+Tests of the compaction strategies shrinking the conversation before each model call.
+"""
+from core.agent import Agent
+from core.compaction import KeepLastTurns, TruncateToolOutputs, compact_messages
+from core.model_backend import FakeBackend
+from core.tool import tool
+import pytest
+
+def _assistant(*tool_call_ids):
+    return {"role": "assistant", "content": None, "tool_calls": [
+        {"id": tool_call_id, "type": "function", "function": {"name": "lookup", "arguments": "{}"}} for tool_call_id in tool_call_ids
+    ]}
+
+def _tool(tool_call_id, content="ok"):
+    return {"role": "tool", "tool_call_id": tool_call_id, "content": content}
+
+def _conversation():
+    return [
+        {"role": "developer", "content": "instruction"},
+        {"role": "user", "content": "task"},
+        _assistant("a"), _tool("a"),
+        _assistant("b1", "b2"), _tool("b1"), _tool("b2"),
+        {"role": "user", "content": "follow-up"},
+        _assistant("c"), _tool("c"),
+    ]
+
+def _assert_tool_calls_answered(messages):
+    # Every tool message follows the assistant message calling it, with only tool messages in between
+    for i, message in enumerate(messages):
+        if message["role"] == "tool":
+            j = i - 1
+            while messages[j]["role"] == "tool":
+                j -= 1
+            assert message["tool_call_id"] in [tool_call["id"] for tool_call in messages[j].get("tool_calls") or []]
+
+def test_keep_last_turns_cuts_at_a_turn_boundary():
+    messages = _conversation()
+
+    KeepLastTurns(turns=2).compact(messages)
+
+    assert messages == [
+        {"role": "developer", "content": "instruction"},
+        {"role": "user", "content": "task"},
+        {"role": "user", "content": "follow-up"},
+        _assistant("c"), _tool("c"),
+    ]
+
+def test_keep_last_turns_keeps_the_tool_messages_of_the_assistant_message_on_the_cut_point():
+    messages = _conversation()
+
+    # The fourth turn from the end is the assistant message calling b1 and b2
+    KeepLastTurns(turns=3).compact(messages)
+
+    assert messages[2:] == [_assistant("b1", "b2"), _tool("b1"), _tool("b2"), {"role": "user", "content": "follow-up"}, _assistant("c"), _tool("c")]
+    _assert_tool_calls_answered(messages)
+
+def test_keep_last_turns_without_the_first_user_message():
+    messages = _conversation()
+
+    KeepLastTurns(turns=1, keep_first_user=False).compact(messages)
+
+    assert messages == [{"role": "developer", "content": "instruction"}, _assistant("c"), _tool("c")]
+
+def test_keep_last_turns_leaves_short_conversations_unchanged():
+    messages = _conversation()
+
+    KeepLastTurns(turns=10).compact(messages)
+
+    assert messages == _conversation()
+
+def test_keep_last_turns_rejects_no_turns():
+    with pytest.raises(ValueError):
+        KeepLastTurns(turns=0)
+
+def test_truncate_tool_outputs_shortens_old_outputs_only():
+    messages = _conversation()
+    messages[3]["content"] = "x" * 500
+    messages[9]["content"] = "y" * 500
+
+    TruncateToolOutputs(max_chars=100, keep_turns=1).compact(messages)
+
+    assert len(messages[3]["content"]) == 100
+    assert messages[3]["content"].endswith("[500 characters, truncated]")
+    assert messages[9]["content"] == "y" * 500
+
+def test_truncate_tool_outputs_is_stable_when_compacting_again():
+    messages = _conversation()
+    messages[3]["content"] = "x" * 500
+    strategy = TruncateToolOutputs(max_chars=100, keep_turns=0)
+
+    strategy.compact(messages)
+    truncated = messages[3]["content"]
+    strategy.compact(messages)
+
+    assert messages[3]["content"] == truncated
+
+def test_truncate_tool_outputs_uses_the_summary_within_max_chars():
+    messages = _conversation()
+    messages[3]["content"] = "x" * 500
+
+    TruncateToolOutputs(max_chars=50, keep_turns=0, summarize=lambda content: f"summary of {len(content)} characters").compact(messages)
+
+    assert messages[3]["content"] == "summary of 500 characters"
+
+def test_strategies_apply_in_order():
+    messages = _conversation()
+    messages[9]["content"] = "y" * 500
+
+    compact_messages(messages, [KeepLastTurns(turns=1), TruncateToolOutputs(max_chars=100, keep_turns=0)])
+
+    assert [message["role"] for message in messages] == ["developer", "user", "assistant", "tool"]
+    assert len(messages[3]["content"]) == 100
+
+@tool()
+def lookup(index: int) -> str:
+    """Look up a record."""
+    return f"record {index} " + "z" * 300
+
+def test_agent_compacts_before_each_model_call():
+    sent = []
+    def reply(messages, tools):
+        sent.append([dict(message) for message in messages])
+        if len(sent) < 6:
+            return [FakeBackend.tool_call("lookup", index=len(sent)), FakeBackend.tool_call("lookup", index=-len(sent))]
+        return "done"
+    agent = Agent(instruction="hr", tools=[lookup], backend=FakeBackend(reply), compaction=[KeepLastTurns(turns=2), TruncateToolOutputs(max_chars=100)])
+
+    response = agent.request({"prompt": "go"})
+
+    assert response["result"] == "done"
+    for messages in sent:
+        assert [message["role"] for message in messages[:2]] == ["developer", "user"]
+        assert sum(message["role"] == "assistant" for message in messages) <= 2
+        _assert_tool_calls_answered(messages)
+    assert len(sent[-1][-1]["content"]) > 100
+    assert all(len(message["content"]) <= 100 for message in sent[-1][:-2] if message["role"] == "tool")
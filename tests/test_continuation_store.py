@@ -0,0 +1,182 @@
+"""
+Tests of the server-side continuation stores and the handle-based resume.
+"""
+from core.continuation_store import MemoryContinuationStore, SQLiteContinuationStore, FileContinuationStore
+from core.continuation_agent import ContinuationAgent
+from core.model_backend import FakeBackend
+from conftest import authorize_account, executed, reply_once
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import os
+import pytest
+
+CONTINUATION = {"messages": [{"role": "user", "content": "go"}], "processed": []}
+
+@pytest.fixture(params=["memory", "sqlite", "file"])
+def make_store(request, tmp_path):
+    def make(**options):
+        if request.param == "memory":
+            return MemoryContinuationStore(**options)
+        if request.param == "sqlite":
+            return SQLiteContinuationStore(str(tmp_path / "continuations.db"), **options)
+        return FileContinuationStore(str(tmp_path / "continuations"), **options)
+    return make
+
+def test_round_trip(make_store):
+    store = make_store()
+    continuation_id = store.put(CONTINUATION)
+
+    assert len(continuation_id) == 32
+    assert store.get(continuation_id) == CONTINUATION
+    assert store.put(CONTINUATION) != continuation_id
+
+def test_deleted_and_unknown_ids_are_not_found(make_store):
+    store = make_store()
+    continuation_id = store.put(CONTINUATION)
+    store.delete(continuation_id)
+    store.delete(continuation_id)
+
+    with pytest.raises(ValueError, match="Unknown or expired"):
+        store.get(continuation_id)
+
+@pytest.mark.parametrize("continuation_id", ["../../etc/passwd", "ABC", 42, "0" * 33])
+def test_malformed_ids_are_rejected(make_store, continuation_id):
+    with pytest.raises(ValueError, match="Invalid continuation id"):
+        make_store().get(continuation_id)
+
+def test_expired_continuations_are_not_found_and_collected(make_store):
+    store = make_store(ttl=0.05)
+    expired = [store.put(CONTINUATION) for _ in range(2)]
+    time.sleep(0.1)
+    kept = store.put(CONTINUATION)
+
+    with pytest.raises(ValueError, match="Unknown or expired"):
+        store.get(expired[0])
+    assert store.gc() >= 1
+    assert store.get(kept) == CONTINUATION
+
+def test_put_collects_the_expired_continuations(make_store):
+    store = make_store(ttl=0.05, gc_interval=0)
+    store.put(CONTINUATION)
+    time.sleep(0.1)
+
+    store.put(CONTINUATION)
+
+    assert store.gc() == 0
+
+def test_taken_continuations_are_gone_until_restored(make_store):
+    store = make_store()
+    continuation_id = store.put(CONTINUATION)
+
+    assert store.take(continuation_id) == CONTINUATION
+    with pytest.raises(ValueError, match="Unknown or expired"):
+        store.take(continuation_id)
+    store.restore(continuation_id, CONTINUATION)
+    assert store.get(continuation_id) == CONTINUATION
+
+def test_concurrent_takes_get_the_continuation_once(make_store):
+    store = make_store()
+    continuation_id = store.put(CONTINUATION)
+    barrier = threading.Barrier(8)
+
+    def take():
+        barrier.wait()
+        try:
+            return store.take(continuation_id)
+        except ValueError:
+            return None
+
+    with ThreadPoolExecutor(8) as executor:
+        taken = [result for result in executor.map(lambda _: take(), range(8)) if result is not None]
+
+    assert taken == [CONTINUATION]
+
+def test_memory_store_keeps_the_most_recently_used():
+    store = MemoryContinuationStore(maxsize=2)
+    first, second = store.put(CONTINUATION), store.put(CONTINUATION)
+    store.get(first)
+
+    third = store.put(CONTINUATION)
+
+    assert store.get(first) == store.get(third) == CONTINUATION
+    with pytest.raises(ValueError):
+        store.get(second)
+    with pytest.raises(ValueError):
+        MemoryContinuationStore(maxsize=0)
+
+def test_file_store_writes_one_file_per_continuation(tmp_path):
+    store = FileContinuationStore(str(tmp_path))
+    continuation_id = store.put(CONTINUATION)
+
+    assert os.listdir(tmp_path) == [continuation_id + FileContinuationStore.SUFFIX]
+
+def _agent(store, **options):
+    return ContinuationAgent(instruction="accounts", tools=[authorize_account], backend=FakeBackend(reply_once([FakeBackend.tool_call("authorize_account", username="alice")])), store=store, **options)
+
+def _approved(response):
+    for item in response["approval_info"]:
+        item["approved"] = True
+    return {"continuation_id": response["continuation_id"], "approval_info": response["approval_info"]}
+
+def test_agent_resumes_from_a_handle():
+    store = MemoryContinuationStore()
+    agent = _agent(store)
+    response = agent.request({"prompt": "go"})
+    assert "continuation" not in response
+    continuation_id = response["continuation_id"]
+    response["approval_info"][0]["approved"] = True
+
+    resumed = agent.request({"continuation_id": continuation_id, "approval_info": response["approval_info"]})
+
+    assert resumed["end_reason"] == "completed"
+    assert executed == ["alice"]
+    with pytest.raises(ValueError):
+        store.get(continuation_id)
+    with pytest.raises(ValueError, match="no continuation store"):
+        ContinuationAgent(instruction="accounts", tools=[authorize_account]).request({"continuation_id": continuation_id})
+
+def test_concurrent_resumes_run_the_tools_once():
+    agent = _agent(MemoryContinuationStore())
+    resume = _approved(agent.request({"prompt": "go"}))
+    barrier = threading.Barrier(4)
+
+    def request():
+        barrier.wait()
+        try:
+            return agent.request(resume)["end_reason"]
+        except ValueError:
+            return "taken"
+
+    with ThreadPoolExecutor(4) as executor:
+        end_reasons = list(executor.map(lambda _: request(), range(4)))
+
+    assert sorted(end_reasons) == ["completed", "taken", "taken", "taken"]
+    assert executed == ["alice"]
+
+def test_failed_resume_puts_the_continuation_back():
+    store = MemoryContinuationStore()
+    failures = [RuntimeError("model down")]
+    def reply(messages, tools):
+        if messages[-1]["role"] == "tool" and failures:
+            raise failures.pop()
+        return reply_once([FakeBackend.tool_call("authorize_account", username="alice")])(messages, tools)
+    agent = ContinuationAgent(instruction="accounts", tools=[authorize_account], backend=FakeBackend(reply), store=store)
+    resume = _approved(agent.request({"prompt": "go"}))
+
+    with pytest.raises(RuntimeError):
+        agent.request(resume)
+
+    assert agent.request(resume)["end_reason"] == "completed"
+
+def test_sub_agent_returns_its_continuation_to_the_parent():
+    child = _agent(MemoryContinuationStore())
+    parent = ContinuationAgent(instruction="hr", tools=[child.as_tool(name="account_agent", description="Accounts")], backend=FakeBackend(reply_once([FakeBackend.tool_call("account_agent", prompt="open an account")])), store=MemoryContinuationStore())
+
+    response = parent.request({"prompt": "go"})
+
+    assert response["end_reason"] == "approval_required"
+    assert [len(item["path_ids"]) for item in response["approval_info"]] == [2]
+    assert parent.request(_approved(response))["end_reason"] == "completed"
+    assert executed == ["alice"]
+    assert child.store._entries == {}
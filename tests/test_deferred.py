@@ -0,0 +1,45 @@
+"""
+Tests of the deferred tool calls running in this process.
+"""
+from core import deferred
+from concurrent.futures import Future
+import pytest
+
+@pytest.fixture(autouse=True)
+def clear_running():
+    yield
+    for tool_call_id in list(deferred._running):
+        deferred.forget(tool_call_id)
+
+def _future(result=None, done=True):
+    future = Future()
+    if done:
+        future.set_result(result)
+    return future
+
+def test_finished_result_is_taken_once():
+    deferred.track("call_a", _future("ready"))
+
+    assert deferred.poll_result("call_a") == {"result": "ready"}
+    assert deferred.poll_result("call_a") is None
+
+def test_running_call_has_no_result_yet():
+    future = _future(done=False)
+    deferred.track("call_a", future)
+    assert deferred.poll_result("call_a") is None
+
+    future.set_result("ready")
+    assert deferred.poll_result("call_a") == {"result": "ready"}
+
+def test_expired_results_of_abandoned_calls_are_dropped(monkeypatch):
+    monkeypatch.setattr(deferred, "RESULT_TTL", 0)
+    running = _future(done=False)
+    deferred.track("call_abandoned", _future("never resumed"))
+    deferred.track("call_running", running)
+
+    deferred.track("call_new", _future("ready"))
+
+    assert set(deferred._running) == {"call_running", "call_new"}
+    running.set_result("ready")
+    deferred.track("call_next", _future(done=False))
+    assert set(deferred._running) == {"call_next"}
@@ -0,0 +1,82 @@
+"""
+Tests of the process pool running the tools decorated with `@tool(executor="process")`.
+"""
+from core.agent import Agent
+from core.model_backend import FakeBackend
+from core.process_pool import ToolProcessPool, ToolTimeoutError, ToolWorkerError, configure_process_pool, get_process_pool
+from core.tool import tool
+from conftest import reply_once
+import process_tools
+import pytest
+import os
+
+@pytest.fixture(autouse=True)
+def pool():
+    configure_process_pool(max_workers=2)
+    yield get_process_pool()
+    configure_process_pool()
+
+def test_tools_run_in_a_worker_process():
+    first = process_tools.worker_pid()
+
+    assert first != os.getpid()
+    assert process_tools.worker_pid() == first
+
+def test_tools_are_resolved_by_module_and_qualname():
+    assert process_tools.Parser.parse("resolve the nested tool") == ["resolve", "the", "nested", "tool"]
+
+def test_worker_is_replaced_after_a_timeout(pool):
+    stuck = process_tools.worker_pid()
+
+    with pytest.raises(ToolTimeoutError, match="sleep_for did not finish within 0.5 seconds"):
+        process_tools.sleep_for(5)
+
+    assert pool._workers == 0
+    assert process_tools.sleep_for(0.01) == "slept 0.01"
+    assert process_tools.worker_pid() != stuck
+
+def test_worker_death_fails_the_call_with_tool_worker_error(pool):
+    with pytest.raises(ToolWorkerError, match="exit_worker failed"):
+        process_tools.exit_worker(3)
+
+    assert pool._workers == 0
+    assert process_tools.Parser.parse("still works") == ["still", "works"]
+
+def test_tool_exceptions_are_raised_in_the_caller():
+    with pytest.raises(ValueError, match="bad input"):
+        process_tools.fail("bad input")
+
+def test_workers_are_recycled_after_max_tasks_per_child():
+    configure_process_pool(max_workers=1, max_tasks_per_child=2)
+
+    pids = [process_tools.worker_pid() for _ in range(4)]
+
+    assert pids[0] == pids[1] != pids[2] == pids[3]
+
+def test_agent_reports_timeouts_and_worker_deaths_to_the_model():
+    backend = FakeBackend(reply_once([FakeBackend.tool_call("sleep_for", seconds=5), FakeBackend.tool_call("exit_worker", code=1)]))
+    agent = Agent(instruction="hr", tools=[process_tools.sleep_for, process_tools.exit_worker], backend=backend, max_concurrency=2)
+
+    response = agent.request({"prompt": "go"})
+
+    contents = [message["content"] for message in response["messages"] if message["role"] == "tool"]
+    assert "did not finish within 0.5 seconds" in contents[0]
+    assert "its worker process exited during the call" in contents[1]
+    assert response["result"] == "done"
+
+def test_process_tools_must_be_defined_at_the_top_level():
+    with pytest.raises(ValueError, match="defined inside a function"):
+        @tool(executor="process")
+        def local_tool() -> str:
+            """A tool the workers cannot import."""
+            return "unreachable"
+
+def test_shutdown_stops_the_idle_workers():
+    pool = ToolProcessPool(max_workers=1)
+    pid = pool.call("process_tools", "worker_pid", (), {})
+
+    pool.shutdown(wait=True)
+
+    assert pool._workers == 0
+    assert pool.call("process_tools", "worker_pid", (), {}) != pid
+    pool.shutdown(wait=True)
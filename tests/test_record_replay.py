@@ -0,0 +1,90 @@
+"""
+Tests of the record and replay of model calls.
+"""
+from core.continuation_agent import ContinuationAgent
+from core.model_backend import FakeBackend
+from core.record_replay import RecordReplayBackend, ReplayMissError, make_replay_key
+from conftest import authorize_account, executed, reply_once
+import asyncio
+import pytest
+
+def _scenario(backend):
+    # A request paused for an approval, then resumed with the approval
+    agent = ContinuationAgent(instruction="hr", tools=[authorize_account], backend=backend)
+    paused = agent.request({"prompt": "authorize alice"})
+    paused["approval_info"][0]["approved"] = True
+    return paused, agent.request(paused)
+
+def _script():
+    return reply_once([FakeBackend.tool_call("authorize_account", username="alice", security_level=2)], answer="alice is authorized")
+
+def test_replay_answers_a_recorded_scenario_without_the_inner_backend(tmp_path):
+    path = str(tmp_path / "recordings.db")
+    inner = FakeBackend(_script())
+    recorder = RecordReplayBackend(inner, path=path, mode="record")
+    recorded = _scenario(recorder)
+    recorder.close()
+
+    replayer = RecordReplayBackend(path=path, mode="replay")
+    replayed = _scenario(replayer)
+
+    assert replayer.inner is None
+    assert inner.calls == 2
+    assert replayed == recorded
+    assert replayed[1]["result"] == "alice is authorized"
+    assert replayer.stats() == {"hits": 2, "misses": 0, "recordings": 2}
+    assert executed == ["alice", "alice"]
+
+def test_record_mode_answers_hits_from_the_recordings(tmp_path):
+    inner = FakeBackend(_script())
+    backend = RecordReplayBackend(inner, path=str(tmp_path / "recordings.db"), mode="record")
+    messages = [{"role": "user", "content": "authorize alice"}]
+
+    first = backend.complete(messages, [], "gpt-4o-mini")
+    second = backend.complete(messages, [], "gpt-4o-mini")
+
+    assert inner.calls == 1
+    assert second.message == first.message
+    assert backend.stats() == {"hits": 1, "misses": 1, "recordings": 1}
+
+def test_replay_miss_raises(tmp_path):
+    backend = RecordReplayBackend(path=str(tmp_path / "recordings.db"), mode="replay")
+
+    with pytest.raises(ReplayMissError, match="No recording of the model call"):
+        backend.complete([{"role": "user", "content": "never recorded"}], [], "gpt-4o-mini")
+    with pytest.raises(ReplayMissError):
+        asyncio.run(backend.acomplete([{"role": "user", "content": "never recorded"}], [], "gpt-4o-mini"))
+
+    assert backend.stats() == {"hits": 0, "misses": 2, "recordings": 0}
+
+def test_passthrough_neither_reads_nor_records(tmp_path):
+    inner = FakeBackend(["first", "second"])
+    backend = RecordReplayBackend(inner, path=str(tmp_path / "recordings.db"), mode="passthrough")
+    messages = [{"role": "user", "content": "hello"}]
+
+    assert backend.complete(messages, [], "gpt-4o-mini").message["content"] == "first"
+    assert backend.complete(messages, [], "gpt-4o-mini").message["content"] == "second"
+    assert backend.stats() == {"hits": 0, "misses": 0, "recordings": 0}
+
+def test_replayed_streams_report_their_tool_calls(tmp_path):
+    path = str(tmp_path / "recordings.db")
+    tool_call = FakeBackend.tool_call("authorize_account", username="alice")
+    messages = [{"role": "user", "content": "authorize alice"}]
+    RecordReplayBackend(FakeBackend([[tool_call]]), path=path).stream(messages, [], "gpt-4o-mini", lambda tool_call: None)
+    streamed = []
+
+    response = RecordReplayBackend(path=path, mode="replay").stream(messages, [], "gpt-4o-mini", streamed.append)
+
+    assert streamed == [tool_call]
+    assert response.message["tool_calls"] == [tool_call]
+
+def test_replay_key_ignores_null_fields_and_depends_on_the_call():
+    messages = [{"role": "assistant", "content": "hi", "refusal": None}]
+
+    assert make_replay_key(messages, [], "gpt-4o-mini") == make_replay_key([{"role": "assistant", "content": "hi"}], [], "gpt-4o-mini")
+    assert make_replay_key(messages, [], "gpt-4o-mini") != make_replay_key(messages, [], "gpt-4o")
+    assert make_replay_key(messages, [], "gpt-4o-mini") != make_replay_key(messages, [{"type": "function"}], "gpt-4o-mini")
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unknown mode"):
+        RecordReplayBackend(FakeBackend([]), path=str(tmp_path / "recordings.db"), mode="rewind")
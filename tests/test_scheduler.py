@@ -0,0 +1,111 @@
+"""
+Tests of the model call scheduler: token buckets, priorities and retries.
+"""
+from core.scheduler import ModelCallScheduler, _TokenBucket, _current_priority, PRIORITY_RESUME, estimate_tokens
+from types import SimpleNamespace
+import asyncio
+import pytest
+
+class ProviderError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after is not None else {})
+
+def _failing(errors, result="ok"):
+    # Raises the errors in order, then returns the result
+    errors = list(errors)
+    def func():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return func
+
+def _try_acquire(scheduler, ticket):
+    with scheduler._condition:
+        return scheduler._try_acquire(ticket)
+
+def test_bucket_refills_over_a_minute():
+    bucket = _TokenBucket(60)
+    bucket.level = 0
+
+    assert bucket.delay(1) == pytest.approx(1.0)
+    bucket.refill(bucket.updated + 30)
+    assert bucket.level == pytest.approx(30)
+    bucket.refill(bucket.updated + 600)
+    assert bucket.level == 60
+
+def test_call_larger_than_the_budget_waits_for_a_full_bucket():
+    bucket = _TokenBucket(60)
+    bucket.level = -30
+
+    assert bucket.delay(1000) == pytest.approx(90.0)
+
+def test_calls_wait_for_the_request_budget():
+    scheduler = ModelCallScheduler(requests_per_minute=60)
+    assert _try_acquire(scheduler, scheduler._enqueue(0)) is None
+
+    scheduler._requests.level = 0
+    delay = _try_acquire(scheduler, scheduler._enqueue(0))
+
+    assert delay == pytest.approx(1.0, abs=0.01)
+
+def test_usage_replaces_the_token_estimate():
+    scheduler = ModelCallScheduler(tokens_per_minute=1000)
+    messages = [{"role": "user", "content": "x" * 400}]
+    assert estimate_tokens(messages) > 100
+
+    scheduler.call(lambda: SimpleNamespace(usage={"total_tokens": 300}), messages)
+
+    assert scheduler._tokens.level == pytest.approx(700, abs=1)
+
+def test_resumed_calls_are_served_first():
+    scheduler = ModelCallScheduler()
+    fresh = scheduler._enqueue(0)
+    token = _current_priority.set(PRIORITY_RESUME)
+    try:
+        resumed = scheduler._enqueue(0)
+    finally:
+        _current_priority.reset(token)
+
+    assert _try_acquire(scheduler, fresh) is not None
+    assert _try_acquire(scheduler, resumed) is None
+    assert _try_acquire(scheduler, fresh) is None
+
+def test_rate_limits_and_server_errors_are_retried():
+    scheduler = ModelCallScheduler(base_delay=0)
+
+    assert scheduler.call(_failing([ProviderError(429), ProviderError(503)]), []) == "ok"
+    assert scheduler.stats()["retries"] == 2
+    assert scheduler.stats()["rate_limited"] == 1
+
+@pytest.mark.parametrize("options, error", [
+    ({}, ProviderError(400)),
+    ({"max_retries": 0}, ProviderError(429)),
+    ({"can_retry": lambda: False}, ProviderError(429)),
+])
+def test_calls_that_cannot_be_retried_raise(options, error):
+    can_retry = options.pop("can_retry", None)
+    scheduler = ModelCallScheduler(base_delay=0, **options)
+
+    with pytest.raises(ProviderError):
+        scheduler.call(_failing([error]), [], can_retry)
+    assert scheduler.stats()["retries"] == 0
+
+def test_retry_after_holds_back_every_call():
+    scheduler = ModelCallScheduler(base_delay=0)
+
+    delay = scheduler._retry_delay(ProviderError(429, retry_after="2"), 0, None)
+
+    assert delay == 2.0
+    assert _try_acquire(scheduler, scheduler._enqueue(0)) == pytest.approx(2.0, abs=0.1)
+
+def test_async_calls_are_retried():
+    scheduler = ModelCallScheduler(base_delay=0)
+    func = _failing([ProviderError(502)])
+
+    async def call():
+        return func()
+
+    assert asyncio.run(scheduler.acall(call, [])) == "ok"
+    assert scheduler.stats()["calls"] == 2
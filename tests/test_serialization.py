@@ -0,0 +1,70 @@
+"""
+Tests of the versioned binary envelope of the continuations.
+"""
+from core import serialization
+from core.continuation_agent import ContinuationAgent
+from core.model_backend import FakeBackend
+from conftest import authorize_account, executed, reply_once
+import io
+import pytest
+
+RESPONSE = {"continuation": {"messages": [{"role": "user", "content": "héllo " * 20000}], "processed": [{"id": "call_1", "approved": None}]}, "end_reason": "approval_required"}
+
+@pytest.mark.parametrize("codec", ["json", "msgpack"])
+@pytest.mark.parametrize("compression", ["none", "zlib", "zstd"])
+def test_round_trip_from_bytes_and_streams(codec, compression):
+    if codec == "msgpack":
+        pytest.importorskip("msgpack")
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    envelope = serialization.encode(RESPONSE, codec=codec, compression=compression)
+
+    assert envelope[:4] == serialization.MAGIC
+    assert envelope[4:7] == bytes([serialization.FORMAT_VERSION, serialization.CODECS[codec], serialization.COMPRESSIONS[compression]])
+    assert serialization.decode(envelope) == RESPONSE
+    assert serialization.decode(bytearray(envelope)) == RESPONSE
+    # Larger than one read chunk, so the stream is decoded in pieces
+    assert serialization.decode(io.BytesIO(envelope)) == RESPONSE
+
+def test_compression_shrinks_the_payload():
+    assert len(serialization.encode(RESPONSE, codec="json", compression="zlib")) < len(serialization.encode(RESPONSE, codec="json", compression="none")) / 10
+
+def test_defaults_fall_back_to_the_standard_library():
+    envelope = serialization.encode(RESPONSE)
+
+    assert serialization.decode(envelope) == RESPONSE
+    assert serialization.default_codec() in serialization.CODECS
+    assert serialization.default_compression() in serialization.COMPRESSIONS
+
+@pytest.mark.parametrize("data, message", [
+    (b"ACN", "Truncated"),
+    (b"JSON\x01\x01\x00{}", "Not a continuation envelope"),
+    (serialization.MAGIC + b"\x02\x01\x00{}", "Unsupported continuation format version 2"),
+    (serialization.MAGIC + b"\x01\x09\x00{}", "Unknown codec id 9"),
+    (serialization.MAGIC + b"\x01\x01\x09{}", "Unknown compression id 9"),
+])
+def test_invalid_envelopes_are_rejected(data, message):
+    with pytest.raises(ValueError, match=message):
+        serialization.decode(data)
+
+def test_unknown_codec_or_compression_cannot_be_encoded():
+    with pytest.raises(ValueError):
+        serialization.encode(RESPONSE, codec="pickle")
+    with pytest.raises(ValueError):
+        serialization.encode(RESPONSE, compression="lzma")
+
+def test_is_envelope():
+    assert serialization.is_envelope(serialization.encode(RESPONSE))
+    assert serialization.is_envelope(io.BytesIO())
+    assert not serialization.is_envelope(b"{}")
+    assert not serialization.is_envelope({"continuation": {}})
+
+def test_agent_resumes_from_an_envelope():
+    agent = ContinuationAgent(instruction="accounts", tools=[authorize_account], backend=FakeBackend(reply_once([FakeBackend.tool_call("authorize_account", username="alice")])))
+    response = agent.request({"prompt": "go"})
+    response["approval_info"][0]["approved"] = True
+
+    resumed = agent.request(ContinuationAgent.dumps(response))
+
+    assert resumed["end_reason"] == "completed"
+    assert executed == ["alice"]
@@ -0,0 +1,169 @@
+"""
+Tests of the HTTP server exposing named agents.
+"""
+from core.async_agent import AsyncAgent
+from core.continuation_agent import ContinuationAgent
+from core.continuation_store import MemoryContinuationStore
+from core.model_backend import FakeBackend
+from core.server import AgentServer
+from core.tool import tool
+from conftest import authorize_account, executed, reply_once
+import http.client
+import threading
+import asyncio
+import json
+import pytest
+
+@tool()
+async def current_loop() -> int:
+    """Return the id of the event loop running the tool."""
+    return id(asyncio.get_running_loop())
+
+class FailingAgent:
+    """An agent whose request fails inside the agent, like a buggy tool."""
+    def request(self, input):
+        raise ValueError("tool bug")
+
+def _hr_agent(**kwargs):
+    backend = FakeBackend(reply_once([FakeBackend.tool_call("authorize_account", username="alice", security_level=2)], answer="alice is authorized"))
+    return ContinuationAgent(instruction="hr", tools=[authorize_account], backend=backend, **kwargs)
+
+@pytest.fixture
+def server():
+    agents = {
+        "hr_agent": _hr_agent(),
+        "stored_agent": _hr_agent(store=MemoryContinuationStore()),
+        "async_agent": AsyncAgent(instruction="loop", tools=[current_loop], backend=FakeBackend(reply_once(lambda tools: [FakeBackend.tool_call("current_loop")]))),
+        "failing_agent": FailingAgent(),
+    }
+    server = AgentServer(agents, address="127.0.0.1:0", workers=2, drain_timeout=5)
+    server.start()
+    yield server
+    server.shutdown()
+
+def _post(server, path, body, content_type="application/json"):
+    host, port = server.address.rsplit(":", 1)
+    connection = http.client.HTTPConnection(host, int(port), timeout=10)
+    try:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        connection.request("POST", path, data, {"Content-Type": content_type})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def _get(server, path):
+    host, port = server.address.rsplit(":", 1)
+    connection = http.client.HTTPConnection(host, int(port), timeout=10)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def test_request_and_resume(server):
+    status, paused = _post(server, "/agents/hr_agent/request", {"prompt": "authorize alice"})
+    assert status == 200 and executed == []
+
+    paused["approval_info"][0]["approved"] = True
+    status, resumed = _post(server, "/agents/hr_agent/resume", paused)
+
+    assert status == 200
+    assert resumed["result"] == "alice is authorized"
+    assert executed == ["alice"]
+
+def test_resume_by_continuation_id_runs_once(server):
+    _, paused = _post(server, "/agents/stored_agent/request", {"prompt": "authorize alice"})
+    paused["approval_info"][0]["approved"] = True
+
+    first = _post(server, "/agents/stored_agent/resume", paused)
+    second = _post(server, "/agents/stored_agent/resume", paused)
+
+    assert first[0] == 200 and first[1]["result"] == "alice is authorized"
+    assert second[0] == 404 and "Unknown or expired continuation" in second[1]["error"]
+    assert executed == ["alice"]
+
+def test_resume_from_a_binary_envelope(server):
+    _, paused = _post(server, "/agents/hr_agent/request", {"prompt": "authorize alice"})
+    paused["approval_info"][0]["approved"] = True
+
+    status, resumed = _post(server, "/agents/hr_agent/resume", ContinuationAgent.dumps(paused), "application/octet-stream")
+
+    assert status == 200 and resumed["result"] == "alice is authorized"
+
+@pytest.mark.parametrize("path, body, content_type, error", [
+    ("/agents/hr_agent/request", {"continuation": {}}, "application/json", "needs a prompt"),
+    ("/agents/hr_agent/resume", {"prompt": "hi"}, "application/json", "needs a continuation"),
+    ("/agents/hr_agent/resume", {"continuation": {"messages": []}, "approval_info": [{"approved": True}]}, "application/json", "path_ids"),
+    ("/agents/hr_agent/resume", {"continuation": "text"}, "application/json", "must be an object"),
+    ("/agents/hr_agent/resume", {"continuation_id": "0" * 32}, "application/json", "no continuation store"),
+    ("/agents/hr_agent/request", b"\x00binary", "application/octet-stream", "can only be resumed"),
+    ("/agents/hr_agent/resume", b"not an envelope", "application/octet-stream", "not a continuation envelope"),
+    ("/agents/hr_agent/request", b"{not json", "application/json", "Invalid JSON"),
+    ("/agents/hr_agent/request", [1, 2], "application/json", "JSON object"),
+])
+def test_malformed_requests_are_answered_400_before_the_agent_runs(server, path, body, content_type, error):
+    status, reply = _post(server, path, body, content_type)
+
+    assert status == 400
+    assert error in reply["error"]
+    assert server.served == 0
+
+def test_unknown_agents_and_paths_are_answered_404(server):
+    assert _post(server, "/agents/missing/request", {"prompt": "hi"})[0] == 404
+    assert _post(server, "/agents/hr_agent/delete", {})[0] == 404
+    assert _get(server, "/nowhere")[0] == 404
+
+def test_errors_raised_by_the_agent_are_answered_500(server):
+    status, reply = _post(server, "/agents/failing_agent/request", {"prompt": "hi"})
+
+    assert status == 500
+    assert reply["error"] == "ValueError: tool bug"
+
+def test_async_agents_share_one_event_loop(server):
+    loops = set()
+    for _ in range(3):
+        status, response = _post(server, "/agents/async_agent/request", {"prompt": "which loop"})
+        assert status == 200
+        loops.add(next(message["content"] for message in response["messages"] if message["role"] == "tool"))
+
+    assert len(loops) == 1
+
+def test_health_and_agents(server):
+    _post(server, "/agents/hr_agent/request", {"prompt": "authorize alice"})
+
+    assert _get(server, "/health") == (200, {"status": "ok", "active": 0, "workers": 2, "served": 1})
+    assert _get(server, "/agents") == (200, {"agents": ["async_agent", "failing_agent", "hr_agent", "stored_agent"]})
+
+def test_draining_answers_503_and_waits_for_running_requests():
+    started, release = threading.Event(), threading.Event()
+
+    @tool()
+    def slow_lookup() -> str:
+        """Wait until the test releases the call."""
+        started.set()
+        release.wait(5)
+        return "looked up"
+
+    agent = ContinuationAgent(instruction="slow", tools=[slow_lookup], backend=FakeBackend(reply_once([FakeBackend.tool_call("slow_lookup")])))
+    server = AgentServer({"slow_agent": agent}, address="127.0.0.1:0", drain_timeout=5)
+    server.start()
+    running = {}
+    request = threading.Thread(target=lambda: running.update(reply=server.handle("slow_agent", "request", {"prompt": "go"})))
+    request.start()
+    started.wait(5)
+    drained = {}
+    stopping = threading.Thread(target=lambda: drained.update(result=server.shutdown()))
+    stopping.start()
+    while not server.draining:
+        pass
+
+    assert server.handle("slow_agent", "request", {"prompt": "go"}) == (503, {"error": "The server is shutting down"})
+    assert server.health()["status"] == "draining"
+
+    release.set()
+    request.join(5)
+    stopping.join(5)
+    assert running["reply"][0] == 200 and running["reply"][1]["result"] == "done"
+    assert drained["result"] is True
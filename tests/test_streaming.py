@@ -0,0 +1,83 @@
+"""
+Tests of the streaming agents, which start tool calls while the model response is still streaming.
+"""
+from core.agent import Agent
+from core.async_agent import AsyncAgent
+from core.continuation_agent import ContinuationAgent
+from core.model_backend import FakeBackend
+from core.tool import tool
+from conftest import authorize_account, executed, reply_once
+import asyncio
+import pytest
+
+# The usernames of the lookup_account calls that ran, in order
+looked_up = []
+
+@tool()
+def lookup_account(username: str) -> str:
+    """Look up the account of a user."""
+    looked_up.append(username)
+    return f"Account of {username}."
+
+@pytest.fixture(autouse=True)
+def clear_looked_up():
+    looked_up.clear()
+
+class FailingStreamBackend(FakeBackend):
+    """Streams every tool call of the reply, then fails before the response is complete."""
+    def stream(self, messages, tools, model, on_tool_call):
+        response = self._next_reply(messages, tools)
+        for tool_call in response.message.get("tool_calls") or []:
+            on_tool_call(dict(tool_call, function=dict(tool_call["function"])))
+        raise ConnectionError("stream interrupted")
+
+def _calls():
+    return [
+        FakeBackend.tool_call("lookup_account", username="alice"),
+        FakeBackend.tool_call("authorize_account", username="bob", security_level=2),
+        FakeBackend.tool_call("lookup_account", username="carol"),
+    ]
+
+def test_streaming_and_non_streaming_produce_the_same_messages():
+    tool_calls = _calls()
+    responses = [
+        Agent(instruction="hr", tools=[lookup_account, authorize_account], backend=FakeBackend(reply_once(tool_calls)), stream=stream, max_concurrency=2).request({"prompt": "go"})
+        for stream in (False, True)
+    ]
+
+    assert responses[0]["messages"] == responses[1]["messages"]
+    assert responses[1]["result"] == "done"
+
+def test_async_streaming_and_non_streaming_produce_the_same_messages():
+    tool_calls = _calls()
+    async def main():
+        return [
+            await AsyncAgent(instruction="hr", tools=[lookup_account, authorize_account], backend=FakeBackend(reply_once(tool_calls)), stream=stream).request({"prompt": "go"})
+            for stream in (False, True)
+        ]
+
+    responses = asyncio.run(main())
+
+    assert responses[0]["messages"] == responses[1]["messages"]
+
+def test_streaming_continuation_agent_pauses_like_the_non_streaming_one():
+    tool_calls = _calls()
+    responses = [
+        ContinuationAgent(instruction="hr", tools=[lookup_account, authorize_account], backend=FakeBackend(reply_once(tool_calls)), stream=stream).request({"prompt": "go"})
+        for stream in (False, True)
+    ]
+
+    assert responses[0]["continuation"] == responses[1]["continuation"]
+    assert responses[0]["approval_info"] == responses[1]["approval_info"]
+    assert looked_up == ["alice", "carol", "alice", "carol"]
+    assert executed == []
+
+def test_tools_with_need_approval_do_not_start_before_the_stream_completes():
+    agent = Agent(instruction="hr", tools=[lookup_account, authorize_account], backend=FailingStreamBackend(reply_once(_calls())), stream=True, max_concurrency=2)
+
+    with pytest.raises(RuntimeError, match="stream interrupted"):
+        agent.request({"prompt": "go"})
+    agent._get_executor().shutdown(wait=True)
+
+    assert executed == []
+    assert agent._early_results == {}
@@ -0,0 +1,36 @@
+"""
+Tests of the suspension functions and the budgets they record.
+"""
+from core.suspend_function import accepts_context, deadline, token_budget, max_turns
+from core.request_context import RequestContext
+import weakref
+import gc
+
+def test_context_is_passed_to_functions_with_a_positional_parameter():
+    def no_arguments():
+        return False
+    def with_context(context):
+        return False
+
+    assert not accepts_context(no_arguments)
+    assert accepts_context(with_context)
+
+def test_built_in_suspenders_are_not_kept_alive():
+    suspenders = [deadline(30), token_budget(100), max_turns(3)]
+    assert all(accepts_context(suspend) for suspend in suspenders)
+    references = [weakref.ref(suspend) for suspend in suspenders]
+
+    del suspenders
+    gc.collect()
+
+    assert all(reference() is None for reference in references)
+
+def test_budgets_are_recorded_when_they_fire():
+    context = RequestContext()
+    context.turns = 3
+    context.prompt_tokens = 60
+
+    assert max_turns(3)(context)
+    assert not token_budget(100)(context)
+    assert not deadline(30)(context)
+    assert context.budgets["max_turns"]["limit"] == 3
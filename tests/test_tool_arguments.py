@@ -0,0 +1,107 @@
+"""
+Tests of the validation and coercion of the tool call arguments chosen by the model.
+"""
+from core.agent import Agent
+from core.continuation_agent import ContinuationAgent
+from core.async_continuation_agent import AsyncContinuationAgent
+from core.model_backend import FakeBackend
+from core.tool_arguments import ToolArgumentError, annotation_to_schema
+from core.tool import tool
+from typing import List, Optional, Literal, Tuple, TypedDict
+from dataclasses import dataclass
+import asyncio
+import enum
+import pytest
+
+class Level(enum.Enum):
+    LOW = 0
+    HIGH = 3
+
+@dataclass
+class Address:
+    city: str
+    zip_code: Optional[str] = None
+
+class Contact(TypedDict):
+    email: str
+
+@tool()
+def register(name: str, age: int, level: Level, tags: List[str], address: Address, contact: Contact, mode: Literal["fast", "safe"] = "safe", score: Optional[float] = None, pair: Tuple[int, str] = (0, "")):
+    """Register a person."""
+    return name
+
+def _validate(arguments):
+    return register._tool.validate_arguments(arguments)
+
+_VALID = {"name": "alice", "age": 30, "level": 3, "tags": ["a"], "address": {"city": "Paris"}, "contact": {"email": "a@b.c"}}
+
+def test_arguments_are_converted_to_the_annotations():
+    arguments = _validate({**_VALID, "age": "30", "level": "LOW", "score": 1, "pair": [1, "x"]})
+
+    assert arguments["age"] == 30
+    assert arguments["level"] is Level.LOW
+    assert arguments["address"] == Address("Paris")
+    assert arguments["contact"] == {"email": "a@b.c"}
+    assert arguments["score"] == 1.0 and isinstance(arguments["score"], float)
+    assert arguments["pair"] == (1, "x")
+
+def test_json_string_arguments_are_parsed():
+    assert _validate('{"name": "alice", "age": 30, "level": 0, "tags": [], "address": {"city": "Paris"}, "contact": {"email": "e"}}')["level"] is Level.LOW
+
+@pytest.mark.parametrize("arguments, message", [
+    ({**_VALID, "age": "thirty"}, "'age' expected an integer"),
+    ({**_VALID, "age": True}, "'age' expected an integer"),
+    ({**_VALID, "level": 2}, "'level' expected one of [0, 3]"),
+    ({**_VALID, "tags": ["a", {}]}, "'tags[1]' expected a string"),
+    ({**_VALID, "address": {"town": "Paris"}}, "'address' is missing 'city'"),
+    ({**_VALID, "mode": "slow"}, "'mode' expected one of"),
+    ({**_VALID, "pair": [1]}, "'pair' expected an array of 2 items"),
+    ({**_VALID, "extra": 1}, "unexpected argument 'extra'"),
+    ({"name": "alice"}, "missing required argument 'age'"),
+    ("[1, 2]", "expected a JSON object"),
+    ("{", "not valid JSON"),
+])
+def test_invalid_arguments_are_described(arguments, message):
+    with pytest.raises(ToolArgumentError) as error:
+        _validate(arguments)
+
+    assert str(error.value).startswith("Invalid arguments for tool register: ")
+    assert message in str(error.value)
+
+def test_every_invalid_argument_is_reported():
+    with pytest.raises(ToolArgumentError) as error:
+        _validate({**_VALID, "age": "x", "tags": "a"})
+
+    assert "'age'" in str(error.value) and "'tags'" in str(error.value)
+
+def test_schema_of_the_annotations():
+    assert annotation_to_schema(Optional[int]) == {"anyOf": [{"type": "integer"}, {"type": "null"}]}
+    assert annotation_to_schema(Level) == {"enum": [0, 3], "type": "integer"}
+    assert annotation_to_schema(Address) == {"type": "object", "properties": {"city": {"type": "string"}, "zip_code": {"anyOf": [{"type": "string"}, {"type": "null"}]}}, "required": ["city"]}
+    assert register._tool.required == ["name", "age", "level", "tags", "address", "contact"]
+
+def _sub_agent_call(arguments):
+    call = FakeBackend.tool_call("helper_agent")
+    call["function"]["arguments"] = arguments
+    return call
+
+def _parent(cls, arguments):
+    sub_agent = Agent(instruction="helper", tools=[], backend=FakeBackend(lambda messages, tools: "helped"))
+    def reply(messages, tools):
+        return messages[-1]["content"] if messages[-1]["role"] == "tool" else [_sub_agent_call(arguments)]
+    return cls(instruction="parent", tools=[sub_agent.as_tool(name="helper_agent", description="Helps")], backend=FakeBackend(reply))
+
+@pytest.mark.parametrize("cls", [Agent, ContinuationAgent])
+@pytest.mark.parametrize("arguments", ['{"prompt": ', '["help"]', '{"prompt": {"text": "help"}}'])
+def test_invalid_agent_tool_arguments_are_returned_to_the_model(cls, arguments):
+    response = _parent(cls, arguments).request({"prompt": "go"})
+
+    assert response["result"].startswith("Invalid arguments for tool helper_agent")
+
+def test_invalid_agent_tool_arguments_of_async_agents():
+    response = asyncio.run(_parent(AsyncContinuationAgent, '{"prompt": ').request({"prompt": "go"}))
+
+    assert response["result"].startswith("Invalid arguments for tool helper_agent: not valid JSON")
+
+def test_valid_agent_tool_arguments_reach_the_sub_agent():
+    assert _parent(ContinuationAgent, '{"prompt": "help"}').request({"prompt": "go"})["result"] == "helped"
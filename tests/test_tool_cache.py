@@ -0,0 +1,89 @@
+"""
+Tests of the memoization of tool results.
+"""
+from core.tool_cache import make_cache_key, LRUCache, DiskCache
+from core.agent import Agent
+from core.model_backend import FakeBackend
+from core.tool import tool
+from conftest import reply_once
+import time
+import pytest
+
+calls = []
+
+@tool(cache=True)
+def lookup_salary(username: str, year: int) -> str:
+    """Look up the salary of a user for a year."""
+    calls.append((username, year))
+    return f"{username} earned 100 in {year}"
+
+@pytest.fixture(autouse=True)
+def clear_calls(monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(lookup_salary._tool, "cache", LRUCache())
+
+@pytest.fixture(params=["lru", "disk"])
+def make_cache(request, tmp_path):
+    def make(**options):
+        if request.param == "lru":
+            return LRUCache(**options)
+        return DiskCache(str(tmp_path / "cache.db"), **options)
+    return make
+
+def test_key_is_canonical():
+    assert make_cache_key("t", {"a": 1, "b": [1, 2]}) == make_cache_key("t", {"b": [1, 2], "a": 1})
+    assert make_cache_key("t", {"a": 1}) != make_cache_key("u", {"a": 1})
+    assert make_cache_key("t", {"a": 1}) != make_cache_key("t", {"a": "1"})
+    assert make_cache_key("t", {"when": time}) == make_cache_key("t", {"when": time})
+
+def test_hits_and_misses_are_counted(make_cache):
+    cache = make_cache()
+    assert cache.get("k") == (False, None)
+
+    cache.set("k", {"result": [1, 2]})
+
+    assert cache.get("k") == (True, {"result": [1, 2]})
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    cache.clear()
+    assert cache.get("k") == (False, None)
+
+def test_expired_results_are_misses(make_cache):
+    cache = make_cache(ttl=0.05)
+    cache.set("k", "v")
+    assert cache.get("k") == (True, "v")
+
+    time.sleep(0.1)
+
+    assert cache.get("k") == (False, None)
+
+def test_lru_keeps_the_most_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    cache.set("c", 3)
+
+    assert [cache.get(key)[0] for key in ("a", "b", "c")] == [True, False, True]
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=0)
+
+def test_agent_reuses_results_of_equivalent_calls():
+    tool_calls = [FakeBackend.tool_call("lookup_salary", username="alice", year=2024), FakeBackend.tool_call("lookup_salary", year="2024", username="alice")]
+    agent = Agent(instruction="hr", tools=[lookup_salary], backend=FakeBackend(reply_once(tool_calls)))
+
+    agent.request({"prompt": "go"})
+
+    assert calls == [("alice", 2024)]
+    assert lookup_salary._tool.cache.stats() == {"hits": 1, "misses": 1}
+
+def test_invalid_cache_options_are_rejected():
+    def func(x: int):
+        """A tool."""
+    with pytest.raises(ValueError, match="needs approval"):
+        tool(cache=True, need_approval=True)(func)
+    with pytest.raises(ValueError, match="agent"):
+        tool(cache=True, is_agent=True)(func)
+    with pytest.raises(ValueError, match="Unsupported cache option"):
+        tool(cache="yes")(func)
+    assert tool(cache=5, need_approval=True, force_cache=True)(func)._tool.cache.maxsize == 5
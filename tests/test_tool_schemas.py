@@ -0,0 +1,31 @@
+"""
+Tests of the tool payload shared by the agents using the same tools.
+"""
+from core.tool import tool, get_tool_schemas
+import sys
+
+# `core.tool` the attribute is the decorator, the module is taken from sys.modules
+tool_module = sys.modules["core.tool"]
+
+def _make_tool(index):
+    @tool()
+    def lookup(key: str) -> str:
+        """Look up a key."""
+        return key
+    lookup._tool.name = f"lookup_{index}"
+    return lookup
+
+def test_tool_sets_share_one_payload():
+    tools = [_make_tool(0), _make_tool(1)]
+
+    assert get_tool_schemas(tools) is get_tool_schemas(list(tools))
+
+def test_cache_is_bounded_and_evicted_payloads_are_stale(monkeypatch):
+    monkeypatch.setattr(tool_module, "_TOOL_SCHEMA_CACHE_SIZE", 4)
+    first = get_tool_schemas([_make_tool(0)])
+
+    for index in range(10):
+        get_tool_schemas([_make_tool(index)])
+
+    assert len(tool_module._tool_schema_cache) <= 4
+    assert first.stale
@@ -0,0 +1,157 @@
+"""
+Tests of the spans around the agent loop and of their processors.
+"""
+from core.agent import Agent
+from core.async_agent import AsyncAgent
+from core.model_backend import FakeBackend
+from core.tool import tool
+from core.tracing import JSONLExporter, Span, SpanProcessor, TraceCollector, add_processor, current_span, remove_processor, span, traced
+from conftest import reply_once
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import asyncio
+import json
+import pytest
+
+class Recorder(SpanProcessor):
+    """Keeps the finished spans."""
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+    def named(self, name):
+        return [span for span in self.spans if span.name == name]
+
+@pytest.fixture
+def recorder():
+    recorder = Recorder()
+    add_processor(recorder)
+    yield recorder
+    remove_processor(recorder)
+
+@tool()
+def lookup_account(username: str) -> str:
+    """Look up the account of a user."""
+    return f"Account of {username}."
+
+def test_spans_are_only_created_while_enabled():
+    with span("disabled") as current:
+        assert current is None
+        assert current_span() is None
+
+def test_spans_nest_and_record_errors(recorder):
+    with pytest.raises(KeyError):
+        with span("outer", kind="test") as outer:
+            with span("inner") as inner:
+                assert current_span() is inner
+            raise KeyError("missing")
+
+    assert current_span() is None
+    assert inner.parent_id == outer.span_id and inner.trace_id == outer.trace_id
+    assert outer.parent_id is None
+    assert outer.error == "KeyError: 'missing'" and inner.error is None
+    assert outer.attributes == {"kind": "test"}
+    assert outer.duration >= inner.duration
+    assert recorder.spans == [inner, outer]
+
+def test_spans_nest_across_threads_with_a_copied_context(recorder):
+    @traced("work", lambda index: {"index": index})
+    def work(index):
+        return current_span()
+
+    with span("root") as root, ThreadPoolExecutor(max_workers=4) as executor:
+        # The context is copied by the submitting thread, as the agents do for their tool calls
+        children = [future.result() for future in [executor.submit(copy_context().run, work, index) for index in range(4)]]
+        unrelated = executor.submit(work, 4).result()
+
+    assert {child.parent_id for child in children} == {root.span_id}
+    assert sorted(child.attributes["index"] for child in children) == [0, 1, 2, 3]
+    assert unrelated.parent_id is None and unrelated.trace_id != root.trace_id
+
+def test_sub_agent_spans_are_children_of_the_tool_call(recorder):
+    sub_agent = Agent(instruction="accounts", tools=[lookup_account], backend=FakeBackend(reply_once([FakeBackend.tool_call("lookup_account", username="alice")], answer="found")))
+    backend = FakeBackend(reply_once([FakeBackend.tool_call("accounts", prompt="alice"), FakeBackend.tool_call("lookup_account", username="bob")]))
+    agent = Agent(instruction="hr", tools=[sub_agent.as_tool("accounts", "Manage accounts."), lookup_account], backend=backend, max_concurrency=2)
+
+    agent.request({"prompt": "go"})
+
+    root, = [span for span in recorder.named("agent.request") if span.parent_id is None]
+    by_id = {span.span_id: span for span in recorder.spans}
+    assert {span.trace_id for span in recorder.spans} == {root.trace_id}
+    sub_request, = [span for span in recorder.named("agent.request") if span is not root]
+    assert by_id[sub_request.parent_id].name == "tool.call"
+    assert by_id[sub_request.parent_id].attributes["tool"] == "accounts"
+    assert by_id[by_id[sub_request.parent_id].parent_id] is root
+    assert sorted(span.attributes["tool"] for span in recorder.named("tool.call")) == ["accounts", "lookup_account", "lookup_account"]
+    assert len(recorder.named("model.call")) == 4
+
+def test_async_sub_agent_spans_are_children_of_the_tool_call(recorder):
+    sub_agent = AsyncAgent(instruction="accounts", tools=[lookup_account], backend=FakeBackend("found"))
+    agent = AsyncAgent(instruction="hr", tools=[sub_agent.as_tool("accounts", "Manage accounts.")], backend=FakeBackend(reply_once([FakeBackend.tool_call("accounts", prompt="alice")])))
+
+    asyncio.run(agent.request({"prompt": "go"}))
+
+    by_id = {span.span_id: span for span in recorder.spans}
+    sub_request, = [span for span in recorder.named("agent.request") if span.parent_id is not None]
+    assert by_id[sub_request.parent_id].name == "tool.call"
+    assert by_id[by_id[sub_request.parent_id].parent_id].name == "agent.request"
+
+def test_trace_summary_covers_the_sub_agents():
+    sub_agent = Agent(instruction="accounts", tools=[], backend=FakeBackend("found"), trace=True)
+    agent = Agent(instruction="hr", tools=[sub_agent.as_tool("accounts", "Manage accounts.")], backend=FakeBackend(reply_once([FakeBackend.tool_call("accounts", prompt="alice")])), trace=True)
+
+    response = agent.request({"prompt": "go"})
+
+    trace = response["trace"]
+    assert trace["spans"]["agent.request"]["count"] == 2
+    assert trace["spans"]["model.call"]["count"] == 3
+    assert trace["spans"]["tool.call"]["count"] == 1 and trace["spans"]["tool.call"]["errors"] == 0
+    assert trace["prompt_tokens"] > 0
+    assert trace["duration"] > 0
+
+def test_trace_collector_summary():
+    collector = TraceCollector()
+    root = Span("agent.request", None, {})
+    model = Span("model.call", root, {"prompt_tokens": 10, "completion_tokens": 3})
+    failed = Span("model.call", root, {"prompt_tokens": 5})
+    for current, duration in ((model, 0.5), (failed, 0.25), (root, 1.0)):
+        current.duration = duration
+    failed.error = "RuntimeError: down"
+    for current in (model, failed, root):
+        collector.on_end(current)
+
+    summary = collector.summary(root)
+
+    assert summary == {
+        "trace_id": root.trace_id,
+        "duration": 1.0,
+        "prompt_tokens": 15,
+        "completion_tokens": 3,
+        "spans": {
+            "model.call": {"count": 2, "duration": 0.75, "errors": 1},
+            "agent.request": {"count": 1, "duration": 1.0, "errors": 0},
+        }
+    }
+
+def test_jsonl_exporter_writes_one_valid_span_per_line(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = JSONLExporter(str(path))
+    add_processor(exporter)
+    try:
+        agent = Agent(instruction="hr", tools=[lookup_account], backend=FakeBackend(reply_once([FakeBackend.tool_call("lookup_account", username="alice")])), max_concurrency=2)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(executor.map(lambda index: agent.request({"prompt": str(index)}), range(3)))
+    finally:
+        remove_processor(exporter)
+        exporter.close()
+
+    lines = path.read_text().splitlines()
+    spans = [json.loads(line) for line in lines]
+    assert len(spans) == 3 * 4
+    assert {span["name"] for span in spans} == {"agent.request", "model.call", "tool.call"}
+    assert len({span["trace_id"] for span in spans}) == 3
+    ids = {span["span_id"] for span in spans}
+    assert all(span["parent_id"] in ids for span in spans if span["name"] != "agent.request")
+    assert all(span["duration"] is not None for span in spans)